@@ -0,0 +1,182 @@
+"""
+Headless HTTP API for the question answering engine (engine.py), without Streamlit.
+
+Endpoints:
+    GET  /health     {"status": "ok", "databases": [...]}
+    POST /ask        {"question": "...", "database": optional name, "history": optional
+                      [{"role", "content"}], "max_rows": optional int, "fresh": optional bool,
+                      "summarize": optional bool (default true)}
+                     -> the answer dict of QueryEngine.ask()
+
+Usage:
+    python api.py [--host 127.0.0.1] [--port 8600]
+
+Requests are served on threads; the AI and database I/O of all of them runs on
+the pipeline's shared event loop. Set QUERY_API_KEY to require an X-API-Key header.
+"""
+import argparse
+import hmac
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import config
+from db_registry import list_targets
+from engine import DEFAULT_MAX_ROWS, get_engine
+from pipeline import run_sync
+
+# Questions answered at the same time; more are refused with 503 instead of queueing
+MAX_CONCURRENT_REQUESTS = 8
+# Largest request body accepted
+MAX_BODY_BYTES = 64 * 1024
+# Most rows one answer may return
+MAX_ROWS_LIMIT = 50000
+
+_request_slots = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+
+
+def parse_ask_request(payload):
+    """
+    Validate the body of POST /ask.
+
+    Args:
+        payload: Decoded JSON body
+
+    Returns:
+        tuple: (keyword arguments for handle_ask, error message or None)
+    """
+    if not isinstance(payload, dict):
+        return None, "Body must be a JSON object"
+    question = payload.get("question")
+    if not isinstance(question, str) or not question.strip():
+        return None, '"question" must be a non-empty string'
+    history = payload.get("history") or []
+    if not isinstance(history, list) or not all(
+        isinstance(message, dict) and message.get("role") in ("user", "assistant")
+        and isinstance(message.get("content"), str)
+        for message in history
+    ):
+        return None, '"history" must be a list of {"role": "user"|"assistant", "content": "..."}'
+    max_rows = payload.get("max_rows", DEFAULT_MAX_ROWS)
+    if not isinstance(max_rows, int) or isinstance(max_rows, bool) or not 0 < max_rows <= MAX_ROWS_LIMIT:
+        return None, f'"max_rows" must be an integer from 1 to {MAX_ROWS_LIMIT}'
+    database = payload.get("database")
+    if database is not None and not isinstance(database, str):
+        return None, '"database" must be a string'
+    return {
+        "question": question.strip(),
+        "database": database,
+        "history": history,
+        "max_rows": max_rows,
+        "fresh": bool(payload.get("fresh", False)),
+        "summarize": bool(payload.get("summarize", True)),
+    }, None
+
+
+def handle_ask(question, database=None, history=None, max_rows=DEFAULT_MAX_ROWS, fresh=False, summarize=True):
+    """
+    Answer one question (blocks the calling thread).
+
+    Returns:
+        tuple: (HTTP status, response dict)
+    """
+    engine = get_engine(database)
+    if engine is None:
+        return 404, {"error": f"Unknown database: {database}"}
+    answer = run_sync(engine.ask(question, history, max_rows, fresh, summarize))
+    return 200, answer
+
+
+class QueryAPIHandler(BaseHTTPRequestHandler):
+    """Routes requests to the engine and replies with JSON"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if not self.authorized():
+            return
+        if urlparse(self.path).path == "/health":
+            self.send_json(200, {"status": "ok", "databases": list_targets()})
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if not self.authorized():
+            return
+        if urlparse(self.path).path != "/ask":
+            self.send_json(404, {"error": "Not found"})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self.send_json(413, {"error": "Request body too large"})
+            return
+        try:
+            payload = json.loads(self.rfile.read(length) or b"null")
+        except ValueError:
+            self.send_json(400, {"error": "Body must be valid JSON"})
+            return
+        arguments, error = parse_ask_request(payload)
+        if error:
+            self.send_json(400, {"error": error})
+            return
+
+        if not _request_slots.acquire(blocking=False):
+            self.send_json(503, {"error": "Too many questions in progress, try again shortly"})
+            return
+        try:
+            status, response = handle_ask(**arguments)
+        except Exception as e:
+            status, response = 500, {"error": f"Unexpected error: {str(e)}"}
+        finally:
+            _request_slots.release()
+        self.send_json(status, response)
+
+    def authorized(self):
+        """Check the API key (if one is configured); replies 401 when it doesn't match"""
+        if not config.QUERY_API_KEY:
+            return True
+        if hmac.compare_digest(self.headers.get("X-API-Key", ""), config.QUERY_API_KEY):
+            return True
+        self.send_json(401, {"error": "Missing or invalid X-API-Key"})
+        return False
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def create_server(host=None, port=None):
+    """Create the API server (call serve_forever() to run it)"""
+    server = ThreadingHTTPServer((host or config.QUERY_API_HOST, port or config.QUERY_API_PORT), QueryAPIHandler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=config.QUERY_API_HOST, help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=config.QUERY_API_PORT, help="Port to listen on")
+    args = parser.parse_args()
+
+    errors = config.validate_config()
+    if errors:
+        parser.error("; ".join(errors))
+
+    server = create_server(args.host, args.port)
+    print(f"Serving {', '.join(list_targets())} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
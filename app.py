@@ -1,20 +1,53 @@
-import pyodbc
-import json
-import re
-from decimal import Decimal
-import datetime
 import streamlit as st
-import pandas as pd
-from openai import AzureOpenAI
 import config
+import os
+import secrets
 import time
+import uuid
+from db_registry import build_target, get_target, list_targets
+from chat_store import ChatStore
+from pagination import (
+    RESULT_PAGE_SIZE, prepare_inner_query, translate_order_by, find_ordered_key, find_unsortable_columns,
+    orders_by_key, build_count_query, build_page_query
+)
+from local_summary import summarize_locally
+from pipeline import (
+    run_sync, complete, get_async_openai_client, get_db_executor,
+    build_system_prompt, build_ai_messages, get_nl_sql_cache_key, parse_ai_response, summarize_results,
+    load_database_schema, validate_query_safety, fix_sql_syntax
+)
+from engine import QueryEngine
+from result_encoder import JSON_PROMPT_ROWS
+from session_memory import MB, get_session_memory, estimate_size, process_memory
+from followups import FOLLOWUP_CACHE_SIZE, RefinementError, parse_refinement, apply_refinement
 
 # Constants
-MAX_DISPLAY_ROWS = 1000
-MAX_SUMMARY_ROWS = 100
-MAX_CHAT_MESSAGES = 50
-MAX_RETRIES = 3
-RETRY_DELAY = 1
+CHAT_WINDOW_SIZE = 20  # messages rendered per conversation (older ones load on demand)
+JOB_POLL_INTERVAL = 1  # seconds between progress updates of a running query
+HISTORY_MEMORY_BUDGET = 4 * 1024 * 1024  # bytes of loaded messages before the history goes back to the latest window
+USER_TOKEN_LENGTH = 32  # characters of the random `user` URL token that owns conversations without a login
+
+# Heavy modules (pyodbc, openai, pyarrow) are imported inside the functions that
+# use them, so a cold start and UI-only reruns don't pay for loading them.
+
+# Options for the sidebar configuration dropdowns
+ENDPOINT_OPTIONS = [
+    "https://ai-proxy.lab.epam.com",
+    "https://api.openai.com/v1",
+    "Custom..."
+]
+MODEL_OPTIONS = [
+    "gpt-4o",
+    "gpt-4",
+    "gpt-4-turbo",
+    "gpt-3.5-turbo",
+    "Custom..."
+]
+SERVER_OPTIONS = [
+    "localhost",
+    "127.0.0.1",
+    "Custom..."
+]
 
 # Validate configuration on startup
 def validate_and_show_config_errors():
@@ -28,191 +61,128 @@ def validate_and_show_config_errors():
         return False
     return True
 
+def get_ai_settings():
+    """
+    This session's Azure OpenAI settings: the ones applied in its sidebar, or the configured ones.
+    Kept per session, so one user's settings never change another session's.
+    
+    Returns:
+        dict: "endpoint", "deployment" and "api_key"
+    """
+    return st.session_state.get("ai_settings") or {
+        "endpoint": config.AZURE_OPENAI_ENDPOINT,
+        "deployment": config.AZURE_OPENAI_DEPLOYMENT,
+        "api_key": config.AZURE_OPENAI_API_KEY,
+    }
+
+
+def get_ai_deployment():
+    """This session's model deployment (see get_ai_settings)"""
+    return get_ai_settings()["deployment"]
+
+
 # Initialize Azure OpenAI client in session state
 def get_openai_client():
-    """Get or create OpenAI client from session state"""
+    """Get or create OpenAI client from session state (AsyncAzureOpenAI, used on the pipeline's event loop)"""
     if 'openai_client' not in st.session_state:
         try:
-            st.session_state.openai_client = AzureOpenAI(
-                api_key=config.AZURE_OPENAI_API_KEY,
-                api_version=config.AZURE_OPENAI_API_VERSION,
-                azure_endpoint=config.AZURE_OPENAI_ENDPOINT
-            )
+            settings = get_ai_settings()
+            st.session_state.openai_client = get_async_openai_client(settings["api_key"], settings["endpoint"])
         except Exception as e:
             st.error(f"Failed to initialize OpenAI client: {e}")
             return None
     return st.session_state.openai_client
 
 
-@st.cache_data(ttl=3600)
-def get_database_schema(_connection_string, db_server, db_name):
+def find_target(name):
+    """
+    Get a database this session can query by name: one it added in the sidebar
+    (only this session sees those) or a configured one.
+    
+    Returns:
+        DatabaseTarget, or None if unknown
+    """
+    return st.session_state.get("session_targets", {}).get(name) or get_target(name)
+
+
+def list_session_targets():
+    """Names of the databases this session can choose: the configured ones, then its own"""
+    names = list_targets()
+    return names + [name for name in st.session_state.get("session_targets", {}) if name not in names]
+
+
+def add_session_target(name, server, database, username=None, password=None, replicas=()):
+    """
+    Add a database for this session only (kept in st.session_state, never in the
+    process-wide registry, so other users don't see it or its credentials).
+    Matching a configured database's settings selects that one (and its warm caches).
+    
+    Returns:
+        DatabaseTarget: The target to switch to
+    """
+    configured = get_target(name)
+    target = build_target(name, server, database, username, password, replicas, existing=configured)
+    if target is configured:
+        return target
+    if configured is not None:
+        # Same name as a configured database with other settings
+        name = f"{name} (this session)"
+    session_targets = st.session_state.setdefault("session_targets", {})
+    target = build_target(name, server, database, username, password, replicas, existing=session_targets.get(name))
+    session_targets[name] = target
+    return target
+
+
+def get_active_target():
+    """
+    Get the database this session queries.
+    Chosen per session in the sidebar, so switching databases doesn't affect other users.
+    
+    Returns:
+        DatabaseTarget: Active database target
     """
-    Dynamically retrieve the database schema from SQL Server.
-    Cached per database to support multi-database scenarios.
+    target = find_target(st.session_state.get("db_target"))
+    if target is None:
+        target = get_target(list_targets()[0])
+        st.session_state.db_target = target.name
+    return target
+
+
+def get_database_schema(target=None):
+    """
+    Get the database schema, cached per database target.
+    Each target keeps its own schema, so switching databases never evicts
+    (or reloads) another database's schema.
     
     Args:
-        _connection_string: Connection string (prefixed with _ to exclude from cache key)
-        db_server: Database server name (used in cache key)
-        db_name: Database name (used in cache key)
+        target (DatabaseTarget): Database (optional, default the session's active database)
     
     Returns:
         str: Formatted database schema information
     """
-    try:
-        conn = pyodbc.connect(_connection_string, timeout=10)
-        cursor = conn.cursor()
-        
-        # Query to get all tables and their columns with data types from ALL schemas
-        schema_query = """
-        SELECT 
-            t.TABLE_SCHEMA,
-            t.TABLE_NAME,
-            c.COLUMN_NAME,
-            c.DATA_TYPE,
-            c.CHARACTER_MAXIMUM_LENGTH,
-            c.NUMERIC_PRECISION,
-            c.NUMERIC_SCALE,
-            c.IS_NULLABLE,
-            CASE 
-                WHEN pk.COLUMN_NAME IS NOT NULL THEN 'PRIMARY KEY'
-                WHEN fk.COLUMN_NAME IS NOT NULL THEN 'FOREIGN KEY'
-                ELSE ''
-            END AS KEY_TYPE,
-            fk.REFERENCED_TABLE_SCHEMA,
-            fk.REFERENCED_TABLE_NAME,
-            fk.REFERENCED_COLUMN_NAME,
-            c.COLUMN_DEFAULT
-        FROM 
-            INFORMATION_SCHEMA.TABLES t
-        INNER JOIN 
-            INFORMATION_SCHEMA.COLUMNS c ON t.TABLE_SCHEMA = c.TABLE_SCHEMA AND t.TABLE_NAME = c.TABLE_NAME
-        LEFT JOIN (
-            SELECT 
-                ku.TABLE_SCHEMA,
-                ku.TABLE_NAME,
-                ku.COLUMN_NAME
-            FROM 
-                INFORMATION_SCHEMA.TABLE_CONSTRAINTS tc
-            INNER JOIN 
-                INFORMATION_SCHEMA.KEY_COLUMN_USAGE ku 
-                ON tc.CONSTRAINT_SCHEMA = ku.CONSTRAINT_SCHEMA 
-                AND tc.CONSTRAINT_NAME = ku.CONSTRAINT_NAME
-            WHERE 
-                tc.CONSTRAINT_TYPE = 'PRIMARY KEY'
-        ) pk ON c.TABLE_SCHEMA = pk.TABLE_SCHEMA AND c.TABLE_NAME = pk.TABLE_NAME AND c.COLUMN_NAME = pk.COLUMN_NAME
-        LEFT JOIN (
-            SELECT 
-                ku.TABLE_SCHEMA,
-                ku.TABLE_NAME,
-                ku.COLUMN_NAME,
-                ccu.TABLE_SCHEMA AS REFERENCED_TABLE_SCHEMA,
-                ccu.TABLE_NAME AS REFERENCED_TABLE_NAME,
-                ccu.COLUMN_NAME AS REFERENCED_COLUMN_NAME
-            FROM 
-                INFORMATION_SCHEMA.TABLE_CONSTRAINTS tc
-            INNER JOIN 
-                INFORMATION_SCHEMA.KEY_COLUMN_USAGE ku 
-                ON tc.CONSTRAINT_SCHEMA = ku.CONSTRAINT_SCHEMA 
-                AND tc.CONSTRAINT_NAME = ku.CONSTRAINT_NAME
-            INNER JOIN 
-                INFORMATION_SCHEMA.CONSTRAINT_COLUMN_USAGE ccu 
-                ON tc.CONSTRAINT_SCHEMA = ccu.CONSTRAINT_SCHEMA 
-                AND tc.CONSTRAINT_NAME = ccu.CONSTRAINT_NAME
-            WHERE 
-                tc.CONSTRAINT_TYPE = 'FOREIGN KEY'
-        ) fk ON c.TABLE_SCHEMA = fk.TABLE_SCHEMA AND c.TABLE_NAME = fk.TABLE_NAME AND c.COLUMN_NAME = fk.COLUMN_NAME
-        WHERE 
-            t.TABLE_TYPE = 'BASE TABLE'
-            AND t.TABLE_SCHEMA NOT IN ('sys', 'INFORMATION_SCHEMA')
-        ORDER BY 
-            t.TABLE_SCHEMA, t.TABLE_NAME, c.ORDINAL_POSITION
-        """
-        
-        cursor.execute(schema_query)
-        rows = cursor.fetchall()
-        
-        # Build schema string and collect table names
-        schema_text = "DATABASE SCHEMA:\n\n"
-        current_table = None
-        current_schema = None
-        table_names = []
-        
-        for row in rows:
-            table_schema = row[0]
-            table_name = row[1]
-            column_name = row[2]
-            data_type = row[3].upper()
-            max_length = row[4]
-            numeric_precision = row[5]
-            numeric_scale = row[6]
-            is_nullable = row[7]
-            key_type = row[8]
-            ref_schema = row[9]
-            ref_table = row[10]
-            ref_column = row[11]
-            
-            # Create full table identifier with schema
-            full_table_name = f"{table_schema}.{table_name}"
-            
-            # Start new table section
-            if current_schema != table_schema or current_table != table_name:
-                if current_table is not None:
-                    schema_text += "\n"
-                schema_text += f"Table: {full_table_name}\n"
-                current_schema = table_schema
-                current_table = table_name
-                if full_table_name not in table_names:
-                    table_names.append(full_table_name)
-            
-            # Format data type with length/precision
-            if max_length and data_type in ['NVARCHAR', 'VARCHAR', 'CHAR', 'NCHAR']:
-                type_info = f"{data_type}({max_length})"
-            elif numeric_precision and data_type in ['DECIMAL', 'NUMERIC']:
-                type_info = f"{data_type}({numeric_precision},{numeric_scale})"
-            else:
-                type_info = data_type
-            
-            # Build column description
-            column_desc = f"- {column_name} ({type_info}"
-            
-            if key_type == 'PRIMARY KEY':
-                column_desc += ", PRIMARY KEY"
-            elif key_type == 'FOREIGN KEY':
-                if ref_schema:
-                    column_desc += f", FOREIGN KEY -> {ref_schema}.{ref_table}.{ref_column}"
-                else:
-                    column_desc += f", FOREIGN KEY -> {ref_table}.{ref_column}"
-            
-            column_desc += ")"
-            
-            schema_text += column_desc + "\n"
-        
-        cursor.close()
-        conn.close()
-        
-        # Store table names in session state for dynamic UI
-        st.session_state.table_names = table_names
-        
-        return schema_text
+    target = target or get_active_target()
+    return target.get_schema(load_database_schema)
+
+
+def get_table_names(wait=True):
+    """
+    Get the table names of the current database.
+    Parsed from the cached schema, so every session sees them (not only the
+    session that happened to load the schema).
     
-    except pyodbc.Error as e:
-        # Specific database errors
-        error_msg = str(e)
-        st.session_state.table_names = []
-        
-        if "Login failed" in error_msg or "authentication" in error_msg.lower():
-            return "DATABASE SCHEMA:\n\n❌ Authentication failed. Please check your username and password in the sidebar."
-        elif "Cannot open database" in error_msg:
-            return f"DATABASE SCHEMA:\n\n❌ Database '{db_name}' not found. Please check the database name."
-        elif "timeout" in error_msg.lower():
-            return f"DATABASE SCHEMA:\n\n❌ Connection timeout. Please check if SQL Server is running on '{db_server}'."
-        else:
-            return f"DATABASE SCHEMA:\n\n❌ Database connection failed: {error_msg}"
+    Args:
+        wait (bool): Load the schema if needed (False starts loading it in the
+                     background and returns None until it is loaded)
     
-    except Exception as e:
-        # Other errors
-        st.session_state.table_names = []
-        return f"DATABASE SCHEMA:\n\n❌ Schema retrieval failed: {str(e)}"
+    Returns:
+        list: Schema-qualified table names (e.g., "dbo.Students"), or None
+    """
+    target = get_active_target()
+    if not wait and target.peek_schema() is None:
+        target.load_schema_in_background(load_database_schema, get_db_executor())
+        return None
+    schema_text = get_database_schema(target)
+    return [line[len("Table: "):] for line in schema_text.splitlines() if line.startswith("Table: ")]
 
 
 def get_dynamic_app_title():
@@ -222,19 +192,23 @@ def get_dynamic_app_title():
     Returns:
         str: Dynamic app title
     """
-    db_name = config.DB_NAME or "Database"
+    db_name = get_active_target().database or "Database"
     return f"{db_name} Database Chatbot"
 
 
 def get_dynamic_app_description():
     """
     Generate a dynamic app description based on available database tables.
+    Doesn't wait for the schema: the first run of a new database shows no
+    description (None) while its schema loads in the background.
     
     Returns:
-        str: Dynamic app description
+        str: Dynamic app description, or None until the schema is loaded
     """
-    table_names = st.session_state.get('table_names', [])
+    table_names = get_table_names(wait=False)
     
+    if table_names is None:
+        return None
     if not table_names:
         return "Configure your database connection to start querying."
     
@@ -263,12 +237,15 @@ def get_dynamic_app_description():
 def get_dynamic_welcome_message():
     """
     Generate a dynamic welcome message based on available database tables.
+    Doesn't wait for the schema (a generic welcome while it is still loading).
     
     Returns:
         str: Dynamic welcome message
     """
-    table_names = st.session_state.get('table_names', [])
+    table_names = get_table_names(wait=False)
     
+    if table_names is None:
+        return "Hello! I'm your database assistant. Ask me about your data."
     if not table_names:
         return "Hello! I'm your database assistant. Please configure your database connection in the sidebar."
     
@@ -303,245 +280,66 @@ def get_system_prompt():
         str: System prompt with current database schema
     """
     # Get fresh schema based on current config
-    current_schema = get_database_schema(
-        config.CONNECTION_STRING,
-        config.DB_SERVER,
-        config.DB_NAME
-    )
-    
-    return f"""You are a helpful assistant for a database system. 
-Your job is to convert user questions into SQL queries for Microsoft SQL Server.
-
-{current_schema}
-
-IMPORTANT RULES:
-1. If the user asks a question that requires database information, generate a SQL SELECT query
-2. If the user asks general questions like "What can you do?", "Help", "Hello", respond with "NO_QUERY_NEEDED:" followed by your response
-3. Generate ONLY SELECT queries (no INSERT, UPDATE, DELETE, DROP, etc.)
-4. Use proper JOIN syntax when querying multiple tables
-5. Use WHERE clauses for filtering
-6. When joining names from multiple columns, use + for concatenation (e.g., FirstName + ' ' + LastName)
-7. Use appropriate filters based on the database context (e.g., IsActive, Status, etc.)
-8. ALWAYS use schema-qualified table names (schema.table) when tables have schema prefixes
-9. PAY ATTENTION to conversation history - if the user refers to "them", "those", "it", etc., check previous context
-10. If a user asks a follow-up question, consider what was discussed before
-
-SQL SERVER SPECIFIC SYNTAX (VERY IMPORTANT):
-- Use TOP N instead of LIMIT N (e.g., SELECT TOP 1 * FROM TableName)
-- Use + for string concatenation
-- Use GETDATE() for current date
-- Use DATEPART() for date parts
-- Use LEN() instead of LENGTH()
-- Use ISNULL() instead of IFNULL()
-- When using GROUP BY with aggregates, include all non-aggregated columns
-
-EXAMPLES:
-User: "Show me all customers"
-Response: SELECT * FROM dbo.Customers
-
-User: "What are their names?"  (follow-up to previous query about customers)
-Response: SELECT CustomerID, FirstName + ' ' + LastName AS FullName FROM dbo.Customers
-
-User: "How many orders do we have?"
-Response: SELECT COUNT(*) AS TotalOrders FROM dbo.Orders
-
-User: "Hello"
-Response: NO_QUERY_NEEDED: Hello! I can help you query your database. Ask me questions about your data!
-
-RESPONSE FORMAT:
-- If a database query is needed: Return ONLY the SQL query (no explanations, no markdown)
-- If no query is needed: Start with "NO_QUERY_NEEDED:" followed by your conversational response
-
-Now process the user's input based on the conversation context.
-"""
+    return build_system_prompt(get_database_schema())
 
 
-def validate_query_safety(query):
-    """
-    Validate that the query is safe to execute (SELECT only, no dangerous operations).
-    
-    Args:
-        query (str): SQL query to validate
-        
-    Returns:
-        tuple: (is_safe, error_message)
-    """
-    query_upper = query.strip().upper()
-    
-    # Check it starts with SELECT or WITH (CTE)
-    if not (query_upper.startswith('SELECT') or query_upper.startswith('WITH')):
-        return False, "Only SELECT queries are allowed"
-    
-    # Check for dangerous keywords
-    dangerous_keywords = [
-        'DROP', 'DELETE', 'UPDATE', 'INSERT', 'ALTER', 'CREATE', 
-        'TRUNCATE', 'EXEC', 'EXECUTE', 'SP_', 'XP_', 'MERGE'
-    ]
-    
-    for keyword in dangerous_keywords:
-        # Use word boundaries to avoid false positives (e.g., "DROPPED" column name)
-        pattern = r'\b' + keyword + r'\b'
-        if re.search(pattern, query_upper):
-            return False, f"Dangerous keyword detected: {keyword}"
-    
-    # Check for semicolons (multiple statements)
-    if ';' in query.rstrip(';'):  # Allow trailing semicolon
-        return False, "Multiple statements not allowed"
-    
-    return True, None
+def use_fresh_data():
+    """Whether this session asked for fresh data (queries go to the primary, not a read replica)"""
+    return st.session_state.get("fresh_data", False)
 
 
-def query_db(query):
+def query_db(query, max_rows=None, as_arrow=False, target=None, fresh=None, job=None):
     """
     Execute SQL query and return results.
+    Queries run on a read replica when the database has any (falling back to
+    the primary); fresh-data queries run on the primary. Successful results are
+    kept briefly in the target's result cache, so repeating a question doesn't
+    run the query again.
     
     Args:
         query (str): SQL query to execute
+        max_rows (int): Maximum rows to fetch (optional, default all rows)
+        as_arrow (bool): Return a pyarrow Table with native column types
+        target (DatabaseTarget): Database to query (optional, default the session's active database)
+        fresh (bool): Read from the primary and skip cached results (optional, default the session's setting)
+        job (QueryJob): Background job running this query (optional)
         
     Returns:
-        list: Query results as list of dictionaries or error dict
-    """
-    # Validate query safety first
-    is_safe, error_msg = validate_query_safety(query)
-    if not is_safe:
-        return {"error": f"🛡️ Security: {error_msg}"}
-    
-    try:
-        # Connect to database
-        conn = pyodbc.connect(config.CONNECTION_STRING)
-        cursor = conn.cursor()
-        
-        # Execute query
-        cursor.execute(query)
-        
-        # Get column names
-        columns = [column[0] for column in cursor.description]
-        
-        # Fetch all results
-        rows = cursor.fetchall()
-        
-        # Convert to list of dictionaries
-        results = []
-        for row in rows:
-            row_dict = {}
-            for idx, value in enumerate(row):
-                column_name = columns[idx]
-                
-                # Handle different data types
-                if value is None:
-                    row_dict[column_name] = None
-                elif isinstance(value, Decimal):
-                    # Preserve precision - don't round
-                    row_dict[column_name] = float(value)
-                elif isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
-                    # Handle datetime objects
-                    row_dict[column_name] = value.isoformat()
-                elif isinstance(value, (bytes, bytearray)):
-                    # Handle binary data
-                    try:
-                        row_dict[column_name] = value.decode('utf-8', errors='ignore')
-                    except:
-                        row_dict[column_name] = '<binary data>'
-                elif isinstance(value, bool):
-                    # Handle boolean
-                    row_dict[column_name] = value
-                elif isinstance(value, (int, float, str)):
-                    # Handle basic types
-                    row_dict[column_name] = value
-                else:
-                    # Fallback: convert to string for unknown types (UUID, XML, etc.)
-                    try:
-                        row_dict[column_name] = str(value)
-                    except:
-                        row_dict[column_name] = '<unprintable>'
-                    
-            results.append(row_dict)
-        
-        # Close connection
-        cursor.close()
-        conn.close()
-        
-        return results
-    
-    except pyodbc.Error as e:
-        error_msg = str(e)
-        if "Invalid object name" in error_msg:
-            return {"error": f"Table or view not found. Please check the table name and schema."}
-        elif "Invalid column name" in error_msg:
-            return {"error": f"Column not found in the table."}
-        elif "Syntax error" in error_msg or "Incorrect syntax" in error_msg:
-            return {"error": f"SQL syntax error: {error_msg}"}
-        else:
-            return {"error": f"Database error: {error_msg}"}
-    
-    except Exception as e:
-        return {"error": f"Unexpected error: {str(e)}"}
-
-
-def is_sql_query(text):
-    """
-    Check if the text is a SQL query.
-    
-    Args:
-        text (str): Text to check
-        
-    Returns:
-        bool: True if it's a SQL query, False otherwise
+        list: Query results as list of dictionaries (or pyarrow Table) or error dict
     """
-    text_upper = text.strip().upper()
-    sql_keywords = ['SELECT', 'WITH']
-    return any(text_upper.startswith(keyword) for keyword in sql_keywords)
+    target = target or get_active_target()
+    fresh = use_fresh_data() if fresh is None else fresh
+    return run_sync(QueryEngine(target).execute(query, max_rows, as_arrow, fresh, job))
 
 
-def fix_sql_syntax(query):
+def get_conversation_key(user_prompt, conversation_history=None):
     """
-    Fix common SQL syntax issues for SQL Server.
-    
-    Args:
-        query (str): SQL query to fix
-        
-    Returns:
-        str: Fixed SQL query
+    Key of a question in its conversation on the active database
+    (the NL→SQL cache key of the messages the AI gets for it).
     """
-    # Replace LIMIT with TOP
-    # Pattern: LIMIT n at the end of query
-    limit_pattern = r'\s+LIMIT\s+(\d+)\s*;?\s*$'
-    match = re.search(limit_pattern, query, re.IGNORECASE)
-    if match:
-        limit_value = match.group(1)
-        # Remove LIMIT clause
-        query = re.sub(limit_pattern, '', query, flags=re.IGNORECASE)
-        # Add TOP after SELECT
-        query = re.sub(r'\bSELECT\b', f'SELECT TOP {limit_value}', query, count=1, flags=re.IGNORECASE)
-    
-    # Replace LENGTH() with LEN()
-    query = re.sub(r'\bLENGTH\s*\(', 'LEN(', query, flags=re.IGNORECASE)
-    
-    # Replace IFNULL() with ISNULL()
-    query = re.sub(r'\bIFNULL\s*\(', 'ISNULL(', query, flags=re.IGNORECASE)
-    
-    return query.strip()
+    return get_nl_sql_cache_key(build_ai_messages(get_system_prompt(), user_prompt, conversation_history))
 
 
-def extract_sql_from_response(ai_response):
+def take_speculative_sql(user_prompt, conversation_history=None):
     """
-    Robustly extract SQL query from AI response, handling various markdown formats.
+    Get the SQL this session speculatively generated for a question it now asks.
+    Speculative SQL is a guess, so like any generated SQL it only goes into the
+    shared NL→SQL cache once the asked question's job ran it (finish_query_job).
     
-    Args:
-        ai_response (str): AI response text
-        
     Returns:
-        str: Extracted SQL query
+        str: SQL query as generated (before fix_sql_syntax), or None
     """
-    # Try to find code block with sql marker
-    code_block_pattern = r'```(?:sql|SQL)?\s*\n?(.*?)\n?```'
-    match = re.search(code_block_pattern, ai_response, re.DOTALL | re.IGNORECASE)
-    
-    if match:
-        return match.group(1).strip()
+    from query_jobs import get_job_manager
     
-    # Fallback: return as-is
-    return ai_response.strip()
+    speculations = st.session_state.get("speculations")
+    if not speculations:
+        return None
+    cache_key = get_conversation_key(user_prompt, conversation_history)
+    job_id = speculations.pop(cache_key, None)
+    job = get_job_manager().get(job_id) if job_id else None
+    if job is None or job.status != "done" or "error" in job.result:
+        return None
+    return job.result["query"]
 
 
 def get_sql_query_from_ai(user_prompt, conversation_history=None):
@@ -558,99 +356,49 @@ def get_sql_query_from_ai(user_prompt, conversation_history=None):
             - query_or_response: SQL query or conversational response
             - needs_database: True if database query needed, False otherwise
     """
+    # A suggestion prefetched in this conversation: asking it confirms its SQL
+    speculative_query = take_speculative_sql(user_prompt, conversation_history)
+    if speculative_query:
+        return fix_sql_syntax(speculative_query), True
+    
     client = get_openai_client()
     if not client:
         return "Error: OpenAI client not initialized. Check your API configuration.", False
     
-    # Get fresh system prompt with current schema
-    system_prompt = get_system_prompt()
-    
-    # Build message history for context-aware responses
-    messages = [{"role": "system", "content": system_prompt}]
-    
-    # Add conversation history (limit to last 10 messages to avoid token overflow)
-    if conversation_history:
-        # Filter out the welcome message and limit history
-        filtered_history = [msg for msg in conversation_history if msg.get("role") != "system"]
-        # Take last 10 messages (5 exchanges)
-        recent_history = filtered_history[-10:] if len(filtered_history) > 10 else filtered_history
-        
-        for msg in recent_history:
-            role = msg.get("role")
-            content = msg.get("content", "")
-            
-            # Clean up assistant messages - remove SQL code blocks to save tokens
-            # Keep only the natural language summary
-            if role == "assistant" and "**SQL Query:**" in content:
-                # Extract only the summary part (before the SQL block)
-                summary_part = content.split("**SQL Query:**")[0].strip()
-                if summary_part:
-                    messages.append({"role": "assistant", "content": summary_part})
-            elif content and role in ["user", "assistant"]:
-                messages.append({"role": role, "content": content})
-    
-    # Add current user prompt
-    messages.append({"role": "user", "content": user_prompt})
-    
-    # Retry logic for transient failures
-    for attempt in range(MAX_RETRIES):
-        try:
-            response = client.chat.completions.create(
-                model=config.AZURE_OPENAI_DEPLOYMENT,
-                messages=messages,
-                temperature=0.3  # Slightly higher for better understanding
-            )
-            
-            ai_response = response.choices[0].message.content
-            if not ai_response:
-                return "Error: Empty response from AI", False
-                
-            ai_response = ai_response.strip()
-            
-            # Check if AI indicates no query is needed
-            if ai_response.startswith("NO_QUERY_NEEDED:"):
-                conversational_response = ai_response.replace("NO_QUERY_NEEDED:", "").strip()
-                return conversational_response, False
-            
-            # Extract SQL from markdown code blocks
-            query = extract_sql_from_response(ai_response)
-            
-            # Verify it's actually a SQL query
-            if not is_sql_query(query):
-                # If it's not a SQL query, treat it as a conversational response
-                return query, False
-            
-            return query, True
-            
-        except Exception as e:
-            error_str = str(e)
-            
-            # Check for rate limiting
-            if "429" in error_str or "rate" in error_str.lower():
-                if attempt < MAX_RETRIES - 1:
-                    st.warning(f"⏳ Rate limit reached, retrying in {RETRY_DELAY} seconds...")
-                    time.sleep(RETRY_DELAY * (attempt + 1))
-                    continue
-                else:
-                    return "Error: Rate limit exceeded. Please try again in a moment.", False
-            
-            # Check for authentication errors
-            elif "401" in error_str or "authentication" in error_str.lower():
-                return "Error: Authentication failed. Please check your API key in the sidebar.", False
-            
-            # Check for model not found
-            elif "404" in error_str or "not found" in error_str.lower():
-                return f"Error: Model '{config.AZURE_OPENAI_DEPLOYMENT}' not found. Check deployment name.", False
-            
-            # Other errors
-            else:
-                if attempt < MAX_RETRIES - 1:
-                    time.sleep(RETRY_DELAY)
-                    continue
-                else:
-                    return f"Error: {error_str}", False
-    
-    return "Error: Maximum retries exceeded", False
+    # Same engine as the HTTP API and batch CLI (NL→SQL cache, retries on transient failures)
+    return run_sync(
+        QueryEngine(get_active_target(), client, get_ai_deployment()).generate_sql(user_prompt, conversation_history)
+    )
+
+
+def execute_with_repair(user_prompt, query, max_rows=None, as_arrow=False, target=None, fresh=None, client=None, job=None,
+                        deployment=None):
+    """
+    Execute a generated query, automatically repairing it when it fails
+    (QueryEngine.execute_with_repair(), the same as the HTTP API and batch CLI).
+
+    Args:
+        user_prompt (str): Original user question
+        query (str): SQL query to execute
+        max_rows (int): Maximum rows to fetch (optional, default all rows)
+        as_arrow (bool): Return results as a pyarrow Table
+        target (DatabaseTarget): Database (optional, default the session's active database)
+        fresh (bool): Read from the primary (optional, default the session's setting)
+        client: OpenAI client for repairs (optional, default the configured client)
+        job (QueryJob): Background job running this query (optional)
+        deployment (str): Model deployment for repairs (optional, default the configured one)
+
+    Returns:
+        tuple: (results, final_query, repairs)
+            - results: Query results (list) or error dict, as returned by query_db()
+            - final_query: The query that produced the results
+            - repairs: List of {"query", "error"} dicts for each failed attempt
+    """
+    target = target or get_active_target()
+    fresh = use_fresh_data() if fresh is None else fresh
+    return run_sync(
+        QueryEngine(target, client, deployment).execute_with_repair(user_prompt, query, max_rows, as_arrow, fresh, job)
+    )
 
 
 def format_results(results):
@@ -685,283 +433,1535 @@ def format_results(results):
     return "\n".join(output)
 
 
-def get_ai_summary(user_prompt, query, results):
+def get_ai_summary(user_prompt, query, results, total_rows=None):
     """
     Get Azure OpenAI to summarize the results in natural language.
-    Limits result size to avoid token overflow.
+    Trivial result shapes are summarized locally from templates instead.
+    Results are encoded within SUMMARY_TOKEN_BUDGET to avoid token overflow.
     
     Args:
         user_prompt (str): Original user question
         query (str): SQL query that was executed
         results (list): Query results
+        total_rows (int): Total rows of the full result if results is one page (optional)
         
     Returns:
         str: Natural language summary
     """
-    client = get_openai_client()
-    if not client:
-        return "Summary unavailable: OpenAI client not initialized."
-    
-    try:
-        # Limit results sent to AI to avoid token limits
-        summary_results = results[:MAX_SUMMARY_ROWS] if len(results) > MAX_SUMMARY_ROWS else results
-        result_count_note = f" (showing first {MAX_SUMMARY_ROWS} of {len(results)})" if len(results) > MAX_SUMMARY_ROWS else ""
-        
-        summary_prompt = f"""
-User asked: "{user_prompt}"
-
-SQL Query executed: {query}
-
-Results{result_count_note}: {json.dumps(summary_results, indent=2, default=str)}
+    summary, encoding_report = generate_summary(
+        get_openai_client(), user_prompt, query, results, total_rows, get_ai_deployment()
+    )
+    st.session_state.last_summary_encoding = encoding_report
+    return summary
 
-Provide a clear, natural language answer to the user's question based on these results.
 
-IMPORTANT FORMATTING RULES:
-- Use proper spacing between words
-- Format numbers with appropriate spacing (e.g., "received a 4,067.80" not "receiveda4067.7988")
-- Use complete sentences with proper punctuation
-- Add line breaks between different points if listing multiple items
-- Be concise and friendly
-- If there are multiple results, summarize them clearly with bullet points or numbered lists
-- If there are more results than shown, mention the total count
-"""
-        
-        response = client.chat.completions.create(
-            model=config.AZURE_OPENAI_DEPLOYMENT,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that explains database query results in natural language. Always use proper spacing between words, format numbers clearly, and write in complete, well-structured sentences."},
-                {"role": "user", "content": summary_prompt}
-            ],
-            temperature=0.7
-        )
-        
-        summary = response.choices[0].message.content
-        return summary.strip() if summary else "Summary generation returned empty response."
+def generate_summary(client, user_prompt, query, results, total_rows=None, deployment=None):
+    """
+    Summarize results (locally from templates, or with Azure OpenAI) through the async pipeline.
+    Doesn't touch session state, so speculative jobs can run it on a worker thread.
     
-    except Exception as e:
-        error_str = str(e)
-        if "token" in error_str.lower() or "length" in error_str.lower():
-            return f"⚠️ Results too large to summarize ({len(results)} rows). Showing data table below."
-        return f"Error generating summary: {error_str}"
-
+    Args:
+        client: OpenAI client (None if unavailable)
+        user_prompt (str): Original user question
+        query (str): SQL query that was executed
+        results (list): Query results
+        total_rows (int): Total rows of the full result if results is one page (optional)
+        
+    Returns:
+        tuple: (summary, encoding report or None)
+    """
+    return run_sync(summarize_results(client, user_prompt, query, results, total_rows, deployment=deployment))
 
-def main():
-    """Streamlit chat-style UI using `st.chat_input` and `st.chat_message`."""
-    st.set_page_config(page_title="Database Chatbot", layout="wide")
 
-    # Validate configuration first
-    if not validate_and_show_config_errors():
-        st.stop()
+def count_query_rows(query, target=None, fresh=None, job=None):
+    """
+    Count all rows a query returns, on the server.
     
-    # Initialize session state table_names if not exists
-    if 'table_names' not in st.session_state:
-        st.session_state.table_names = []
+    Args:
+        query (str): SQL query
+        target (DatabaseTarget): Database (optional, default the session's active database)
+        fresh (bool): Read from the primary (optional, default the session's setting)
+        job (QueryJob): Background job running the count (optional)
+        
+    Returns:
+        int: Row count, or None if the query cannot be counted
+    """
+    import pyodbc
     
-    # Get dynamic title based on database name
-    dynamic_title = get_dynamic_app_title()
-    st.title(dynamic_title)
-
-    with st.sidebar:
-        st.header("⚙️ Configuration")
+    inner_query, _ = prepare_inner_query(query)
+    if inner_query is None:
+        return None
+    target = target or get_active_target()
+    fresh = use_fresh_data() if fresh is None else fresh
+    try:
+        with target.read_connection(fresh=fresh) as conn:
+            cursor = conn.cursor()
+            if job:
+                job.attach_cursor(cursor)
+            sql, params = build_count_query(inner_query)
+            cursor.execute(sql, params)
+            total = cursor.fetchone()[0]
+            cursor.close()
+        return int(total)
+    except pyodbc.Error:
+        return None
+
+
+def create_results_view(query, first_page, total_rows):
+    """
+    Create the state of a paginated results viewer for a query.
+    Only the generated query and one page of rows are kept in session state.
+    
+    Args:
+        query (str): SQL query that was executed
+        first_page (pa.Table): First page of results
+        total_rows (int): Total number of rows the query returns
         
-        # Initialize session state for configuration if not exists
-        if 'config_updated' not in st.session_state:
-            st.session_state.config_updated = False
+    Returns:
+        dict: Viewer state
+    """
+    import pyarrow as pa
+    from arrow_transport import renamed_columns
+    
+    inner_query, order_by_clause = prepare_inner_query(query)
+    columns = first_page.column_names
+    if renamed_columns(first_page.schema):
+        # Unnamed or duplicate columns can't be selected from a derived table - no paging
+        inner_query = None
+    view = {
+        "id": uuid.uuid4().hex[:8],
+        "target": get_active_target().name,
+        "query": query,
+        "inner_query": inner_query,
+        "columns": columns,
+        "default_order": None,
+        "key_column": None,
+        # Columns that can be sorted on: not binary (image), nor text, ntext or xml (below)
+        "tiebreak_columns": [
+            field.name for field in first_page.schema
+            if not (pa.types.is_binary(field.type) or pa.types.is_large_binary(field.type))
+        ],
+        "first_page": first_page,
+        "total_rows": total_rows,
+        "counts": {},
+        "page_keys": {},
+    }
+    if inner_query is not None and columns:
+        view["default_order"] = translate_order_by(order_by_clause, columns)
+        schema_text = get_database_schema()
+        view["key_column"] = find_ordered_key(query, columns, schema_text)
+        unsortable = find_unsortable_columns(query, columns, schema_text)
+        view["tiebreak_columns"] = [column for column in view["tiebreak_columns"] if column not in unsortable]
+        if total_rows > first_page.num_rows and orders_by_key(view["default_order"], view["key_column"]):
+            # The first fetch already is page 1 - remember its last key for keyset paging to page 2
+            # (in the viewer's default state: no sort, no filter)
+            view["page_keys"][(None, False, None, "", 0)] = first_page.column(view["key_column"])[-1].as_py()
+        elif total_rows > first_page.num_rows:
+            # Otherwise the first fetch isn't page 1 of the ordered pages - fetch that instead
+            page = fetch_results_page(view, 0, filter_text="")
+            if not isinstance(page, dict):
+                view["first_page"] = page[0]
+    return view
+
+
+def fetch_results_page(view, page, sort_column=None, descending=False, filter_column=None, filter_text=None):
+    """
+    Fetch one page of a query's results from the server.
+    Sorting and filtering run on the server; the previous page's last key is
+    remembered so sequential paging over a unique key uses keyset pagination.
+    
+    Args:
+        view (dict): Viewer state from create_results_view()
+        page (int): Zero-based page number
+        sort_column (str): Column to sort by (optional)
+        descending (bool): Sort direction
+        filter_column (str): Column to filter (optional)
+        filter_text (str): Text the column must contain (optional)
         
-        with st.expander("🔧 Azure OpenAI Settings", expanded=False):
-            # Azure Endpoint dropdown with custom option
-            endpoint_options = [
-                "https://ai-proxy.lab.epam.com",
-                "https://api.openai.com/v1",
-                "Custom..."
-            ]
-            
-            default_endpoint = config.AZURE_OPENAI_ENDPOINT if config.AZURE_OPENAI_ENDPOINT in endpoint_options else "Custom..."
-            selected_endpoint = st.selectbox(
-                "Azure Endpoint",
-                options=endpoint_options,
-                index=endpoint_options.index(default_endpoint) if default_endpoint in endpoint_options else 0
-            )
-            
-            if selected_endpoint == "Custom...":
-                azure_endpoint = st.text_input(
-                    "Enter Custom Endpoint",
-                    value=config.AZURE_OPENAI_ENDPOINT or "",
-                    placeholder="https://your-endpoint.openai.azure.com"
-                )
-            else:
-                azure_endpoint = selected_endpoint
-            
-            # Model/Deployment dropdown with custom option
-            model_options = [
-                "gpt-4o",
-                "gpt-4",
-                "gpt-4-turbo",
-                "gpt-3.5-turbo",
-                "Custom..."
-            ]
-            
-            default_model = config.AZURE_OPENAI_DEPLOYMENT if config.AZURE_OPENAI_DEPLOYMENT in model_options else "Custom..."
-            selected_model = st.selectbox(
-                "Model / Deployment",
-                options=model_options,
-                index=model_options.index(default_model) if default_model in model_options else 0
-            )
+    Returns:
+        tuple: (rows as pa.Table, total_rows) or error dict
+    """
+    import pyodbc
+    from arrow_transport import fetch_arrow_table
+    
+    inner_query = view["inner_query"]
+    page_state = (sort_column, descending, filter_column, filter_text)
+    
+    target = find_target(view["target"]) or get_active_target()
+    
+    try:
+        with target.read_connection(fresh=use_fresh_data()) as conn:
+            cursor = conn.cursor()
             
-            if selected_model == "Custom...":
-                azure_deployment = st.text_input(
-                    "Enter Custom Model/Deployment",
-                    value=config.AZURE_OPENAI_DEPLOYMENT or "",
-                    placeholder="your-deployment-name"
-                )
-            else:
-                azure_deployment = selected_model
+            # Count once per filter
+            count_key = (filter_column, filter_text)
+            if count_key not in view["counts"]:
+                if filter_text:
+                    sql, params = build_count_query(inner_query, filter_column, filter_text)
+                    cursor.execute(sql, params)
+                    view["counts"][count_key] = int(cursor.fetchone()[0])
+                else:
+                    view["counts"][count_key] = view["total_rows"]
+            total_rows = view["counts"][count_key]
             
-            # API Key input
-            azure_api_key = st.text_input(
-                "Azure OpenAI API Key",
-                value=config.AZURE_OPENAI_API_KEY or "",
-                type="password",
-                placeholder="Enter your API key"
+            sql, params = build_page_query(
+                inner_query, view["columns"], page,
+                sort_column=sort_column, descending=descending,
+                default_order=view["default_order"],
+                filter_column=filter_column, filter_text=filter_text,
+                key_column=view["key_column"],
+                keyset_after=view["page_keys"].get(page_state + (page - 1,)),
+                tiebreak_columns=view["tiebreak_columns"]
             )
+            cursor.execute(sql, params)
+            rows = fetch_arrow_table(cursor)
+            cursor.close()
+    except pyodbc.Error as e:
+        return {"error": f"Database error: {e}"}
+    
+    if rows.num_rows and view["key_column"]:
+        view["page_keys"][page_state + (page,)] = rows.column(view["key_column"])[-1].as_py()
+    return rows, total_rows
+
+
+def fetch_chart_data(view, spec):
+    """
+    Get the points to chart for a results view (at most MAX_CHART_POINTS).
+    Results that fit in the first page are charted directly. Larger results
+    are aggregated on the server (per date bucket or category), or - for a
+    numeric x axis - their chart columns are streamed and downsampled with LTTB.
+    
+    Args:
+        view (dict): Viewer state from create_results_view()
+        spec (dict): Chart from charts.infer_chart()
         
-        with st.expander("🗄️ Database Settings", expanded=False):
-            # Database Server dropdown with custom option
-            server_options = [
-                "localhost",
-                "127.0.0.1",
-                "Custom..."
-            ]
-            
-            default_server = config.DB_SERVER if config.DB_SERVER in server_options else "Custom..."
-            selected_server = st.selectbox(
-                "Database Server",
-                options=server_options,
-                index=server_options.index(default_server) if default_server in server_options else 0
-            )
-            
-            if selected_server == "Custom...":
-                db_server = st.text_input(
-                    "Enter Custom Server",
-                    value=config.DB_SERVER or "",
-                    placeholder="server-name or IP address"
-                )
+    Returns:
+        tuple: (points as pa.Table, note for the caption) or error dict
+    """
+    import pyarrow as pa
+    import pyodbc
+    from arrow_transport import fetch_arrow_table
+    from charts import (
+        CHART_FETCH_LIMIT, MAX_BAR_CATEGORIES, build_range_query, build_bucket_query,
+        build_category_query, build_series_query, choose_date_bucket, prepare_chart_table
+    )
+    
+    first_page = view["first_page"]
+    total_rows = view["total_rows"] or first_page.num_rows
+    inner_query = view["inner_query"]
+    if total_rows <= first_page.num_rows or inner_query is None:
+        table, _ = prepare_chart_table(first_page, spec)
+        note = None
+        if total_rows > first_page.num_rows:
+            note = f"Chart shows the first {first_page.num_rows:,} of {total_rows:,} rows."
+        return table, note
+    
+    target = find_target(view["target"]) or get_active_target()
+    try:
+        with target.read_connection(fresh=use_fresh_data()) as conn:
+            cursor = conn.cursor()
+            if spec["x_kind"] == "temporal":
+                cursor.execute(build_range_query(inner_query, spec["x"]))
+                low, high = cursor.fetchone()
+                span = (high - low).total_seconds() if low is not None and high is not None else 0
+                is_timestamp = pa.types.is_timestamp(first_page.schema.field(spec["x"]).type)
+                bucket, template = choose_date_bucket(span, is_timestamp)
+                cursor.execute(build_bucket_query(inner_query, spec["x"], spec["y"], template))
+                note = f"Averaged per {bucket} on the server ({total_rows:,} rows)."
+            elif spec["x_kind"] == "category":
+                cursor.execute(build_category_query(inner_query, spec["x"], spec["y"]))
+                note = f"Averaged per {spec['x']} on the server; top {MAX_BAR_CATEGORIES} shown."
             else:
-                db_server = selected_server
-            
-            # Database Name
-            db_name = st.text_input(
-                "Database Name",
-                value=config.DB_NAME or "SchoolDB",
-                placeholder="SchoolDB"
-            )
-            
-            # Username
-            db_username = st.text_input(
-                "Username",
-                value=config.DB_USERNAME or "",
-                placeholder="Enter database username"
-            )
-            
-            # Password
-            db_password = st.text_input(
-                "Password",
-                value=config.DB_PASSWORD or "",
-                type="password",
-                placeholder="Enter database password"
-            )
-        
-        # Apply configuration button
-        if st.button("💾 Apply Configuration", type="primary"):
-            # Update config module with new values
-            config.AZURE_OPENAI_ENDPOINT = azure_endpoint
-            config.AZURE_OPENAI_DEPLOYMENT = azure_deployment
-            config.AZURE_OPENAI_API_KEY = azure_api_key
-            config.DB_SERVER = db_server
-            config.DB_NAME = db_name
-            config.DB_USERNAME = db_username
-            config.DB_PASSWORD = db_password
-            
-            # Rebuild connection string
-            config.CONNECTION_STRING = config.build_connection_string(
-                db_server, db_name, db_username, db_password
-            )
-            
-            # Reinitialize OpenAI client in session state
-            try:
-                st.session_state.openai_client = AzureOpenAI(
-                    api_key=azure_api_key,
-                    api_version=config.AZURE_OPENAI_API_VERSION,
-                    azure_endpoint=azure_endpoint
-                )
-            except Exception as e:
-                st.error(f"Failed to initialize OpenAI client: {e}")
-                st.stop()
-            
-            # Clear schema cache to reload with new DB connection
-            st.cache_data.clear()
-            st.session_state.config_updated = True
-            st.success("✅ Configuration updated successfully!")
-            st.rerun()
-        
-        st.markdown("---")
-        
-        # Current Configuration Display
-        with st.expander("📊 Current Active Configuration", expanded=False):
-            st.write(f"**Endpoint:** {config.AZURE_OPENAI_ENDPOINT}")
-            st.write(f"**Model:** {config.AZURE_OPENAI_DEPLOYMENT}")
-            st.write(f"**Database:** {config.DB_NAME} on {config.DB_SERVER}")
-        
-        # Add refresh schema button
-        if st.button("🔄 Refresh Database Schema"):
-            st.cache_data.clear()
-            st.success("Schema cache cleared! Schema will be refreshed on next query.")
-        
-        st.markdown("---")
-        st.write("Enter a natural language question below. Press Enter to send. The assistant will generate a SQL SELECT query, execute it against the database, and summarize the results.")
-        st.info("💡 The database schema is automatically retrieved and cached. Click 'Refresh Database Schema' if you've made changes to your database structure.")
-        
-        # Add expandable section to view the retrieved schema
-        with st.expander("📋 View Retrieved Database Schema"):
-            current_schema = get_database_schema(
-                config.CONNECTION_STRING,
-                config.DB_SERVER,
-                config.DB_NAME
-            )
-            st.code(current_schema, language="text")
-
-    # Get dynamic description based on tables
-    dynamic_description = get_dynamic_app_description()
-    st.write(dynamic_description)
-
-    # Initialize chat history in session_state with dynamic welcome message
-    if "messages" not in st.session_state:
-        dynamic_welcome = get_dynamic_welcome_message()
-        st.session_state.messages = [
-            {"role": "assistant", "content": dynamic_welcome}
-        ]
-    
-    # Limit chat history to prevent memory issues
-    if len(st.session_state.messages) > MAX_CHAT_MESSAGES:
-        # Keep first (welcome) + last N messages
-        st.session_state.messages = [
-            st.session_state.messages[0]
-        ] + st.session_state.messages[-(MAX_CHAT_MESSAGES-1):]
+                cursor.execute(build_series_query(inner_query, spec["x"], spec["y"]))
+                note = None
+            table = fetch_arrow_table(cursor, max_rows=CHART_FETCH_LIMIT)
+            cursor.close()
+    except pyodbc.Error as e:
+        return {"error": f"Chart query failed: {str(e)}"}
+    
+    table, fetched_rows = prepare_chart_table(table, spec)
+    if note is None:
+        note = f"Downsampled from {fetched_rows:,} to {table.num_rows:,} points (LTTB)."
+        if fetched_rows < total_rows:
+            note += f" Only the first {fetched_rows:,} rows were read."
+    return table, note
 
-    # Display chat history
-    for message in st.session_state.messages:
-        role = message.get("role", "assistant")
-        content = message.get("content", "")
-        with st.chat_message(role):
-            # content can be plain text or markdown
-            st.markdown(content)
 
-    # Use Streamlit's chat_input so Enter submits the prompt
-    if prompt := st.chat_input("Type your question and press Enter"):
-        # Append user message to history
-        st.session_state.messages.append({"role": "user", "content": prompt})
+def render_chart(view):
+    """
+    Chart a results view when its column types suit a chart.
+    The chart data is fetched once per view and kept with it.
+    
+    Args:
+        view (dict): Viewer state from create_results_view()
+    """
+    from charts import infer_chart
+    
+    spec = infer_chart(view["first_page"].schema)
+    if spec is None or view["first_page"].num_rows < 2:
+        return
+    if not st.toggle("📈 Show chart", value=True, key=f"view_{view['id']}_chart"):
+        return
+    
+    if "chart" not in view:
+        view["chart"] = fetch_chart_data(view, spec)
+    chart = view["chart"]
+    if isinstance(chart, dict):
+        st.warning(chart["error"])
+        return
+    
+    table, note = chart
+    if spec["type"] == "bar":
+        st.bar_chart(table, x=spec["x"], y=spec["y"])
+    else:
+        st.line_chart(table, x=spec["x"], y=spec["y"])
+    if note:
+        st.caption(f"📈 {note}")
 
-        # Display the user's message immediately
+
+def render_results_viewer(view):
+    """
+    Render a paginated results table.
+    Results that fit on one page are shown directly; larger results get
+    server-side paging, sorting and filtering controls.
+    
+    Args:
+        view (dict): Viewer state from create_results_view()
+    """
+    first_page = view["first_page"]
+    total_rows = view["total_rows"] or first_page.num_rows
+    
+    # Arrow tables go to st.dataframe as-is, keeping native column types
+    if total_rows <= first_page.num_rows:
+        st.dataframe(first_page, use_container_width=True)
+        return
+    
+    if view["inner_query"] is None:
+        st.warning(f"⚠️ Showing first {first_page.num_rows} of {total_rows} results (paging is not available for this query)")
+        st.dataframe(first_page, use_container_width=True)
+        return
+    
+    key = f"view_{view['id']}"
+    columns = view["columns"]
+    
+    sort_col, direction_col, filter_col, filter_text_col = st.columns([3, 2, 3, 3])
+    sort_choice = sort_col.selectbox("Sort by", ["(query order)"] + view["tiebreak_columns"], key=f"{key}_sort")
+    descending = direction_col.checkbox("Descending", key=f"{key}_desc")
+    filter_choice = filter_col.selectbox("Filter column", ["(none)"] + columns, key=f"{key}_filter_column")
+    filter_text = filter_text_col.text_input("Contains", key=f"{key}_filter_text")
+    
+    sort_column = None if sort_choice == "(query order)" else sort_choice
+    filter_column = None if filter_choice == "(none)" else filter_choice
+    filter_text = filter_text.strip() if filter_column else ""
+    
+    # Go back to the first page whenever sorting or filtering changes
+    page_state = (sort_column, descending, filter_column, filter_text)
+    if st.session_state.get(f"{key}_state") != page_state:
+        st.session_state[f"{key}_state"] = page_state
+        st.session_state[f"{key}_page"] = 0
+    page = st.session_state.get(f"{key}_page", 0)
+    
+    if page == 0 and page_state == (None, False, None, ""):
+        rows, filtered_total = first_page, total_rows
+    else:
+        page_result = fetch_results_page(view, page, sort_column, descending, filter_column, filter_text)
+        if isinstance(page_result, dict):
+            st.error(page_result["error"])
+            return
+        rows, filtered_total = page_result
+    
+    page_count = max(1, -(-filtered_total // RESULT_PAGE_SIZE))
+    if rows.num_rows:
+        st.dataframe(rows, use_container_width=True)
+    else:
+        st.info("No rows match the filter.")
+    
+    def go_to_page(new_page):
+        st.session_state[f"{key}_page"] = new_page
+    
+    prev_col, info_col, next_col = st.columns([1, 4, 1])
+    prev_col.button("◀ Prev", key=f"{key}_prev", disabled=page == 0, on_click=go_to_page, args=(page - 1,))
+    next_col.button("Next ▶", key=f"{key}_next", disabled=page >= page_count - 1, on_click=go_to_page, args=(page + 1,))
+    first_row = page * RESULT_PAGE_SIZE + 1 if rows.num_rows else 0
+    info_col.caption(
+        f"Page {page + 1} of {page_count} · rows {first_row:,}–{page * RESULT_PAGE_SIZE + rows.num_rows:,} of {filtered_total:,}"
+    )
+
+
+def discard_export():
+    """Delete this session's export file"""
+    export = st.session_state.pop("last_export", None)
+    if export:
+        get_session_memory().discard(get_memory_session_id(), export["file_key"])
+
+
+def render_export_controls(view):
+    """
+    Render the full-result export for a query (CSV or Parquet download).
+    The query is re-run and streamed to a compressed file, so the export is
+    not limited to the rows shown on screen.
+    
+    Args:
+        view (dict): Viewer state from create_results_view()
+    """
+    from export import EXPORT_FORMATS, export_query
+    
+    key = f"export_{view['id']}"
+    format_col, button_col = st.columns([3, 2])
+    export_format = format_col.selectbox(
+        "Export full results", list(EXPORT_FORMATS.keys()), key=f"{key}_format", label_visibility="collapsed"
+    )
+    
+    if button_col.button("📥 Export full results", key=f"{key}_run"):
+        is_safe, error_msg = validate_query_safety(view["query"])
+        if not is_safe:
+            st.error(f"🛡️ Security: {error_msg}")
+            return
+        
+        # Remove this session's previous export file
+        discard_export()
+        
+        progress_bar = st.progress(0.0, text="Starting export...")
+        total_rows = view.get("total_rows") or 0
+        
+        def show_progress(rows_written, rows_per_second):
+            fraction = min(rows_written / total_rows, 1.0) if total_rows else 0.0
+            progress_bar.progress(fraction, text=f"Exported {rows_written:,} rows · {rows_per_second:,.0f} rows/sec")
+        
+        try:
+            target = find_target(view["target"]) or get_active_target()
+            with target.read_connection(fresh=use_fresh_data()) as conn:
+                cursor = conn.cursor()
+                stats = export_query(cursor, view["query"], export_format, progress_callback=show_progress)
+                cursor.close()
+        except Exception as e:
+            progress_bar.empty()
+            st.error(f"Export failed: {e}")
+            return
+        
+        progress_bar.progress(1.0, text=f"Exported {stats['rows']:,} rows · {stats['rows_per_second']:,.0f} rows/sec")
+        stats["view_id"] = view["id"]
+        stats["file_name"] = f"query_results_{view['id']}{EXPORT_FORMATS[export_format][1]}"
+        # Deleted by the next export, or with the session's memory when it expires
+        stats["file_key"] = get_session_memory().add_file(get_memory_session_id(), stats["path"])
+        st.session_state.last_export = stats
+    
+    export = st.session_state.get("last_export")
+    if export and export["view_id"] == view["id"] and os.path.exists(export["path"]):
+        def read_export(path=export["path"]):
+            with open(path, "rb") as file:
+                return file.read()
+        
+        # Deferred: the file is only read when the button is clicked, not on every rerun
+        st.download_button(
+            f"⬇️ Download {export['file_name']} ({export['bytes'] / 1024 / 1024:.1f} MB)",
+            data=read_export,
+            file_name=export["file_name"],
+            key=f"{key}_download",
+            on_click="ignore"
+        )
+        st.caption(
+            f"{export['rows']:,} rows in {export['seconds']:.1f}s ({export['rows_per_second']:,.0f} rows/sec)"
+        )
+
+
+@st.cache_resource
+def get_chat_store():
+    """Get the persistent chat history store shared by all sessions"""
+    return ChatStore(config.CHAT_DB_PATH)
+
+
+def get_user_id():
+    """
+    Identify the owner of the conversations.
+    With Streamlit authentication (st.login) configured, it's the signed-in user.
+    Otherwise it's a random token kept in the `user` URL parameter: the
+    conversations belong to whoever has the link, so it can't be guessed, but
+    it is not a login. Anything that isn't such a token gets a new one.
+    """
+    if st.user.get("is_logged_in"):
+        return f"auth:{st.user.get('email') or st.user.get('sub')}"
+    token = st.query_params.get("user", "")
+    if len(token) < USER_TOKEN_LENGTH or not all(char.isalnum() or char in "-_" for char in token):
+        token = secrets.token_urlsafe(USER_TOKEN_LENGTH * 3 // 4)
+        st.query_params["user"] = token
+    return token
+
+
+def load_chat_window():
+    """Load the most recent window of the current conversation into session state"""
+    store = get_chat_store()
+    session_id = st.session_state.chat_session_id
+    st.session_state.messages = store.load_messages(session_id, st.session_state.chat_window)
+    st.session_state.chat_message_count = store.count_messages(session_id)
+
+
+def ensure_chat_session():
+    """
+    Attach this browser session to a persistent conversation.
+    The conversation ID is kept in the `session` URL parameter so a reload
+    continues the same conversation.
+    """
+    store = get_chat_store()
+    user_id = get_user_id()
+    session_id = st.query_params.get("session")
+    
+    if "messages" in st.session_state and st.session_state.get("chat_session_id") == session_id:
+        return
+    
+    if not session_id or not store.session_exists(session_id, user_id):
+        session_id = store.create_session(user_id)
+        st.query_params["session"] = session_id
+    
+    st.session_state.chat_session_id = session_id
+    st.session_state.chat_window = CHAT_WINDOW_SIZE
+    st.session_state.results_view = None
+    st.session_state.suggestions = None
+    load_chat_window()
+    
+    if not st.session_state.messages:
+        add_chat_message("assistant", get_dynamic_welcome_message())
+
+
+def add_chat_message(role, content, result_table=None, results_view=None):
+    """
+    Append a message to the conversation (persisted immediately).
+    
+    Args:
+        role (str): "user" or "assistant"
+        content (str): Markdown content
+        result_table (pa.Table): Result table stored with the message (optional)
+        results_view (str): ID of the live results viewer for this message (optional)
+    """
+    message = get_chat_store().append_message(
+        st.session_state.chat_session_id, role, content, result_table
+    )
+    if results_view:
+        message["results_view"] = results_view
+    st.session_state.messages.append(message)
+    st.session_state.chat_message_count += 1
+    
+    # Keep only the rendered window in memory
+    if len(st.session_state.messages) > st.session_state.chat_window:
+        st.session_state.messages = st.session_state.messages[-st.session_state.chat_window:]
+
+
+def render_stored_result(message):
+    """
+    Render the stored result table of an earlier message.
+    The Parquet blob is only loaded when the user asks to see it.
+    
+    Args:
+        message (dict): Message with "result_id" and "row_count"
+    """
+    if st.toggle(f"📊 Show results ({message['row_count']:,} rows)", key=f"stored_result_{message['message_id']}"):
+        table = get_chat_store().load_result(message["result_id"])
+        if table is None:
+            st.info("Stored results are no longer available.")
+        else:
+            st.dataframe(table, use_container_width=True)
+
+
+def render_conversation_list():
+    """Render the user's recent conversations with a button to start a new one"""
+    store = get_chat_store()
+    if st.button("➕ New conversation"):
+        st.query_params["session"] = store.create_session(get_user_id())
+        st.rerun()
+    
+    current_session = st.session_state.get("chat_session_id")
+    for session in store.list_sessions(get_user_id()):
+        title = session["title"] or "New conversation"
+        if len(title) > 40:
+            title = title[:37] + "..."
+        if st.button(
+            title,
+            key=f"session_{session['session_id']}",
+            disabled=session["session_id"] == current_session,
+            use_container_width=True
+        ):
+            st.query_params["session"] = session["session_id"]
+            st.rerun()
+
+
+def select_database(name):
+    """
+    Switch this session to another database (configured or its own).
+    Nothing is cleared: the database's schema, generated SQL and results stay cached.
+    
+    Args:
+        name (str): Registered database target name
+    """
+    st.session_state.db_target = name
+    st.session_state.results_view = None
+    st.session_state.suggestions = None
+    st.session_state.pop("app_description_key", None)
+
+
+def load_server_workload_stats(target):
+    """
+    Read plan statistics and missing-index suggestions from the server's DMVs.
+    
+    Args:
+        target (DatabaseTarget): Database
+        
+    Returns:
+        tuple: (plan_rows, missing_index_rows, error) - error is None on success
+    """
+    import pyodbc
+    from index_advisor import PLAN_STATS_QUERY, MISSING_INDEX_QUERY
+    
+    try:
+        with target.read_connection(fresh=use_fresh_data()) as conn:
+            cursor = conn.cursor()
+            cursor.execute(PLAN_STATS_QUERY)
+            plan_rows = cursor.fetchall()
+            cursor.execute(MISSING_INDEX_QUERY)
+            missing_rows = cursor.fetchall()
+            cursor.close()
+        return plan_rows, missing_rows, None
+    except pyodbc.Error as e:
+        return [], [], str(e)
+
+
+@st.dialog("📈 Query Workload Analyzer", width="large")
+def render_workload_analyzer():
+    """
+    Show the hot queries of the active database with index suggestions.
+    Plan statistics and missing-index DMVs need VIEW SERVER STATE; without it
+    (or when the DMVs have no suggestions) the index suggestions come from the
+    logged workload alone.
+    """
+    from workload_log import get_workload_log
+    from index_advisor import match_plan_stats, missing_index_suggestions, heuristic_index_suggestions
+    
+    target = get_active_target()
+    workload_log = get_workload_log()
+    if workload_log is None:
+        st.error("The workload log is not available.")
+        return
+    by_total = workload_log.top_queries(target.name, order_by="total")
+    if not by_total:
+        st.info("No queries have been logged for this database yet.")
+        return
+    by_count = workload_log.top_queries(target.name, order_by="count")
+    
+    columns = ["query", "runs", "total_ms", "avg_ms", "max_ms", "avg_rows", "errors", "tables"]
+    total_tab, count_tab, plan_tab, index_tab = st.tabs(
+        ["Top by total time", "Top by frequency", "Plan statistics", "Index suggestions"]
+    )
+    with total_tab:
+        st.dataframe([{column: entry[column] for column in columns} for entry in by_total], use_container_width=True)
+    with count_tab:
+        st.dataframe([{column: entry[column] for column in columns} for entry in by_count], use_container_width=True)
+    
+    plan_rows, missing_rows, error = load_server_workload_stats(target)
+    workload = list({entry["fingerprint"]: entry for entry in by_total + by_count}.values())
+    with plan_tab:
+        if error:
+            st.warning(f"Plan statistics are not available (VIEW SERVER STATE is required): {error}")
+        else:
+            matched = match_plan_stats(plan_rows, workload)
+            if matched:
+                st.dataframe([
+                    {
+                        "query": entry["query"],
+                        "executions": entry["executions"],
+                        "server_total_ms": round(entry["server_total_ms"], 1),
+                        "server_cpu_ms": round(entry["server_cpu_ms"], 1),
+                        "logical_reads": entry["logical_reads"],
+                    }
+                    for entry in matched
+                ], use_container_width=True)
+            else:
+                st.info("None of the logged queries are in the server's plan cache right now.")
+    
+    with index_tab:
+        suggestions = missing_index_suggestions(missing_rows)
+        if not suggestions:
+            # No DMV access (or nothing there): fall back to the logged workload
+            suggestions = heuristic_index_suggestions(workload, get_database_schema(target))
+            if suggestions:
+                st.caption("Suggested from the logged workload (the missing-index DMVs have no suggestions).")
+        if not suggestions:
+            st.info("No index suggestions for the logged workload.")
+        for suggestion in suggestions:
+            st.code(suggestion["statement"], language="sql")
+            st.caption(suggestion["reason"])
+
+
+@st.dialog("🧠 Memory Diagnostics", width="large")
+def render_memory_diagnostics():
+    """
+    Show process memory, the session memory budgets and what each session holds
+    (sessions are listed by an anonymous ID prefix).
+    """
+    memory = get_session_memory()
+    memory.sweep(force=True)
+    stats = memory.stats()
+    usage = process_memory()
+    
+    def megabytes(size):
+        return "n/a" if size is None else f"{size / MB:,.1f} MB"
+    
+    process_col, peak_col, cached_col, spilled_col = st.columns(4)
+    process_col.metric("Process memory", megabytes(usage["rss"]))
+    peak_col.metric("Peak", megabytes(usage["peak"]))
+    cached_col.metric(
+        "Cached results", megabytes(stats["memory_bytes"]),
+        help=f"In memory across all sessions (budget {megabytes(stats['total_budget'])})"
+    )
+    spilled_col.metric(
+        "Spilled to disk", megabytes(stats["spilled_bytes"]),
+        help=f"{stats['spill_count']:,} spills so far, in {stats['spill_dir']}"
+    )
+    st.caption(
+        f"Per-session budget {megabytes(stats['session_budget'])} · "
+        f"cached results of sessions idle for {stats['idle_spill_after'] / 60:.0f} min are spilled, "
+        f"and released after {stats['idle_timeout'] / 60:.0f} min · "
+        "the rest of a session's state is only measured while it is active"
+    )
+    
+    st.markdown("**This session's state**")
+    state_sizes = sorted(
+        ((key, estimate_size(st.session_state[key])) for key in st.session_state.keys()),
+        key=lambda item: item[1], reverse=True
+    )
+    st.dataframe(
+        [{"key": key, "size_kb": round(size / 1024, 1)} for key, size in state_sizes[:15]],
+        use_container_width=True
+    )
+    
+    st.markdown("**Sessions**")
+    current_session = get_memory_session_id()
+    st.dataframe([
+        {
+            "session": entry["session"][:8] + (" (this one)" if entry["session"] == current_session else ""),
+            "idle_seconds": entry["idle_seconds"],
+            "state_mb": round(entry["state_bytes"] / MB, 2),
+            "cached_mb": round(entry["memory_bytes"] / MB, 2),
+            "spilled_mb": round(entry["spilled_bytes"] / MB, 2),
+            "results": entry["artifacts"],
+        }
+        for entry in stats["sessions"]
+    ], use_container_width=True)
+
+
+@st.fragment
+def render_sidebar():
+    """
+    Render the configuration sidebar.
+    Runs as a fragment: interacting with sidebar widgets reruns only the sidebar,
+    not the chat. Applying a configuration triggers a full rerun.
+    """
+    st.header("⚙️ Configuration")
+    
+    # Initialize session state for configuration if not exists
+    if 'config_updated' not in st.session_state:
+        st.session_state.config_updated = False
+    
+    # Switch this session's database; every database keeps its own warm caches
+    active_target = get_active_target()
+    target_names = list_session_targets()
+    selected_target = st.selectbox(
+        "🗄️ Database",
+        options=target_names,
+        index=target_names.index(active_target.name)
+    )
+    if selected_target != active_target.name:
+        select_database(selected_target)
+        st.rerun()
+    
+    if active_target.replicas:
+        st.toggle(
+            "⚡ Fresh data (query the primary)",
+            key="fresh_data",
+            help="Queries normally run on a read replica, which can lag slightly behind the primary."
+        )
+    
+    st.session_state.setdefault("prefetch_suggestions", config.SPECULATIVE_PREFETCH)
+    st.toggle(
+        "🔮 Prefetch suggested questions",
+        key="prefetch_suggestions",
+        help="Generates and runs the SQL of suggested follow-ups in the background, "
+             "so clicking one answers instantly. Uses extra AI calls (limited per hour)."
+    )
+    
+    ai_settings = get_ai_settings()
+    with st.expander("🔧 Azure OpenAI Settings", expanded=False):
+        # Azure Endpoint dropdown with custom option
+        default_endpoint = ai_settings["endpoint"] if ai_settings["endpoint"] in ENDPOINT_OPTIONS else "Custom..."
+        selected_endpoint = st.selectbox(
+            "Azure Endpoint",
+            options=ENDPOINT_OPTIONS,
+            index=ENDPOINT_OPTIONS.index(default_endpoint) if default_endpoint in ENDPOINT_OPTIONS else 0
+        )
+        
+        if selected_endpoint == "Custom...":
+            azure_endpoint = st.text_input(
+                "Enter Custom Endpoint",
+                value=ai_settings["endpoint"] or "",
+                placeholder="https://your-endpoint.openai.azure.com"
+            )
+        else:
+            azure_endpoint = selected_endpoint
+        
+        # Model/Deployment dropdown with custom option
+        default_model = ai_settings["deployment"] if ai_settings["deployment"] in MODEL_OPTIONS else "Custom..."
+        selected_model = st.selectbox(
+            "Model / Deployment",
+            options=MODEL_OPTIONS,
+            index=MODEL_OPTIONS.index(default_model) if default_model in MODEL_OPTIONS else 0
+        )
+        
+        if selected_model == "Custom...":
+            azure_deployment = st.text_input(
+                "Enter Custom Model/Deployment",
+                value=ai_settings["deployment"] or "",
+                placeholder="your-deployment-name"
+            )
+        else:
+            azure_deployment = selected_model
+        
+        # API Key input
+        azure_api_key = st.text_input(
+            "Azure OpenAI API Key",
+            value=ai_settings["api_key"] or "",
+            type="password",
+            placeholder="Enter your API key"
+        )
+    
+    with st.expander("🗄️ Database Settings", expanded=False):
+        # Database Server dropdown with custom option
+        default_server = active_target.server if active_target.server in SERVER_OPTIONS else "Custom..."
+        selected_server = st.selectbox(
+            "Database Server",
+            options=SERVER_OPTIONS,
+            index=SERVER_OPTIONS.index(default_server) if default_server in SERVER_OPTIONS else 0
+        )
+        
+        if selected_server == "Custom...":
+            db_server = st.text_input(
+                "Enter Custom Server",
+                value=active_target.server or "",
+                placeholder="server-name or IP address"
+            )
+        else:
+            db_server = selected_server
+        
+        # Database Name
+        db_name = st.text_input(
+            "Database Name",
+            value=active_target.database or "SchoolDB",
+            placeholder="SchoolDB"
+        )
+        
+        # Username
+        db_username = st.text_input(
+            "Username",
+            value=active_target.username or "",
+            placeholder="Enter database username"
+        )
+        
+        # Password (never sent back to the browser; blank keeps the current one)
+        db_password = st.text_input(
+            "Password",
+            value="",
+            type="password",
+            placeholder="Unchanged"
+        )
+        
+        # Read replicas
+        db_replicas = st.text_input(
+            "Read Replicas (optional)",
+            value=", ".join(active_target.replicas),
+            placeholder="replica1, replica2"
+        )
+    
+    # Apply configuration button
+    if st.button("💾 Apply Configuration", type="primary"):
+        # AI settings for this session only (other sessions keep theirs)
+        st.session_state.ai_settings = {
+            "endpoint": azure_endpoint, "deployment": azure_deployment, "api_key": azure_api_key
+        }
+        
+        # Add the database for this session and switch to it (other sessions are unaffected)
+        replicas = [host.strip() for host in db_replicas.split(",") if host.strip()]
+        target = add_session_target(
+            f"{db_name} on {db_server}", db_server, db_name, db_username, db_password or active_target.password, replicas
+        )
+        
+        # Reinitialize OpenAI client in session state
+        try:
+            st.session_state.openai_client = get_async_openai_client(
+                azure_api_key, azure_endpoint, config.AZURE_OPENAI_API_VERSION
+            )
+        except Exception as e:
+            st.error(f"Failed to initialize OpenAI client: {e}")
+            st.stop()
+        
+        select_database(target.name)
+        st.session_state.config_updated = True
+        st.success("✅ Configuration updated successfully!")
+        st.rerun()
+    
+    st.markdown("---")
+    
+    with st.expander("💬 Conversations", expanded=False):
+        render_conversation_list()
+    
+    # Current Configuration Display
+    with st.expander("📊 Current Active Configuration", expanded=False):
+        st.write(f"**Endpoint:** {ai_settings['endpoint']}")
+        st.write(f"**Model:** {ai_settings['deployment']}")
+        st.write(f"**Database:** {active_target.database} on {active_target.server}")
+        for host, is_healthy in active_target.replica_status():
+            st.write(f"**Read replica:** {host} {'🟢' if is_healthy else '🔴 (skipped)'}")
+    
+    # Add refresh schema button (only the active database's caches are cleared)
+    if st.button("🔄 Refresh Database Schema"):
+        active_target.clear_caches()
+        st.session_state.pop("app_description_key", None)
+        st.success("Schema cache cleared! Schema will be refreshed on next query.")
+    
+    if st.button("📈 Query Workload Analyzer"):
+        render_workload_analyzer()
+    
+    if st.button("🧠 Memory Diagnostics"):
+        render_memory_diagnostics()
+    
+    st.markdown("---")
+    st.write("Enter a natural language question below. Press Enter to send. The assistant will generate a SQL SELECT query, execute it against the database, and summarize the results.")
+    st.info("💡 The database schema is automatically retrieved and cached. Click 'Refresh Database Schema' if you've made changes to your database structure.")
+    
+    # The schema is only loaded when the user asks to see it
+    if st.toggle("📋 View Retrieved Database Schema"):
+        current_schema = get_database_schema()
+        st.code(current_schema, language="text")
+
+
+def run_query_job(job, user_prompt, query, target, fresh, client, deployment):
+    """
+    Body of a background query job: execute the query (repairing it if needed)
+    and count its rows. Runs on a worker thread, so it gets everything it needs
+    as arguments and must not touch st.session_state. The job is shared by every
+    session that submits the same SQL, so repairs use the first submitter's
+    question (the SQL, not the wording, is what they fix).
+    
+    Args:
+        job (QueryJob): The job (progress and cancellation)
+        user_prompt (str): User's question (of the first submitter)
+        query (str): Generated SQL query
+        target (DatabaseTarget): Database to query
+        fresh (bool): Read from the primary
+        client: OpenAI client for repairs
+        deployment (str): Model deployment for repairs
+        
+    Returns:
+        dict: {"results_table", "query", "repairs", "total_rows"} or error dict
+    """
+    # Only the first page is fetched (as Arrow); later pages are fetched on demand
+    results_table, query, repairs = execute_with_repair(
+        user_prompt, query, max_rows=RESULT_PAGE_SIZE, as_arrow=True,
+        target=target, fresh=fresh, client=client, job=job, deployment=deployment
+    )
+    if isinstance(results_table, dict) and "error" in results_table:
+        return results_table
+    
+    # A full first page means there may be more rows - count them on the server
+    total_rows = results_table.num_rows
+    if total_rows >= RESULT_PAGE_SIZE:
+        total_rows = count_query_rows(query, target=target, fresh=fresh, job=job) or total_rows
+    return {"results_table": results_table, "query": query, "repairs": repairs, "total_rows": total_rows}
+
+
+def start_query_job(user_prompt, query, conversation=None):
+    """
+    Run a generated query as a background job for this session.
+    The job ID is kept in the `job` URL parameter, so a reload or reconnect
+    picks up the running (or finished) job instead of running the query again.
+    
+    Args:
+        user_prompt (str): User's question
+        query (str): Generated SQL query
+        conversation (str): Conversation key of the question (optional, see get_conversation_key)
+        
+    Returns:
+        QueryJob: The job (an existing one if the same query is already running or recently finished)
+    """
+    from query_jobs import get_job_manager
+    
+    target = get_active_target()
+    fresh = use_fresh_data()
+    client = get_openai_client()
+    deployment = get_ai_deployment()
+    job = get_job_manager().submit(
+        (target.key, query, fresh),
+        lambda job: run_query_job(job, user_prompt, query, target, fresh, client, deployment),
+        context={"prompt": user_prompt, "target": target.name},
+        reuse_finished=not fresh,
+        waiter=get_memory_session_id()
+    )
+    st.session_state.pending_job = {"id": job.id, "prompt": user_prompt, "conversation": conversation}
+    st.query_params["job"] = job.id
+    return job
+
+
+def get_pending_job():
+    """
+    Get this session's background query job.
+    
+    Returns:
+        tuple: (job, user_prompt), or (None, None) if no job is pending
+    """
+    from query_jobs import get_job_manager
+    
+    pending = st.session_state.get("pending_job")
+    if pending is None and st.query_params.get("job"):
+        # Reconnected while a job was running
+        pending = {"id": st.query_params["job"], "prompt": None}
+    if pending is None:
+        return None, None
+    
+    job = get_job_manager().get(pending["id"])
+    if job is None:
+        clear_pending_job()
+        return None, None
+    # Also after a reconnect (a new session picking the job up from the URL)
+    job.add_waiter(get_memory_session_id())
+    st.session_state.pending_job = pending
+    return job, pending["prompt"] or job.context.get("prompt", "")
+
+
+def clear_pending_job():
+    """Forget this session's background query job"""
+    st.session_state.pop("pending_job", None)
+    if "job" in st.query_params:
+        del st.query_params["job"]
+
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def render_job_progress(job_id):
+    """
+    Show a running job's elapsed time and rows fetched, with a cancel button.
+    Polls as a fragment, so only this element reruns until the job finishes.
+    
+    Args:
+        job_id (str): Job ID
+    """
+    from query_jobs import get_job_manager
+    
+    job = get_job_manager().get(job_id)
+    if job is None or job.is_finished or st.session_state.get("pending_job") is None:
+        # Show the answer (or this session's cancellation)
+        st.rerun()
+    
+    if job.cancel_requested:
+        st.info(f"⏹️ Cancelling query... ({job.elapsed:.0f}s)")
+        return
+    state = "Waiting for a free worker..." if job.status == "queued" else "Executing SQL query..."
+    st.info(f"⏳ {state} {job.elapsed:.0f}s elapsed · {job.rows_fetched:,} rows fetched")
+    st.button("⏹️ Cancel query", key=f"cancel_{job_id}", on_click=cancel_pending_job, args=(job,))
+
+
+def cancel_pending_job(job):
+    """
+    Stop waiting for this session's job (Cancel button callback).
+    The query itself is only cancelled if no other session joined it.
+    
+    Args:
+        job (QueryJob): The pending job
+    """
+    job.leave(get_memory_session_id())
+    add_chat_message("assistant", f"⏹️ Query cancelled after {job.elapsed:.0f}s.")
+    clear_pending_job()
+
+
+def get_memory_session_id():
+    """ID of this browser session in the session memory manager"""
+    if "memory_session_id" not in st.session_state:
+        st.session_state.memory_session_id = uuid.uuid4().hex
+    return st.session_state.memory_session_id
+
+
+def track_session_memory():
+    """
+    Account this session's memory (once per script run) and apply the budgets.
+    A session idle past the timeout has lost its cached results, so its
+    references to them are dropped too. A long history (after "Load older
+    messages") goes back to the latest window once it outgrows
+    HISTORY_MEMORY_BUDGET; older messages stay in the chat store.
+    """
+    memory = get_session_memory()
+    session_id = get_memory_session_id()
+    now = time.time()
+    last_active = st.session_state.get("last_active")
+    if last_active is not None and now - last_active > memory.idle_timeout:
+        memory.expire(session_id)
+        st.session_state.recent_results = []
+        st.session_state.results_view = None
+        st.session_state.suggestions = None
+        if st.session_state.chat_window > CHAT_WINDOW_SIZE:
+            st.session_state.chat_window = CHAT_WINDOW_SIZE
+            load_chat_window()
+    st.session_state.last_active = now
+    
+    if st.session_state.chat_window > CHAT_WINDOW_SIZE and estimate_size(st.session_state.messages) > HISTORY_MEMORY_BUDGET:
+        st.session_state.chat_window = CHAT_WINDOW_SIZE
+        st.session_state.messages = st.session_state.messages[-CHAT_WINDOW_SIZE:]
+    
+    memory.touch(session_id, estimate_size({key: st.session_state[key] for key in st.session_state.keys()}))
+    memory.sweep()
+
+
+def keep_recent_result(user_prompt, query, target_name, frame):
+    """
+    Add a DataFrame to the session's recent results for follow-up refinements.
+    The frame is held by the session memory manager (which may spill it to disk);
+    only the FOLLOWUP_CACHE_SIZE most recent results are kept per session.
+    """
+    memory = get_session_memory()
+    session_id = get_memory_session_id()
+    recent = st.session_state.setdefault("recent_results", [])
+    recent.append({
+        "prompt": user_prompt, "query": query, "target": target_name,
+        "frame_key": memory.put(session_id, frame)
+    })
+    for entry in recent[:-FOLLOWUP_CACHE_SIZE]:
+        memory.discard(session_id, entry["frame_key"])
+    del recent[:-FOLLOWUP_CACHE_SIZE]
+
+
+def remember_result(user_prompt, query, results_table, target_name):
+    """
+    Keep a complete result as a DataFrame for follow-up refinements.
+    
+    Args:
+        user_prompt (str): Question the result answers
+        query (str): SQL query that produced it
+        results_table (pa.Table): All rows of the result
+        target_name (str): Database the result came from
+        
+    Returns:
+        pd.DataFrame: The kept result
+    """
+    import pyarrow as pa
+    import pandas as pd
+    
+    frame = results_table.to_pandas()
+    # DECIMAL columns arrive as Decimal objects; refinements need them numeric
+    for index, field in enumerate(results_table.schema):
+        if pa.types.is_decimal(field.type):
+            frame.isetitem(index, pd.to_numeric(frame.iloc[:, index]).astype("float64"))
+    keep_recent_result(user_prompt, query, target_name, frame)
+    return frame
+
+
+def answer_followup(user_prompt):
+    """
+    Answer a refinement of a recent result (filter, sort, top N, group by) from the
+    session's cached DataFrames, without generating SQL or querying the database.
+    The newest result whose columns fit the refinement is used.
+    
+    Args:
+        user_prompt (str): User's question
+        
+    Returns:
+        bool: True if the question was answered, False if it needs SQL
+    """
+    import pyarrow as pa
+    from arrow_transport import arrow_to_records
+    
+    # Fresh data was asked for, so cached results don't qualify
+    if use_fresh_data():
+        return False
+    target_name = get_active_target().name
+    memory = get_session_memory()
+    for entry in reversed(st.session_state.get("recent_results", [])):
+        if entry["target"] != target_name:
+            continue
+        # Spilled results are loaded back; expired ones are skipped
+        source = memory.get(get_memory_session_id(), entry["frame_key"])
+        if source is None:
+            continue
+        steps = parse_refinement(user_prompt, source)
+        if not steps:
+            continue
+        try:
+            frame, descriptions = apply_refinement(source, steps)
+        except RefinementError:
+            continue
+        break
+    else:
+        return False
+    
+    results_table = pa.Table.from_pandas(frame, preserve_index=False)
+    results = arrow_to_records(results_table)
+    refinement = "; ".join(descriptions)
+    summary = summarize_locally(user_prompt, entry["query"], results) or (
+        f"Found {len(results):,} row(s) in the previous result for \"{entry['prompt']}\"."
+    )
+    
+    with st.chat_message("assistant"):
+        st.markdown(summary)
+        if results:
+            st.markdown("**Results:**")
+            st.dataframe(results_table, use_container_width=True)
+        st.markdown("**Refinement:**")
+        st.caption(f"{refinement} (applied to the previous result, no new query)")
+        st.code(entry["query"], language="sql")
+    
+    combined = f"{summary}\n\n**Refinement:** {refinement}\n\n**Based on SQL Query:**\n```sql\n{entry['query']}\n```"
+    add_chat_message("assistant", combined, result_table=results_table if results else None)
+    keep_recent_result(user_prompt, entry["query"], target_name, frame)
+    suggest_followups(user_prompt, frame)
+    return True
+
+
+def generate_speculative_sql(client, deployment, messages):
+    """
+    Generate SQL for a predicted question: one attempt, no retries (speculation is best effort).
+    Runs on a worker thread.
+    
+    Returns:
+        str: SQL query as generated (before fix_sql_syntax), or None
+    """
+    try:
+        ai_response = run_sync(complete(client, messages, temperature=0.3, stage="generate", deployment=deployment))
+    except Exception:
+        return None
+    query, needs_database = parse_ai_response(ai_response)
+    return query if needs_database else None
+
+
+def run_speculative_query(job, question, query, target, client, deployment, session_id, conversation):
+    """
+    Body of a prefetch job: run a predicted question's query (like run_query_job)
+    and summarize the result, so a click on its suggestion answers from cache.
+    The summary is only used by the session and conversation it was made for.
+    Cancelled after SPECULATION_TIMEOUT unless a user is waiting for it by then.
+    
+    Returns:
+        dict: Result of run_query_job() with a precomputed "summary", or error dict
+    """
+    import threading
+    from arrow_transport import arrow_to_records
+    from speculation import SPECULATION_TIMEOUT
+    
+    watchdog = threading.Timer(SPECULATION_TIMEOUT, lambda: job.background and job.cancel())
+    watchdog.daemon = True
+    watchdog.start()
+    try:
+        result = run_query_job(job, question, query, target, False, client, deployment)
+    finally:
+        watchdog.cancel()
+    if "error" not in result:
+        summary, encoding_report = generate_summary(
+            client, question, result["query"], arrow_to_records(result["results_table"]), result["total_rows"], deployment
+        )
+        result["summary"] = {
+            "prompt": question, "session": session_id, "conversation": conversation,
+            "text": summary, "encoding_report": encoding_report
+        }
+    return result
+
+
+def run_speculation(job, question, messages, cache_key, target, client, deployment, session_id):
+    """
+    Body of a speculative job: generate SQL for a predicted question and queue
+    its prefetch on the low-priority pool. The SQL stays with the job (see
+    take_speculative_sql) until the session asks the question. Runs on a worker thread.
+    
+    Returns:
+        dict: {"query", "job_id"} with the SQL as generated and the prefetch job, or error dict
+    """
+    from query_jobs import get_job_manager
+    
+    query = target.nl_sql_cache.get(cache_key) or generate_speculative_sql(client, deployment, messages)
+    if not query:
+        return {"error": "No SQL query for this question"}
+    fixed_query = fix_sql_syntax(query)
+    prefetch = get_job_manager().submit(
+        (target.key, fixed_query, False),
+        lambda job: run_speculative_query(job, question, fixed_query, target, client, deployment, session_id, cache_key),
+        context={"prompt": question, "target": target.name},
+        background=True
+    )
+    return {"query": query, "job_id": prefetch.id}
+
+
+def suggest_followups(user_prompt, frame=None):
+    """
+    Predict the most likely follow-up questions and show them as suggestion chips.
+    Suggestions come from what was asked after similar questions before, then
+    from refinements of the current result (answered from the cached DataFrame).
+    With prefetching on, the SQL of predicted questions is generated and executed
+    on the low-priority pool, within MAX_SPECULATIVE_QUERIES per answer,
+    SPECULATION_QUEUE_LIMIT jobs overall and the session's hourly budget.
+    
+    Args:
+        user_prompt (str): Question just answered
+        frame (pd.DataFrame): Complete result of that question (optional)
+    """
+    from query_jobs import get_job_manager
+    from speculation import (
+        MAX_SUGGESTIONS, MAX_SPECULATIVE_QUERIES, SPECULATION_QUEUE_LIMIT, HISTORY_SAMPLE_SIZE,
+        SpeculationBudget, predict_from_history, refinement_suggestions
+    )
+    
+    predicted = predict_from_history(
+        user_prompt, get_chat_store().question_pairs(get_user_id(), HISTORY_SAMPLE_SIZE)
+    )
+    if frame is not None:
+        predicted += refinement_suggestions(frame)
+    suggestions = []
+    for question in predicted:
+        if question.lower() != user_prompt.lower() and question.lower() not in [q.lower() for q in suggestions]:
+            suggestions.append(question)
+    st.session_state.suggestions = suggestions[:MAX_SUGGESTIONS]
+    
+    if not st.session_state.get("prefetch_suggestions", config.SPECULATIVE_PREFETCH) or use_fresh_data():
+        return
+    client = get_openai_client()
+    if not client:
+        return
+    deployment = get_ai_deployment()
+    manager = get_job_manager()
+    budget = st.session_state.setdefault("speculation_budget", SpeculationBudget())
+    target = get_active_target()
+    system_prompt = get_system_prompt()
+    session_id = get_memory_session_id()
+    # Speculative SQL by conversation key, taken by the question's real ask
+    speculations = st.session_state.speculations = {}
+    speculated = 0
+    for question in st.session_state.suggestions:
+        if speculated >= MAX_SPECULATIVE_QUERIES or manager.count_background() >= SPECULATION_QUEUE_LIMIT:
+            break
+        if frame is not None and parse_refinement(question, frame):
+            # Answered from the cached result anyway
+            continue
+        # The conversation as it will be when the suggestion is clicked
+        history = st.session_state.messages + [{"role": "user", "content": question}]
+        messages = build_ai_messages(system_prompt, question, history)
+        cache_key = get_nl_sql_cache_key(messages)
+        # SQL generation and summary
+        if not budget.try_spend(2):
+            break
+        speculation = manager.submit(
+            ("speculate", session_id, target.key, cache_key),
+            lambda job, question=question, messages=messages, cache_key=cache_key: run_speculation(
+                job, question, messages, cache_key, target, client, deployment, session_id
+            ),
+            background=True
+        )
+        speculations[cache_key] = speculation.id
+        speculated += 1
+
+
+def ask_suggestion(question):
+    """Ask a suggested follow-up (button callback)"""
+    st.session_state.suggested_prompt = question
+
+
+def render_suggestions():
+    """Show the suggested follow-up questions as chips"""
+    suggestions = st.session_state.get("suggestions")
+    if not suggestions:
+        return
+    for column, (index, question) in zip(st.columns(len(suggestions)), enumerate(suggestions)):
+        column.button(
+            f"💡 {question}", key=f"suggestion_{index}", on_click=ask_suggestion, args=(question,),
+            use_container_width=True
+        )
+
+
+def finish_query_job(job, prompt):
+    """
+    Present the result of a finished query job and add it to the conversation.
+    
+    Args:
+        job (QueryJob): Finished job
+        prompt (str): User's question
+    """
+    conversation = (st.session_state.get("pending_job") or {}).get("conversation")
+    clear_pending_job()
+    st.session_state.suggestions = None
+    
+    if job.status == "cancelled":
+        assistant_content = f"⏹️ Query cancelled after {job.elapsed:.0f}s."
+    elif job.status == "failed":
+        assistant_content = f"❌ Database Error: {job.error}"
+    elif "error" in job.result:
+        assistant_content = f"❌ Database Error: {job.result['error']}"
+    else:
+        assistant_content = None
+    if assistant_content:
+        with st.chat_message("assistant"):
+            st.markdown(assistant_content)
+        add_chat_message("assistant", assistant_content)
+        return
+    
+    results_table = job.result["results_table"]
+    query = job.result["query"]
+    repairs = job.result["repairs"]
+    total_rows = job.result["total_rows"]
+    
+    # The query ran (after any repairs), so asking this again in this context can skip the AI
+    target = find_target(job.context.get("target", ""))
+    if conversation and target:
+        target.nl_sql_cache.put(conversation, query)
+    
+    # JSON view of the (bounded) first page for summarization
+    from arrow_transport import arrow_to_records
+    results = arrow_to_records(results_table)
+    frame = None
+    if total_rows == results_table.num_rows:
+        # The whole result is here, so follow-up refinements don't need the database
+        frame = remember_result(prompt, query, results_table, job.context.get("target", get_active_target().name))
+
+    # Generate a natural-language summary from the query results (prefetched ones come with it)
+    # (only this session's, for this point of the conversation - the job may be shared)
+    owner = {"prompt": prompt, "session": get_memory_session_id(), "conversation": conversation}
+    prefetched = job.result.get("summary")
+    if prefetched and conversation and all(prefetched.get(field) == value for field, value in owner.items()):
+        summary = prefetched["text"]
+        st.session_state.last_summary_encoding = prefetched["encoding_report"]
+    else:
+        summary = get_ai_summary(prompt, query, results, total_rows=total_rows)
+        # Kept with the job, so asking the same question again while it's reused is instant too
+        job.result["summary"] = dict(
+            owner, text=summary, encoding_report=st.session_state.get("last_summary_encoding")
+        )
+    view = None
+
+    with st.chat_message("assistant"):
+        # Display the summary
+        st.markdown(summary)
+        
+        # Display results as a table if there are multiple rows
+        if results and len(results) > 0:
+            st.markdown("**Results:**")
+            
+            # Check if it's a single value result
+            if len(results) == 1 and len(results[0]) == 1:
+                # Single value - just show it
+                key = list(results[0].keys())[0]
+                value = results[0][key]
+                st.info(f"**{key}:** {value}")
+            else:
+                # Multiple rows or columns - show as a paginated table
+                try:
+                    view = create_results_view(query, results_table, total_rows)
+                    st.session_state.results_view = view
+                    render_chart(view)
+                    render_results_viewer(view)
+                except Exception as e:
+                    st.error(f"Error displaying table: {e}")
+                    st.json(results[:10])  # Fallback to JSON
+        elif not results or len(results) == 0:
+            st.info("✓ Query executed successfully but returned no results.")
+        
+        # Show the SQL query
+        st.markdown("**SQL Query:**")
+        st.code(query, language="sql")
+        if view:
+            render_export_controls(view)
+        if repairs:
+            st.caption(f"🔧 Query was automatically corrected after {len(repairs)} failed attempt(s).")
+        encoding_report = st.session_state.get("last_summary_encoding")
+        if encoding_report and encoding_report["tokens_saved"]:
+            st.caption(
+                f"📉 Summary prompt used ~{encoding_report['tokens']:,} tokens for "
+                f"{encoding_report['rows_included']:,} of {encoding_report['rows_total']:,} rows "
+                f"(~{encoding_report['tokens_saved']:,} fewer than the former JSON of the first {JSON_PROMPT_ROWS} rows)."
+            )
+
+    # Append assistant summary (and SQL) to chat history for persistence.
+    # The table is not part of the text; it is stored with the message as a Parquet blob
+    # and the latest one stays browsable after reruns.
+    combined = f"{summary}\n\n**SQL Query:**\n```sql\n{query}\n```"
+    if view:
+        add_chat_message("assistant", combined, result_table=results_table, results_view=view["id"])
+    else:
+        add_chat_message("assistant", combined)
+    suggest_followups(prompt, frame)
+
+
+def main():
+    """Streamlit chat-style UI using `st.chat_input` and `st.chat_message`."""
+    st.set_page_config(page_title="Database Chatbot", layout="wide")
+
+    # Validate configuration first
+    if not validate_and_show_config_errors():
+        st.stop()
+    
+    # Get dynamic title based on database name
+    dynamic_title = get_dynamic_app_title()
+    st.title(dynamic_title)
+
+    with st.sidebar:
+        render_sidebar()
+
+    # Get dynamic description based on tables (computed once per database per session,
+    # after its schema loaded in the background - the first run doesn't wait for it)
+    description_key = get_active_target().name
+    if st.session_state.get("app_description_key") != description_key:
+        description = get_dynamic_app_description()
+        if description is not None:
+            st.session_state.app_description = description
+            st.session_state.app_description_key = description_key
+    if st.session_state.get("app_description_key") == description_key:
+        st.write(st.session_state.app_description)
+    else:
+        st.caption("⏳ Loading the database's tables...")
+
+    # Load the persistent conversation (starts with a dynamic welcome message)
+    ensure_chat_session()
+    track_session_memory()
+
+    # Only the most recent window is rendered, so reruns don't grow with the conversation
+    older_count = st.session_state.chat_message_count - len(st.session_state.messages)
+    if older_count > 0 and st.button(f"⬆️ Load older messages ({older_count} more)"):
+        st.session_state.chat_window += CHAT_WINDOW_SIZE
+        load_chat_window()
+        st.rerun()
+
+    # Display chat history
+    for message in st.session_state.messages:
+        role = message.get("role", "assistant")
+        content = message.get("content", "")
+        with st.chat_message(role):
+            # content can be plain text or markdown
+            st.markdown(content)
+            view = st.session_state.get("results_view")
+            if view and message.get("results_view") == view["id"]:
+                render_chart(view)
+                render_results_viewer(view)
+                render_export_controls(view)
+            elif message.get("result_id"):
+                render_stored_result(message)
+
+    # A query running in the background: show its progress, or its answer once it finished
+    job, job_prompt = get_pending_job()
+    if job is not None:
+        if job.is_finished:
+            finish_query_job(job, job_prompt)
+            job = None
+        else:
+            with st.chat_message("assistant"):
+                render_job_progress(job.id)
+    if job is None:
+        render_suggestions()
+
+    # Use Streamlit's chat_input so Enter submits the prompt (or a suggestion chip was clicked)
+    prompt = st.chat_input("Type your question and press Enter", disabled=job is not None)
+    if prompt := prompt or st.session_state.pop("suggested_prompt", None):
+        st.session_state.suggestions = None
+
+        # Append user message to history
+        add_chat_message("user", prompt)
+
+        # Display the user's message immediately
         with st.chat_message("user"):
             st.markdown(prompt)
 
@@ -970,6 +1970,10 @@ def main():
         #    message_placeholder = st.empty()
         #    message_placeholder.markdown("Processing your request... ⏳")
 
+        # Refinements of a recent result (filter, sort, top N, group by) are answered in-process
+        if answer_followup(prompt):
+            return
+
         # Process the prompt: get SQL or conversational response
         # Pass conversation history for context-aware responses
         response, needs_database = get_sql_query_from_ai(prompt, st.session_state.messages)
@@ -980,7 +1984,7 @@ def main():
             # Update placeholder and append to history
             with st.chat_message("assistant"):
                 st.markdown(assistant_content)
-            st.session_state.messages.append({"role": "assistant", "content": assistant_content})
+            add_chat_message("assistant", assistant_content)
             return
 
         if not needs_database:
@@ -988,7 +1992,7 @@ def main():
             assistant_content = response
             with st.chat_message("assistant"):
                 st.markdown(assistant_content)
-            st.session_state.messages.append({"role": "assistant", "content": assistant_content})
+            add_chat_message("assistant", assistant_content)
             return
 
         # It's a SQL query
@@ -999,68 +2003,11 @@ def main():
         #    st.markdown("**Generated SQL Query:**")
         #    st.code(query, language="sql")
 
-        # Execute the query (but do NOT display raw results to the user).
+        # Execute the query in the background (but do NOT display raw results to the user).
         # We still run the query so the AI can summarize the actual data.
-        with st.spinner("Executing SQL query..."):
-            results = query_db(query)
-
-        if isinstance(results, dict) and "error" in results:
-            assistant_content = f"❌ Database Error: {results['error']}"
-            with st.chat_message("assistant"):
-                st.markdown(assistant_content)
-            st.session_state.messages.append({"role": "assistant", "content": assistant_content})
-            return
-
-        # Generate a natural-language summary from the query results
-        summary = get_ai_summary(prompt, query, results)
-
-        with st.chat_message("assistant"):
-            # Display the summary
-            st.markdown(summary)
-            
-            # Display results as a table if there are multiple rows
-            if results and len(results) > 0:
-                st.markdown("**Results:**")
-                
-                # Check if it's a single value result
-                if len(results) == 1 and len(results[0]) == 1:
-                    # Single value - just show it
-                    key = list(results[0].keys())[0]
-                    value = results[0][key]
-                    st.info(f"**{key}:** {value}")
-                else:
-                    # Multiple rows or columns - show as dataframe
-                    try:
-                        # Limit displayed rows for very large results
-                        if len(results) > MAX_DISPLAY_ROWS:
-                            st.warning(f"⚠️ Showing first {MAX_DISPLAY_ROWS} of {len(results)} results")
-                            display_results = results[:MAX_DISPLAY_ROWS]
-                        else:
-                            display_results = results
-                        
-                        df = pd.DataFrame(display_results)
-                        
-                        # Convert any remaining object columns to strings
-                        for col in df.columns:
-                            if df[col].dtype == 'object':
-                                df[col] = df[col].astype(str)
-                        
-                        st.dataframe(df, use_container_width=True)
-                    except Exception as e:
-                        st.error(f"Error displaying table: {e}")
-                        st.json(results[:10])  # Fallback to JSON
-            elif not results or len(results) == 0:
-                st.info("✓ Query executed successfully but returned no results.")
-            
-            # Show the SQL query
-            st.markdown("**SQL Query:**")
-            st.code(query, language="sql")
-
-        # Append assistant summary (and SQL) to chat history for persistence.
-        # Note: We don't include the full table in history to keep it manageable
-        combined = f"{summary}\n\n**SQL Query:**\n```sql\n{query}\n```"
-        st.session_state.messages.append({"role": "assistant", "content": combined})
-
+        # The rerun shows the job's progress until it finishes.
+        start_query_job(prompt, query, get_conversation_key(prompt, st.session_state.messages))
+        st.rerun()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,218 @@
+import datetime
+from decimal import Decimal
+
+import pyarrow as pa
+
+# Rows converted per Arrow record batch
+ARROW_BATCH_SIZE = 10000
+
+# Largest precision pyarrow's decimal128 can hold
+MAX_DECIMAL_PRECISION = 38
+
+
+def arrow_type_for_column(column_description):
+    """
+    Map a pyodbc cursor.description entry to an Arrow type.
+    pyodbc reports the Python type of each column, plus precision and scale.
+
+    Args:
+        column_description (tuple): (name, type_code, display_size, internal_size, precision, scale, null_ok)
+
+    Returns:
+        pa.DataType: Arrow type that keeps the native database type
+    """
+    type_code = column_description[1]
+    precision = column_description[4]
+    scale = column_description[5]
+
+    if type_code is bool:
+        return pa.bool_()
+    if type_code is int:
+        return pa.int64()
+    if type_code is float:
+        return pa.float64()
+    if type_code is Decimal:
+        if precision and 0 < precision <= MAX_DECIMAL_PRECISION:
+            return pa.decimal128(precision, scale or 0)
+        return pa.float64()
+    if type_code is datetime.datetime:
+        return pa.timestamp("us")
+    if type_code is datetime.date:
+        return pa.date32()
+    if type_code is datetime.time:
+        return pa.time64("us")
+    if type_code in (bytes, bytearray):
+        return pa.binary()
+    # str, UUID, XML and anything else
+    return pa.string()
+
+
+def unique_column_names(names):
+    """
+    Make column names unique (e.g., a join returning ClassID twice -> ClassID, ClassID_2).
+
+    Args:
+        names (list): Column names from the cursor
+
+    Returns:
+        list: Unique column names in the same order
+    """
+    seen = {}
+    unique = []
+    for name in names:
+        name = name or "Column"
+        if name in seen:
+            seen[name] += 1
+            unique.append(f"{name}_{seen[name]}")
+        else:
+            seen[name] = 1
+            unique.append(name)
+    return unique
+
+
+def arrow_schema_from_description(description):
+    """
+    Build an Arrow schema from a pyodbc cursor.description.
+    Columns renamed by unique_column_names() keep their name from the cursor
+    in the field metadata (see renamed_columns()).
+
+    Args:
+        description (list): cursor.description
+
+    Returns:
+        pa.Schema: Schema with native column types
+    """
+    source_names = [column[0] for column in description]
+    names = unique_column_names(source_names)
+    return pa.schema([
+        pa.field(
+            name, arrow_type_for_column(column),
+            metadata=None if name == source_name else {b"source_name": (source_name or "").encode("utf-8")}
+        )
+        for name, source_name, column in zip(names, source_names, description)
+    ])
+
+
+def renamed_columns(schema):
+    """
+    Columns that were unnamed or duplicated in the query's output (renamed by unique_column_names()).
+
+    Args:
+        schema (pa.Schema): Schema of a fetched result
+
+    Returns:
+        list: Names of the renamed columns
+    """
+    return [field.name for field in schema if field.metadata and b"source_name" in field.metadata]
+
+
+def rows_to_record_batch(rows, schema):
+    """
+    Convert a batch of pyodbc rows to an Arrow record batch.
+    Values are copied once, column by column; a column whose values don't fit
+    the declared type falls back to strings.
+
+    Args:
+        rows (list): pyodbc rows
+        schema (pa.Schema): Schema from arrow_schema_from_description()
+
+    Returns:
+        pa.RecordBatch: Columnar batch
+    """
+    arrays = []
+    fields = []
+    for index, field in enumerate(schema):
+        values = [row[index] for row in rows]
+        try:
+            array = pa.array(values, type=field.type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError):
+            array = pa.array([None if value is None else str(value) for value in values], type=pa.string())
+            field = field.with_type(pa.string())
+        arrays.append(array)
+        fields.append(field)
+    return pa.RecordBatch.from_arrays(arrays, schema=pa.schema(fields))
+
+
+def fetch_arrow_table(cursor, max_rows=None, batch_size=ARROW_BATCH_SIZE, on_batch=None):
+    """
+    Fetch the result of an executed cursor as an Arrow table.
+
+    Args:
+        cursor: pyodbc cursor after execute()
+        max_rows (int): Maximum rows to fetch (optional, default all rows)
+        batch_size (int): Rows converted per record batch
+        on_batch (callable): Called with the row count of each fetched batch (optional)
+
+    Returns:
+        pa.Table: Result with native types (ints, decimals, dates, ...)
+    """
+    schema = arrow_schema_from_description(cursor.description)
+    batches = []
+    fetched = 0
+    while max_rows is None or fetched < max_rows:
+        size = batch_size if max_rows is None else min(batch_size, max_rows - fetched)
+        rows = cursor.fetchmany(size)
+        if not rows:
+            break
+        batch = rows_to_record_batch(rows, schema)
+        batches.append(batch)
+        fetched += len(rows)
+        if on_batch:
+            on_batch(len(rows))
+    return table_from_batches(schema, batches)
+
+
+def table_from_batches(schema, batches):
+    """
+    Combine record batches of one result into a table.
+
+    Args:
+        schema (pa.Schema): Schema from the cursor description
+        batches (list): Record batches from rows_to_record_batch()
+
+    Returns:
+        pa.Table: The batches as one table (string columns where any batch fell back to strings)
+    """
+    if not batches:
+        return schema.empty_table()
+    if all(batch.schema == batches[0].schema for batch in batches):
+        return pa.Table.from_batches(batches)
+
+    # Some batch fell back to strings - use strings for that column in every batch
+    fields = []
+    for index, field in enumerate(batches[0].schema):
+        if any(batch.schema.field(index).type != field.type for batch in batches):
+            field = field.with_type(pa.string())
+        fields.append(field)
+    target_schema = pa.schema(fields)
+    return pa.concat_tables([pa.Table.from_batches([batch]).cast(target_schema) for batch in batches])
+
+
+def to_json_value(value):
+    """Convert an Arrow Python value to a JSON-friendly value"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("utf-8", errors="ignore")
+    return value
+
+
+def arrow_to_records(table, max_rows=None):
+    """
+    Bounded JSON-friendly view of an Arrow table for summarization.
+
+    Args:
+        table (pa.Table): Query result
+        max_rows (int): Maximum rows to convert (optional, default all rows)
+
+    Returns:
+        list: Rows as dictionaries
+    """
+    if max_rows is not None:
+        table = table.slice(0, max_rows)
+    return [
+        {name: to_json_value(value) for name, value in row.items()}
+        for row in table.to_pylist()
+    ]
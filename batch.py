@@ -0,0 +1,173 @@
+"""
+Answer a file of questions concurrently and stream the answers as JSON Lines.
+
+Input is either plain text (one question per line, blank lines and lines starting
+with # skipped) or JSON Lines with a "question" and optional "id" and "database".
+Each answer is written as soon as it is ready (so output order follows completion,
+use "index"/"id" to match them up): the answer dict of QueryEngine.ask() plus
+"index", "id" and "latency" (seconds).
+
+Usage:
+    python batch.py questions.txt [-o answers.jsonl] [--database NAME]
+                    [--concurrency 4] [--max-rows 1000] [--no-summary] [--fresh]
+
+A summary line (answered/errors, throughput, p50/p95 latency) goes to stderr.
+Exits with status 1 if any question failed.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+import config
+from engine import DEFAULT_MAX_ROWS, get_engine
+from pipeline import run_sync
+
+DEFAULT_CONCURRENCY = 4
+
+
+def read_questions(lines):
+    """
+    Parse the input file.
+
+    Args:
+        lines (iterable): Lines of a text or JSON Lines file
+
+    Returns:
+        list: Dicts with "index", "id", "question" and "database" (None for the default)
+    """
+    questions = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        item = {"question": line}
+        if line.startswith("{"):
+            try:
+                parsed = json.loads(line)
+            except ValueError:
+                parsed = None
+            if isinstance(parsed, dict):
+                item = parsed
+        index = len(questions)
+        questions.append({
+            "index": index,
+            "id": item.get("id", index),
+            "question": str(item.get("question", "")).strip(),
+            "database": item.get("database"),
+        })
+    return questions
+
+
+async def answer_question(item, default_database, max_rows, fresh, summarize, slots):
+    """Answer one batch item under the concurrency limit; never raises"""
+    async with slots:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        database = item["database"] or default_database
+        if not item["question"]:
+            answer = {"question": "", "status": "error", "error": 'Missing "question"'}
+        else:
+            engine = get_engine(database)
+            if engine is None:
+                answer = {"question": item["question"], "status": "error", "error": f"Unknown database: {database}"}
+            else:
+                try:
+                    answer = await engine.ask(item["question"], max_rows=max_rows, fresh=fresh, summarize=summarize)
+                except Exception as e:
+                    answer = {"question": item["question"], "status": "error", "error": f"Unexpected error: {str(e)}"}
+        return {"index": item["index"], "id": item["id"], **answer, "latency": round(loop.time() - started, 3)}
+
+
+async def run_batch(questions, output, database=None, concurrency=DEFAULT_CONCURRENCY,
+                    max_rows=DEFAULT_MAX_ROWS, fresh=False, summarize=True):
+    """
+    Answer questions concurrently, writing each answer to output as one JSON line
+    as soon as it completes.
+
+    Args:
+        questions (list): From read_questions()
+        output: Text stream to write to (flushed after each answer)
+        database (str): Database for questions that don't name one (optional)
+        concurrency (int): Questions in flight at once
+        max_rows (int): Rows per answer
+        fresh (bool): Read from the primary and skip cached results
+        summarize (bool): Add natural-language summaries
+
+    Returns:
+        list: Answers in completion order
+    """
+    slots = asyncio.Semaphore(concurrency)
+    tasks = [
+        asyncio.ensure_future(answer_question(item, database, max_rows, fresh, summarize, slots))
+        for item in questions
+    ]
+    answers = []
+    try:
+        for next_answer in asyncio.as_completed(tasks):
+            answer = await next_answer
+            output.write(json.dumps(answer, default=str) + "\n")
+            output.flush()
+            answers.append(answer)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return answers
+
+
+def format_report(answers, elapsed):
+    """One-line summary of a batch run"""
+    latencies = sorted(answer["latency"] for answer in answers)
+    errors = sum(1 for answer in answers if answer.get("status") == "error")
+    report = f"{len(answers) - errors} answered, {errors} errors in {elapsed:.1f}s"
+    if latencies:
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        report += (
+            f" ({len(answers) / elapsed if elapsed else 0:.2f} questions/s,"
+            f" p50 {statistics.median(latencies):.2f}s, p95 {p95:.2f}s)"
+        )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Questions file (text or JSON Lines), - for stdin")
+    parser.add_argument("-o", "--output", help="Answers file (default stdout)")
+    parser.add_argument("--database", help="Database for questions that don't name one (default the first configured)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Questions in flight at once")
+    parser.add_argument("--max-rows", type=int, default=DEFAULT_MAX_ROWS, help="Rows per answer")
+    parser.add_argument("--no-summary", action="store_true", help="Skip the natural-language summaries")
+    parser.add_argument("--fresh", action="store_true", help="Read from the primary and skip cached results")
+    args = parser.parse_args()
+
+    errors = config.validate_config()
+    if errors:
+        parser.error("; ".join(errors))
+    if args.concurrency < 1 or args.max_rows < 1:
+        parser.error("--concurrency and --max-rows must be at least 1")
+
+    if args.input == "-":
+        questions = read_questions(sys.stdin)
+    else:
+        with open(args.input, encoding="utf-8") as questions_file:
+            questions = read_questions(questions_file)
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    started = time.monotonic()
+    try:
+        # On the pipeline's shared loop, like the app and the API
+        answers = run_sync(run_batch(
+            questions, output, args.database, args.concurrency, args.max_rows, args.fresh, not args.no_summary
+        ))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(format_report(answers, time.monotonic() - started), file=sys.stderr)
+    sys.exit(1 if any(answer.get("status") == "error" for answer in answers) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+"""
+Accuracy and latency regression suite for NL→SQL generation.
+
+Runs the golden questions (golden_set.json) through the question engine
+(engine.QueryEngine: system prompt, history handling, SQL generation with retries,
+safety checks and syntax fixes) against an in-memory SQLite copy of school_db.sql,
+with AI responses replayed from a recording, so no network or SQL Server is needed.
+
+Measures:
+- Execution accuracy: share of questions whose result set matches the expected rows
+  (order-insensitive unless "ordered"; values rounded to 2 decimals, column order ignored)
+- Mean prompt tokens per question (estimated from the messages actually sent)
+- p95 latency per question (replayed AI calls wait their recorded duration)
+- Retries per question (AI calls beyond the first, e.g. after a recorded 429)
+
+Usage:
+    python benchmarks/nl_sql_eval.py [--record] [--update-baseline] [--latency-scale 1.0]
+    python benchmarks/nl_sql_eval.py --smoke
+
+The recording (eval_recordings.json) and baseline (eval_baseline.json) come from a
+--record run against the Azure OpenAI deployment (needs its settings); commit both.
+Changing the system prompt, history handling or model changes the AI requests, so
+their responses are no longer in the recording: re-record with --record, review
+the report, then --update-baseline to accept it.
+
+--smoke checks the harness itself without network: each question is "answered"
+with its reference_sql, which must reproduce the expected rows on the stand-in.
+It says nothing about the model, so it is never recorded or compared with the baseline.
+Exits with status 1 when a metric regresses past its threshold against the baseline
+(eval_baseline.json), accuracy is below MIN_EXECUTION_ACCURACY, or a question has
+no recorded response.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_SET_PATH = os.path.join(BENCHMARK_DIR, "golden_set.json")
+RECORDINGS_PATH = os.path.join(BENCHMARK_DIR, "eval_recordings.json")
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "eval_baseline.json")
+SCHEMA_SCRIPT_PATH = os.path.join(ROOT, "school_db.sql")
+
+# Absolute floor, checked even without a baseline
+MIN_EXECUTION_ACCURACY = 0.8
+# Regressions allowed against the baseline
+MAX_ACCURACY_DROP = 0.0              # share of questions
+MAX_PROMPT_TOKENS_INCREASE = 0.10    # relative
+MAX_P95_LATENCY_INCREASE = 0.25      # relative
+MAX_RETRIES_INCREASE = 0.10          # retries per question
+
+# Rows fetched per answer (results larger than this can't match anyway)
+EVAL_MAX_ROWS = 1000
+
+
+def recording_key(model, messages, temperature):
+    """Key of one AI request: changes whenever the prompt, history or model changes"""
+    payload = json.dumps([model, messages, temperature], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ReplayClient:
+    """
+    Stands in for AsyncAzureOpenAI (client.chat.completions.create).
+    Replays recorded outcomes (responses or errors, in call order per request),
+    or with a live client, calls it and records the outcomes.
+    One instance per question, so calls and prompt tokens are counted per question.
+    """
+
+    def __init__(self, recordings, live_client=None, latency_scale=1.0):
+        from types import SimpleNamespace
+
+        self.recordings = recordings
+        self.live_client = live_client
+        self.latency_scale = latency_scale
+        self.chat = SimpleNamespace(completions=self)
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.missing = False
+        self._positions = {}
+
+    async def create(self, model, messages, temperature=None, **kwargs):
+        from types import SimpleNamespace
+        from result_encoder import estimate_tokens
+
+        self.calls += 1
+        self.prompt_tokens += sum(estimate_tokens(message["content"]) for message in messages)
+        key = recording_key(model, messages, temperature)
+        position = self._positions.get(key, 0)
+        self._positions[key] = position + 1
+
+        if self.live_client is not None:
+            outcome = await self._record(key, position, model, messages, temperature, **kwargs)
+        else:
+            recording = self.recordings.get(key)
+            if not recording:
+                # "not found" makes the engine give up at once instead of retrying
+                self.missing = True
+                raise Exception(f"Recorded response not found for: {messages[-1]['content'][:80]}")
+            outcome = recording["outcomes"][min(position, len(recording["outcomes"]) - 1)]
+            await asyncio.sleep(outcome["seconds"] * self.latency_scale)
+
+        if "error" in outcome:
+            raise Exception(outcome["error"])
+        message = SimpleNamespace(content=outcome["content"])
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    async def _record(self, key, position, model, messages, temperature, **kwargs):
+        recording = self.recordings.setdefault(key, {"question": messages[-1]["content"], "outcomes": []})
+        if position == 0:
+            recording["outcomes"] = []
+        started = time.perf_counter()
+        try:
+            response = await self.live_client.chat.completions.create(
+                model=model, messages=messages, temperature=temperature, **kwargs
+            )
+            outcome = {"content": response.choices[0].message.content or ""}
+        except Exception as e:
+            outcome = {"error": str(e)}
+        outcome["seconds"] = round(time.perf_counter() - started, 3)
+        recording["outcomes"].append(outcome)
+        return outcome
+
+
+class ReferenceClient:
+    """
+    Stands in for the model in --smoke runs: answers each golden question with its
+    reference_sql (or a conversational reply). Requests it has no answer for
+    (e.g. repairs) fail.
+    """
+
+    def __init__(self, golden_set):
+        from types import SimpleNamespace
+
+        self.chat = SimpleNamespace(completions=self)
+        self.questions = {item["question"]: item for item in golden_set}
+
+    async def create(self, model, messages, temperature=None, **kwargs):
+        from types import SimpleNamespace
+
+        item = self.questions.get(messages[-1]["content"])
+        if item is None:
+            raise Exception("No reference response for this request")
+        if item.get("expected_conversational"):
+            content = "NO_QUERY_NEEDED: I can answer questions about the school database."
+        else:
+            content = f"```sql\n{item['reference_sql']}\n```"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def normalize_value(value):
+    """Comparable form of a result value (numbers rounded to 2 decimals, text trimmed)"""
+    if isinstance(value, bool):
+        return float(value)
+    if isinstance(value, (int, float)):
+        return round(float(value), 2)
+    if isinstance(value, str):
+        return value.strip()
+    if value is None:
+        return None
+    return str(value)
+
+
+def rows_match(actual_rows, expected_rows, ordered=False):
+    """
+    Compare result sets (column order ignored: each row is compared as a sorted tuple).
+
+    Args:
+        actual_rows (list): Rows as lists of values
+        expected_rows (list): Expected rows
+        ordered (bool): Row order must match too
+
+    Returns:
+        bool: Whether the results match
+    """
+    def canonical(row):
+        return tuple(sorted((normalize_value(value) for value in row), key=lambda value: (str(type(value)), str(value))))
+
+    actual = [canonical(row) for row in actual_rows]
+    expected = [canonical(row) for row in expected_rows]
+    if ordered:
+        return actual == expected
+    return sorted(actual, key=repr) == sorted(expected, key=repr)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def create_engine_class():
+    """QueryEngine subclass that reads the stand-in database instead of SQL Server"""
+    from engine import QueryEngine
+    from pipeline import validate_query_safety
+
+    class StandInEngine(QueryEngine):
+        def __init__(self, target, client, database):
+            super().__init__(target, client)
+            self.standin = database
+
+        async def schema_text(self):
+            return self.standin.schema_text
+
+        async def check_compiles(self, query, fresh=False, job=None):
+            # SQLite has no SET NOEXEC; failing queries are reported by execute()
+            return True, None
+
+        async def count_rows(self, query, fresh=False):
+            return len(self.standin.fetch(query)[1])
+
+        async def execute(self, query, max_rows=None, as_arrow=True, fresh=False, job=None):
+            import sqlite3
+            import pyarrow as pa
+            from arrow_transport import unique_column_names
+
+            is_safe, error_msg = validate_query_safety(query)
+            if not is_safe:
+                return {"error": f"🛡️ Security: {error_msg}"}
+            try:
+                columns, rows = self.standin.fetch(query, max_rows)
+                names = unique_column_names(columns)
+                return pa.table({name: [row[index] for row in rows] for index, name in enumerate(names)})
+            except (sqlite3.Error, pa.ArrowException) as e:
+                return {"error": f"Database error: {e}", "detail": str(e)}
+
+    return StandInEngine
+
+
+async def evaluate_question(engine_class, target, database, item, recordings, live_client, latency_scale):
+    """
+    Answer one golden question and score it.
+
+    Returns:
+        dict: "id", "correct", "latency", "prompt_tokens", "retries" and "reason" (why it failed)
+    """
+    from engine import DEFAULT_MAX_ROWS
+
+    client = ReplayClient(recordings, live_client, latency_scale)
+    engine = engine_class(target, client, database)
+    # The NL→SQL cache would answer repeated runs without calling the model
+    target.nl_sql_cache.clear()
+
+    started = time.perf_counter()
+    answer = await engine.ask(
+        item["question"], item.get("history"), max_rows=min(EVAL_MAX_ROWS, DEFAULT_MAX_ROWS), summarize=False
+    )
+    latency = time.perf_counter() - started
+
+    result = {
+        "id": item["id"],
+        "latency": round(latency, 3),
+        "prompt_tokens": client.prompt_tokens,
+        "retries": max(0, client.calls - 1),
+        "query": answer.get("query"),
+        "correct": False,
+        "reason": "",
+    }
+    if client.missing:
+        result["reason"] = "not recorded"
+        result["unrecorded"] = True
+    elif item.get("expected_conversational"):
+        result["correct"] = answer["status"] == "conversational"
+        result["reason"] = "" if result["correct"] else f"expected a conversational answer, got {answer['status']}"
+    elif answer["status"] != "answered":
+        result["reason"] = answer.get("error") or "no query generated"
+    else:
+        actual_rows = [[row[column] for column in answer["columns"]] for row in answer["rows"]]
+        result["correct"] = rows_match(actual_rows, item["expected_rows"], item.get("ordered", False))
+        if not result["correct"]:
+            result["reason"] = f"result differs ({len(actual_rows)} rows, expected {len(item['expected_rows'])})"
+    return result
+
+
+async def run_evaluation(golden_set, recordings, live_client=None, latency_scale=1.0):
+    """Evaluate the golden questions one at a time (so latencies don't interfere)"""
+    from db_registry import DatabaseTarget
+    from standin_db import StandInDatabase
+
+    engine_class = create_engine_class()
+    database = StandInDatabase(SCHEMA_SCRIPT_PATH)
+    target = DatabaseTarget("school_db.sql (SQLite stand-in)", "standin", "SchoolDB", "eval", "eval")
+    results = []
+    for item in golden_set:
+        results.append(await evaluate_question(engine_class, target, database, item, recordings, live_client, latency_scale))
+    return results
+
+
+def summarize_metrics(results):
+    """Aggregate per-question results into the tracked metrics"""
+    count = len(results) or 1
+    return {
+        "questions": len(results),
+        "execution_accuracy": round(sum(result["correct"] for result in results) / count, 4),
+        "mean_prompt_tokens": round(sum(result["prompt_tokens"] for result in results) / count, 1),
+        "p95_latency": round(percentile([result["latency"] for result in results], 0.95), 3),
+        "retries_per_question": round(sum(result["retries"] for result in results) / count, 3),
+    }
+
+
+def find_regressions(metrics, baseline):
+    """
+    Compare metrics with the thresholds (and the baseline when there is one).
+
+    Returns:
+        list: Failure messages
+    """
+    failures = []
+    if metrics["execution_accuracy"] < MIN_EXECUTION_ACCURACY:
+        failures.append(f"execution accuracy {metrics['execution_accuracy']:.1%} < {MIN_EXECUTION_ACCURACY:.0%}")
+    if not baseline:
+        return failures
+    if metrics["execution_accuracy"] < baseline["execution_accuracy"] - MAX_ACCURACY_DROP:
+        failures.append(
+            f"execution accuracy {metrics['execution_accuracy']:.1%} < baseline {baseline['execution_accuracy']:.1%}"
+        )
+    if metrics["mean_prompt_tokens"] > baseline["mean_prompt_tokens"] * (1 + MAX_PROMPT_TOKENS_INCREASE):
+        failures.append(
+            f"mean prompt tokens {metrics['mean_prompt_tokens']:.0f} > baseline {baseline['mean_prompt_tokens']:.0f}"
+            f" +{MAX_PROMPT_TOKENS_INCREASE:.0%}"
+        )
+    if metrics["p95_latency"] > baseline["p95_latency"] * (1 + MAX_P95_LATENCY_INCREASE):
+        failures.append(
+            f"p95 latency {metrics['p95_latency']:.2f}s > baseline {baseline['p95_latency']:.2f}s"
+            f" +{MAX_P95_LATENCY_INCREASE:.0%}"
+        )
+    if metrics["retries_per_question"] > baseline["retries_per_question"] + MAX_RETRIES_INCREASE:
+        failures.append(
+            f"retries per question {metrics['retries_per_question']:.2f} > baseline"
+            f" {baseline['retries_per_question']:.2f} +{MAX_RETRIES_INCREASE}"
+        )
+    return failures
+
+
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, encoding="utf-8") as json_file:
+        return json.load(json_file)
+
+
+def save_json(path, data):
+    with open(path, "w", encoding="utf-8") as json_file:
+        json.dump(data, json_file, indent=2, ensure_ascii=False)
+        json_file.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--record", action="store_true", help="Call Azure OpenAI and record its responses")
+    parser.add_argument(
+        "--smoke", action="store_true", help="Check the harness with each question's reference_sql (no network, no baseline)"
+    )
+    parser.add_argument("--update-baseline", action="store_true", help="Save this run's metrics as the baseline")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier for replayed AI call durations")
+    parser.add_argument("--only", nargs="*", help="Evaluate only these question ids")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    import config
+
+    golden_set = load_json(GOLDEN_SET_PATH, [])
+    if args.only:
+        golden_set = [item for item in golden_set if item["id"] in args.only]
+    recordings = load_json(RECORDINGS_PATH, {})
+
+    if args.smoke and (args.record or args.update_baseline):
+        parser.error("--smoke can't be combined with --record or --update-baseline")
+    live_client = None
+    if args.smoke:
+        live_client = ReferenceClient(golden_set)
+    elif args.record:
+        from pipeline import get_async_openai_client
+
+        if not config.AZURE_OPENAI_API_KEY:
+            parser.error("--record needs AZURE_OPENAI_API_KEY")
+        live_client = get_async_openai_client()
+
+    results = asyncio.run(run_evaluation(golden_set, recordings, live_client, args.latency_scale))
+    if args.record:
+        save_json(RECORDINGS_PATH, recordings)
+
+    for result in results:
+        status = "ok  " if result["correct"] else "FAIL"
+        line = (
+            f"{status} {result['id']:<28} {result['latency']:6.2f}s {result['prompt_tokens']:6d} tokens"
+            f" {result['retries']} retries"
+        )
+        print(line + (f"  ({result['reason']})" if result["reason"] else ""))
+
+    if args.smoke:
+        failed = [result["id"] for result in results if not result["correct"]]
+        if failed:
+            print(f"\nFAILED: reference SQL doesn't reproduce the expected rows for {', '.join(failed)}")
+            sys.exit(1)
+        print("\nOK: the harness reproduces every expected result")
+        return
+
+    metrics = summarize_metrics(results)
+    metrics["model"] = config.AZURE_OPENAI_DEPLOYMENT
+    baseline = load_json(BASELINE_PATH, None)
+    print(f"\nExecution accuracy:   {metrics['execution_accuracy']:.1%} of {metrics['questions']} questions")
+    print(f"Mean prompt tokens:   {metrics['mean_prompt_tokens']:.0f}")
+    print(f"p95 latency:          {metrics['p95_latency']:.2f}s")
+    print(f"Retries per question: {metrics['retries_per_question']:.2f}")
+    if baseline:
+        print(f"Baseline:             {baseline['execution_accuracy']:.1%}, {baseline['mean_prompt_tokens']:.0f} tokens,"
+              f" p95 {baseline['p95_latency']:.2f}s, {baseline['retries_per_question']:.2f} retries ({baseline.get('model')})")
+
+    failures = find_regressions(metrics, baseline)
+    unrecorded = [result["id"] for result in results if result.get("unrecorded")]
+    if unrecorded:
+        failures.append(f"no recorded response for {', '.join(unrecorded)} (run with --record)")
+
+    if args.update_baseline and not unrecorded:
+        save_json(BASELINE_PATH, metrics)
+        print(f"\nBaseline updated: {os.path.relpath(BASELINE_PATH, ROOT)}")
+    elif failures:
+        print("\nFAILED: " + "; ".join(failures))
+        sys.exit(1)
+    else:
+        print("\nOK: no regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+In-memory SQLite stand-in for the sample SQL Server database (school_db.sql).
+
+Loads the tables and sample data of school_db.sql into SQLite, describes them in
+the same schema text format as pipeline.load_database_schema(), and runs generated
+T-SQL after translating the constructs the golden questions need (TOP, dbo.,
+GETDATE, ISNULL, LEN, YEAR/MONTH, CAST AS DATE, DATEDIFF(day, ...)). Queries using
+other T-SQL features fail here as database errors.
+"""
+import re
+import sqlite3
+
+# T-SQL function -> SQLite rewrites (simple arguments without nested parentheses)
+FUNCTION_REWRITES = [
+    (r'\bGETDATE\(\s*\)', "CURRENT_TIMESTAMP"),
+    (r'\bISNULL\(', "IFNULL("),
+    (r'\bLEN\(', "LENGTH("),
+    (r'\bYEAR\(([^()]+)\)', r"CAST(strftime('%Y', \1) AS INTEGER)"),
+    (r'\bMONTH\(([^()]+)\)', r"CAST(strftime('%m', \1) AS INTEGER)"),
+    (r'\bCAST\(([^()]+?)\s+AS\s+DATE\)', r"date(\1)"),
+    (r'\bDATEDIFF\(\s*(?:day|dd|d)\s*,([^,()]+),([^,()]+)\)', r"CAST(julianday(\2) - julianday(\1) AS INTEGER)"),
+]
+
+
+def parse_create_tables(script):
+    """
+    Read the CREATE TABLE statements of a T-SQL script.
+
+    Returns:
+        list: (table name, column definition lines, statement text) tuples
+    """
+    tables = []
+    for match in re.finditer(r'CREATE TABLE (\w+) \((.*?)\n\);', script, re.DOTALL):
+        lines = [line.strip().rstrip(",") for line in match.group(2).splitlines()]
+        tables.append((match.group(1), [line for line in lines if line and not line.startswith("--")], match.group(0)))
+    return tables
+
+
+def describe_schema(tables):
+    """
+    Schema text in the format of pipeline.load_database_schema(), so the
+    system prompt matches what the app sends for the real database.
+    """
+    schema_text = "DATABASE SCHEMA:\n\n"
+    for index, (table, columns, _) in enumerate(sorted(tables)):
+        if index:
+            schema_text += "\n"
+        schema_text += f"Table: dbo.{table}\n"
+        for line in columns:
+            match = re.match(r'(\w+)\s+(\w+(?:\(\d+(?:,\d+)?\))?)(.*)$', line)
+            if not match:
+                continue
+            column, type_info, rest = match.groups()
+            column_desc = f"- {column} ({type_info.upper()}"
+            reference = re.search(r'REFERENCES (\w+)\((\w+)\)', rest)
+            if "PRIMARY KEY" in rest:
+                column_desc += ", PRIMARY KEY"
+            elif reference:
+                column_desc += f", FOREIGN KEY -> dbo.{reference.group(1)}.{reference.group(2)}"
+            schema_text += column_desc + ")\n"
+    return schema_text
+
+
+def to_sqlite_ddl(statement):
+    """Translate a CREATE TABLE statement of school_db.sql to SQLite"""
+    statement = re.sub(r'\bINT PRIMARY KEY IDENTITY\(1,1\)', "INTEGER PRIMARY KEY", statement)
+    statement = statement.replace("FOREIGN KEY REFERENCES", "REFERENCES")
+    return re.sub(r'\bGETDATE\(\)', "CURRENT_DATE", statement)
+
+
+def to_sqlite(query):
+    """
+    Translate a generated T-SQL query to SQLite.
+    Only the first SELECT TOP is translated (to a trailing LIMIT).
+
+    Args:
+        query (str): T-SQL query
+
+    Returns:
+        str: SQLite query
+    """
+    sql = re.sub(r'(?:\[dbo\]|\bdbo)\.', "", query, flags=re.IGNORECASE)
+    sql = re.sub(r"\bN'", "'", sql)
+    top = re.search(r'\bSELECT\s+(DISTINCT\s+)?TOP\s*\(?\s*(\d+)\s*\)?\s+(?:PERCENT\s+)?', sql, re.IGNORECASE)
+    if top:
+        sql = sql[:top.start()] + f"SELECT {top.group(1) or ''}" + sql[top.end():]
+        sql = sql.rstrip().rstrip(";") + f" LIMIT {top.group(2)}"
+    for pattern, replacement in FUNCTION_REWRITES:
+        sql = re.sub(pattern, replacement, sql, flags=re.IGNORECASE)
+    return sql
+
+
+class StandInDatabase:
+    """The sample database in SQLite (in memory, one connection, used from one thread)"""
+
+    def __init__(self, script_path):
+        with open(script_path, encoding="utf-8") as script_file:
+            script = script_file.read()
+        tables = parse_create_tables(script)
+        self.schema_text = describe_schema(tables)
+        self.connection = sqlite3.connect(":memory:")
+        self.connection.executescript(";\n".join(to_sqlite_ddl(statement) for _, _, statement in tables))
+        for statement in re.findall(r'INSERT INTO .*?;', script, re.DOTALL):
+            self.connection.executescript(statement)
+
+    def fetch(self, query, max_rows=None):
+        """
+        Run a T-SQL query.
+
+        Returns:
+            tuple: (column names, rows)
+
+        Raises:
+            sqlite3.Error: If the query fails (or uses T-SQL the stand-in doesn't translate)
+        """
+        cursor = self.connection.execute(to_sqlite(query))
+        rows = cursor.fetchmany(max_rows) if max_rows else cursor.fetchall()
+        return [column[0] for column in cursor.description or []], rows
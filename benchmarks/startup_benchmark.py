@@ -0,0 +1,133 @@
+"""
+Cold-start and per-rerun time budget for app.py.
+
+Measures:
+- Cold import of app.py in a fresh interpreter, and which heavy modules it loads
+- The first script run of a new session, and which heavy modules it loads
+- Reruns of an existing session (what every widget interaction costs)
+
+Usage:
+    python benchmarks/startup_benchmark.py [--reruns 20]
+
+Exits with status 1 when a budget is exceeded or a heavy module is imported eagerly.
+No network (or ODBC driver) is needed; if the database is unreachable the schema error is
+cached like a schema.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "app.py")
+
+# Budgets in seconds
+COLD_IMPORT_BUDGET = 1.5
+FIRST_RUN_BUDGET = 3.0
+RERUN_P95_BUDGET = 0.3
+
+# Must not be imported until a query actually needs them
+HEAVY_MODULES = ["pyodbc", "openai", "pyarrow", "pandas"]
+# The first run starts loading the schema in the background, which needs these
+FIRST_RUN_BACKGROUND_MODULES = ["pyodbc"]
+
+
+def prepare_environment():
+    """Provide the settings config.validate_config() requires and an isolated chat store"""
+    os.environ.setdefault("AZURE_OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("DB_USERNAME", "benchmark")
+    os.environ.setdefault("DB_PASSWORD", "benchmark")
+    os.environ["CHAT_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench_"), "chat_history.db")
+
+
+def measure_cold_import():
+    """Import app.py in a fresh interpreter; return (seconds, heavy modules loaded)"""
+    code = (
+        "import json, sys, time\n"
+        "started = time.perf_counter()\n"
+        "import app\n"
+        "elapsed = time.perf_counter() - started\n"
+        f"loaded = [name for name in {HEAVY_MODULES!r} if name in sys.modules]\n"
+        "print(json.dumps({'seconds': elapsed, 'loaded': loaded}))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    return result["seconds"], result["loaded"]
+
+
+def measure_runs(reruns):
+    """
+    Run the app with Streamlit's AppTest.
+
+    Returns:
+        tuple: (first run seconds, heavy modules the first run loaded, rerun timings)
+    """
+    from streamlit.testing.v1 import AppTest
+
+    app_test = AppTest.from_file(APP_PATH, default_timeout=60)
+
+    already_loaded = {name for name in HEAVY_MODULES if name in sys.modules}
+    started = time.perf_counter()
+    app_test.run()
+    first_run = time.perf_counter() - started
+    if app_test.exception:
+        raise RuntimeError(f"App raised an exception: {app_test.exception[0].message}")
+    loaded = [
+        name for name in HEAVY_MODULES
+        if name in sys.modules and name not in already_loaded and name not in FIRST_RUN_BACKGROUND_MODULES
+    ]
+
+    timings = []
+    for _ in range(reruns):
+        started = time.perf_counter()
+        app_test.run()
+        timings.append(time.perf_counter() - started)
+    return first_run, loaded, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reruns", type=int, default=20, help="Number of reruns to time")
+    args = parser.parse_args()
+
+    prepare_environment()
+    sys.path.insert(0, ROOT)
+
+    cold_import, loaded = measure_cold_import()
+    first_run, first_run_loaded, timings = measure_runs(args.reruns)
+    timings.sort()
+    rerun_p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+
+    failures = []
+    if cold_import > COLD_IMPORT_BUDGET:
+        failures.append(f"cold import {cold_import:.3f}s > {COLD_IMPORT_BUDGET}s")
+    if loaded:
+        failures.append(f"heavy modules imported eagerly: {', '.join(loaded)}")
+    if first_run_loaded:
+        failures.append(f"heavy modules imported by the first run: {', '.join(first_run_loaded)}")
+    if first_run > FIRST_RUN_BUDGET:
+        failures.append(f"first run {first_run:.3f}s > {FIRST_RUN_BUDGET}s")
+    if rerun_p95 > RERUN_P95_BUDGET:
+        failures.append(f"rerun p95 {rerun_p95:.3f}s > {RERUN_P95_BUDGET}s")
+
+    print(f"Cold import:  {cold_import:.3f}s (budget {COLD_IMPORT_BUDGET}s)")
+    print(f"Heavy modules at import: {', '.join(loaded) or 'none'}")
+    print(f"First run:    {first_run:.3f}s (budget {FIRST_RUN_BUDGET}s)")
+    print(f"Heavy modules on the first run: {', '.join(first_run_loaded) or 'none'}")
+    print(f"Rerun mean:   {statistics.mean(timings):.3f}s over {len(timings)} reruns")
+    print(f"Rerun p95:    {rerun_p95:.3f}s (budget {RERUN_P95_BUDGET}s)")
+
+    if failures:
+        print("\nFAILED: " + "; ".join(failures))
+        sys.exit(1)
+    print("\nOK: all budgets met")
+
+
+if __name__ == "__main__":
+    main()
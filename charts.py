@@ -0,0 +1,253 @@
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from local_summary import is_id_column
+from pagination import quote_identifier
+
+# Most points sent to the browser for one chart
+MAX_CHART_POINTS = 2000
+# Most bars in a bar chart (largest values are kept)
+MAX_BAR_CATEGORIES = 50
+# Most value columns drawn in one chart
+MAX_CHART_SERIES = 5
+# Most rows streamed from the server for LTTB downsampling
+CHART_FETCH_LIMIT = 200000
+
+# Date buckets for GROUP BY on the server: (name, approximate seconds, SQL expression template)
+DATE_BUCKETS = [
+    ("hour", 3600, "DATEADD(hour, DATEDIFF(hour, 0, {column}), 0)"),
+    ("day", 86400, "DATEADD(day, DATEDIFF(day, 0, {column}), 0)"),
+    ("week", 604800, "DATEADD(week, DATEDIFF(week, 0, {column}), 0)"),
+    ("month", 2629746, "DATEFROMPARTS(YEAR({column}), MONTH({column}), 1)"),
+    ("quarter", 7889238, "DATEFROMPARTS(YEAR({column}), (DATEPART(quarter, {column}) - 1) * 3 + 1, 1)"),
+    ("year", 31556952, "DATEFROMPARTS(YEAR({column}), 1, 1)"),
+]
+
+
+def column_kind(field):
+    """
+    Classify a result column for charting.
+
+    Args:
+        field (pa.Field): Column of the result table
+
+    Returns:
+        str: "temporal", "numeric", "category", or None if the column can't be charted
+    """
+    if pa.types.is_timestamp(field.type) or pa.types.is_date(field.type):
+        return "temporal"
+    if pa.types.is_integer(field.type) or pa.types.is_floating(field.type) or pa.types.is_decimal(field.type):
+        return None if is_id_column(field.name) else "numeric"
+    if pa.types.is_string(field.type) or pa.types.is_boolean(field.type):
+        return "category"
+    return None
+
+
+def infer_chart(schema):
+    """
+    Pick a chart for a result from its column types.
+    - date/time + numbers -> line chart over time
+    - text + numbers -> bar chart per category
+    - numbers only -> line chart of the other numbers over the first one
+
+    Args:
+        schema (pa.Schema): Result schema
+
+    Returns:
+        dict: {"type", "x", "x_kind", "y"} or None if no useful chart exists
+    """
+    columns = {"temporal": [], "numeric": [], "category": []}
+    for field in schema:
+        kind = column_kind(field)
+        if kind:
+            columns[kind].append(field.name)
+
+    if columns["temporal"] and columns["numeric"]:
+        x, x_kind, y = columns["temporal"][0], "temporal", columns["numeric"]
+    elif columns["category"] and columns["numeric"]:
+        x, x_kind, y = columns["category"][0], "category", columns["numeric"]
+    elif len(columns["numeric"]) >= 2:
+        x, x_kind, y = columns["numeric"][0], "numeric", columns["numeric"][1:]
+    else:
+        return None
+
+    chart_type = "bar" if x_kind == "category" else "line"
+    return {"type": chart_type, "x": x, "x_kind": x_kind, "y": y[:MAX_CHART_SERIES]}
+
+
+def choose_date_bucket(span_seconds, is_timestamp=True):
+    """
+    Pick the finest date bucket that keeps the chart within MAX_CHART_POINTS.
+
+    Args:
+        span_seconds (float): Time between the first and last value
+        is_timestamp (bool): Whether the column has a time part (hour buckets need one)
+
+    Returns:
+        tuple: (bucket name, SQL expression template)
+    """
+    for name, seconds, template in DATE_BUCKETS:
+        if name == "hour" and not is_timestamp:
+            continue
+        if span_seconds / seconds <= MAX_CHART_POINTS:
+            return name, template
+    return DATE_BUCKETS[-1][0], DATE_BUCKETS[-1][2]
+
+
+def build_range_query(inner_query, x_column):
+    """
+    Build a query for the first and last value of the x column.
+
+    Returns:
+        str: SQL returning one row (min, max)
+    """
+    x = quote_identifier(x_column)
+    return f"SELECT MIN({x}), MAX({x}) FROM ({inner_query}) AS q"
+
+
+def build_bucket_query(inner_query, x_column, y_columns, bucket_template):
+    """
+    Build a query averaging the value columns per date bucket on the server.
+
+    Args:
+        inner_query (str): Query from prepare_inner_query()
+        x_column (str): Date/time column
+        y_columns (list): Numeric columns
+        bucket_template (str): SQL expression template from DATE_BUCKETS
+
+    Returns:
+        str: SQL returning one row per bucket, in date order
+    """
+    bucket = bucket_template.format(column=quote_identifier(x_column))
+    values = ", ".join(
+        f"AVG(CAST({quote_identifier(column)} AS FLOAT)) AS {quote_identifier(column)}" for column in y_columns
+    )
+    return (
+        f"SELECT {bucket} AS {quote_identifier(x_column)}, {values} "
+        f"FROM ({inner_query}) AS q WHERE {quote_identifier(x_column)} IS NOT NULL "
+        f"GROUP BY {bucket} ORDER BY 1"
+    )
+
+
+def build_category_query(inner_query, x_column, y_columns):
+    """
+    Build a query averaging the value columns per category on the server,
+    keeping the MAX_BAR_CATEGORIES categories with the largest first value.
+
+    Returns:
+        str: SQL returning one row per category
+    """
+    x = quote_identifier(x_column)
+    values = ", ".join(
+        f"AVG(CAST({quote_identifier(column)} AS FLOAT)) AS {quote_identifier(column)}" for column in y_columns
+    )
+    return (
+        f"SELECT TOP {MAX_BAR_CATEGORIES} {x}, {values} "
+        f"FROM ({inner_query}) AS q GROUP BY {x} ORDER BY 2 DESC"
+    )
+
+
+def build_series_query(inner_query, x_column, y_columns):
+    """
+    Build a query for the chart columns only, ordered by x (input for LTTB downsampling).
+
+    Returns:
+        str: SQL returning the x and value columns
+    """
+    x = quote_identifier(x_column)
+    values = ", ".join(quote_identifier(column) for column in y_columns)
+    return f"SELECT {x}, {values} FROM ({inner_query}) AS q WHERE {x} IS NOT NULL ORDER BY {x}"
+
+
+def lttb_indices(xs, ys, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+    Keeps the first and last point and, from each bucket in between, the point
+    forming the largest triangle with its neighbours - preserving peaks and dips.
+
+    Args:
+        xs (list): X values as numbers, in ascending order
+        ys (list): Y values as numbers
+        threshold (int): Number of points to keep
+
+    Returns:
+        list: Indices of the points to keep
+    """
+    count = len(xs)
+    if threshold >= count or threshold < 3:
+        return list(range(count))
+
+    indices = [0]
+    bucket_size = (count - 2) / (threshold - 2)
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+
+        # Average of the next bucket (the last point for the final bucket)
+        next_start = end
+        next_end = min(int((bucket + 2) * bucket_size) + 1, count)
+        if next_start >= next_end:
+            next_start, next_end = count - 1, count
+        average_x = sum(xs[next_start:next_end]) / (next_end - next_start)
+        average_y = sum(ys[next_start:next_end]) / (next_end - next_start)
+
+        best_index = start
+        best_area = -1.0
+        for index in range(start, min(end, count - 1)):
+            area = abs(
+                (xs[previous] - average_x) * (ys[index] - ys[previous])
+                - (xs[previous] - xs[index]) * (average_y - ys[previous])
+            )
+            if area > best_area:
+                best_area = area
+                best_index = index
+        indices.append(best_index)
+        previous = best_index
+
+    indices.append(count - 1)
+    return indices
+
+
+def to_plot_numbers(array):
+    """Convert an Arrow column (numbers, dates, timestamps) to floats for LTTB (None -> 0)"""
+    if pa.types.is_date(array.type):
+        array = pc.cast(array, pa.timestamp("s"))
+    if pa.types.is_timestamp(array.type):
+        array = pc.cast(array, pa.int64())
+    return [0.0 if value is None else float(value) for value in pc.cast(array, pa.float64()).to_pylist()]
+
+
+def prepare_chart_table(table, spec, max_points=MAX_CHART_POINTS):
+    """
+    Select the chart columns, convert decimals to floats and downsample with
+    LTTB (on the first value column) if there are more than max_points rows.
+
+    Args:
+        table (pa.Table): Result rows
+        spec (dict): Chart from infer_chart()
+        max_points (int): Most points to keep
+
+    Returns:
+        tuple: (pa.Table, original row count)
+    """
+    table = table.select([spec["x"]] + spec["y"])
+    for index, field in enumerate(table.schema):
+        if pa.types.is_decimal(field.type):
+            table = table.set_column(index, field.name, pc.cast(table.column(index), pa.float64()))
+
+    original_rows = table.num_rows
+    if spec["x_kind"] == "category":
+        # One bar per category (averaged), largest first
+        grouped = table.group_by(spec["x"]).aggregate([(column, "mean") for column in spec["y"]])
+        table = pa.table(
+            [grouped.column(spec["x"])] + [grouped.column(f"{column}_mean") for column in spec["y"]],
+            names=[spec["x"]] + spec["y"]
+        )
+        table = table.sort_by([(spec["y"][0], "descending")]).slice(0, MAX_BAR_CATEGORIES)
+    elif table.num_rows > max_points:
+        table = table.sort_by(spec["x"])
+        xs = to_plot_numbers(table.column(spec["x"]).combine_chunks())
+        ys = to_plot_numbers(table.column(spec["y"][0]).combine_chunks())
+        table = table.take(lttb_indices(xs, ys, max_points))
+    return table, original_rows
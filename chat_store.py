@@ -0,0 +1,214 @@
+import io
+import sqlite3
+import threading
+import time
+import uuid
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_sessions_user ON sessions (user_id, created_at);
+
+CREATE TABLE IF NOT EXISTS results (
+    result_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    row_count INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS messages (
+    message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL REFERENCES sessions (session_id),
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    result_id INTEGER REFERENCES results (result_id),
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_messages_session ON messages (session_id, message_id);
+"""
+
+
+class ChatStore:
+    """
+    Append-only conversation store in a local SQLite file.
+    Messages are grouped in per-user sessions; result tables are stored as
+    zstd-compressed Parquet blobs and referenced from their message.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def create_session(self, user_id):
+        """Start a new conversation and return its session ID"""
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, user_id, created_at) VALUES (?, ?, ?)",
+                (session_id, user_id, time.time())
+            )
+            self._conn.commit()
+        return session_id
+
+    def session_exists(self, session_id, user_id):
+        """Check that a session exists and belongs to the user"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM sessions WHERE session_id = ? AND user_id = ?", (session_id, user_id)
+            ).fetchone()
+        return row is not None
+
+    def list_sessions(self, user_id, limit=10):
+        """
+        List a user's most recent conversations.
+
+        Returns:
+            list: Dicts with "session_id", "created_at" and "title" (first user question)
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT s.session_id, s.created_at,
+                       (SELECT m.content FROM messages m
+                        WHERE m.session_id = s.session_id AND m.role = 'user'
+                        ORDER BY m.message_id LIMIT 1)
+                FROM sessions s
+                WHERE s.user_id = ?
+                ORDER BY s.created_at DESC
+                LIMIT ?
+                """,
+                (user_id, limit)
+            ).fetchall()
+        return [{"session_id": row[0], "created_at": row[1], "title": row[2]} for row in rows]
+
+    def append_message(self, session_id, role, content, result_table=None):
+        """
+        Append a message, optionally with its result table.
+
+        Args:
+            session_id (str): Conversation ID
+            role (str): "user" or "assistant"
+            content (str): Markdown content
+            result_table (pa.Table): Result to store with the message (optional)
+
+        Returns:
+            dict: The stored message
+        """
+        blob = None
+        if result_table is not None and result_table.num_rows:
+            import pyarrow.parquet as pq
+
+            buffer = io.BytesIO()
+            pq.write_table(result_table, buffer, compression="zstd")
+            blob = buffer.getvalue()
+
+        now = time.time()
+        with self._lock:
+            result_id = None
+            if blob is not None:
+                cursor = self._conn.execute(
+                    "INSERT INTO results (row_count, data, created_at) VALUES (?, ?, ?)",
+                    (result_table.num_rows, blob, now)
+                )
+                result_id = cursor.lastrowid
+            cursor = self._conn.execute(
+                "INSERT INTO messages (session_id, role, content, result_id, created_at) VALUES (?, ?, ?, ?, ?)",
+                (session_id, role, content, result_id, now)
+            )
+            self._conn.commit()
+        return {
+            "message_id": cursor.lastrowid,
+            "role": role,
+            "content": content,
+            "result_id": result_id,
+            "row_count": result_table.num_rows if result_id else 0,
+        }
+
+    def count_messages(self, session_id):
+        """Number of messages in a conversation"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+
+    def load_messages(self, session_id, limit):
+        """
+        Load the most recent messages of a conversation (without result data).
+
+        Args:
+            session_id (str): Conversation ID
+            limit (int): Number of most recent messages
+
+        Returns:
+            list: Messages in chronological order
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT m.message_id, m.role, m.content, m.result_id, r.row_count
+                FROM messages m
+                LEFT JOIN results r ON r.result_id = m.result_id
+                WHERE m.session_id = ?
+                ORDER BY m.message_id DESC
+                LIMIT ?
+                """,
+                (session_id, limit)
+            ).fetchall()
+        return [
+            {"message_id": row[0], "role": row[1], "content": row[2], "result_id": row[3], "row_count": row[4] or 0}
+            for row in reversed(rows)
+        ]
+
+    def question_pairs(self, user_id, limit=2000):
+        """
+        Consecutive questions asked in the user's conversations (newest first),
+        the history follow-up suggestions are learned from.
+
+        Args:
+            user_id (str): User ID
+            limit (int): Number of most recent questions to scan
+
+        Returns:
+            list: (question, next question) tuples
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT m.session_id, m.content
+                FROM messages m
+                JOIN sessions s ON s.session_id = m.session_id
+                WHERE s.user_id = ? AND m.role = 'user'
+                ORDER BY m.message_id DESC
+                LIMIT ?
+                """,
+                (user_id, limit)
+            ).fetchall()
+        pairs = []
+        following = {}
+        for session_id, content in rows:
+            if session_id in following:
+                pairs.append((content, following[session_id]))
+            following[session_id] = content
+        return pairs
+
+    def load_result(self, result_id):
+        """
+        Load a stored result table.
+
+        Returns:
+            pa.Table: The result, or None if it doesn't exist
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM results WHERE result_id = ?", (result_id,)).fetchone()
+        if row is None:
+            return None
+        import pyarrow.parquet as pq
+
+        return pq.read_table(io.BytesIO(row[0]))
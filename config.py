@@ -1,4 +1,5 @@
 import os
+import json
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -16,6 +17,42 @@ DB_USERNAME = os.getenv('DB_USERNAME')
 DB_PASSWORD = os.getenv('DB_PASSWORD')
 DB_DRIVER = 'ODBC Driver 17 for SQL Server'
 
+# Additional databases served by this deployment (JSON list), e.g.
+# [{"name": "North School", "server": "sql1", "database": "NorthDB"}]
+# username/password default to DB_USERNAME/DB_PASSWORD; "replicas" lists read-replica hosts
+DB_TARGETS = os.getenv('DB_TARGETS', '')
+
+# Read replicas of the default database (comma-separated hosts).
+# Generated queries are load-balanced across them with ApplicationIntent=ReadOnly.
+DB_READ_REPLICAS = os.getenv('DB_READ_REPLICAS', '')
+
+# Chat History Configuration
+CHAT_DB_PATH = os.getenv('CHAT_DB_PATH', 'chat_history.db')
+
+# Query Workload Log (every executed query, for the workload analyzer)
+WORKLOAD_LOG_PATH = os.getenv('WORKLOAD_LOG_PATH', 'query_workload.db')
+# Runs older than this are deleted from the log (0 keeps them forever)
+WORKLOAD_LOG_RETENTION_DAYS = float(os.getenv('WORKLOAD_LOG_RETENTION_DAYS', '30'))
+
+# Speculative prefetch: generate and run the SQL of suggested follow-up questions
+# in the background (default for the sidebar toggle; costs extra AI calls)
+SPECULATIVE_PREFETCH = os.getenv('SPECULATIVE_PREFETCH', 'false').lower() in ('1', 'true', 'yes')
+
+# Session memory budgets (session_memory.py): result DataFrames kept in memory per
+# session and across all sessions before the least recently used are spilled to
+# compressed files under SESSION_SPILL_DIR (default: the temp directory).
+# Cached results of sessions idle longer than SESSION_IDLE_TIMEOUT_MINUTES are released.
+SESSION_MEMORY_BUDGET_MB = float(os.getenv('SESSION_MEMORY_BUDGET_MB', '64'))
+SESSION_MEMORY_TOTAL_MB = float(os.getenv('SESSION_MEMORY_TOTAL_MB', '512'))
+SESSION_SPILL_DIR = os.getenv('SESSION_SPILL_DIR', '')
+SESSION_IDLE_TIMEOUT_MINUTES = float(os.getenv('SESSION_IDLE_TIMEOUT_MINUTES', '60'))
+
+# Headless HTTP API (api.py). When QUERY_API_KEY is set, requests must send it
+# in the X-API-Key header; without it, only bind the API to localhost.
+QUERY_API_KEY = os.getenv('QUERY_API_KEY')
+QUERY_API_HOST = os.getenv('QUERY_API_HOST', '127.0.0.1')
+QUERY_API_PORT = int(os.getenv('QUERY_API_PORT', '8600'))
+
 # Validation function
 def validate_config():
     """Validate required configuration variables"""
@@ -30,16 +67,46 @@ def validate_config():
     if not DB_PASSWORD:
         errors.append("DB_PASSWORD is not set in .env file")
     
+    if DB_TARGETS:
+        try:
+            targets = json.loads(DB_TARGETS)
+        except ValueError as e:
+            errors.append(f"DB_TARGETS is not valid JSON: {e}")
+        else:
+            if not isinstance(targets, list) or not all(is_valid_target(target) for target in targets):
+                errors.append('DB_TARGETS must be a JSON list of objects with "name", "server" and "database"')
+    
     return errors
 
-def build_connection_string(server=None, database=None, username=None, password=None):
-    """Build connection string with provided or default values"""
-    return (
+def is_valid_target(target):
+    """Check that a DB_TARGETS entry names its database"""
+    return isinstance(target, dict) and all(isinstance(target.get(key), str) and target[key] for key in ("name", "server", "database"))
+
+def build_connection_string(server=None, database=None, username=None, password=None, read_only=False):
+    """Build connection string with provided or default values (read_only adds ApplicationIntent=ReadOnly)"""
+    connection_string = (
         f"DRIVER={{{DB_DRIVER}}};"
         f"SERVER={server or DB_SERVER};"
         f"DATABASE={database or DB_NAME};"
         f"UID={username or DB_USERNAME};"
         f"PWD={password or DB_PASSWORD}"
     )
+    if read_only:
+        connection_string += ";ApplicationIntent=ReadOnly"
+    return connection_string
+
+CONNECTION_STRING = build_connection_string()
 
-CONNECTION_STRING = build_connection_string()
\ No newline at end of file
+def get_database_targets():
+    """Get the configured databases: the default one first, then DB_TARGETS"""
+    replicas = [host.strip() for host in DB_READ_REPLICAS.split(',') if host.strip()]
+    targets = [{"name": f"{DB_NAME} on {DB_SERVER}", "server": DB_SERVER, "database": DB_NAME, "replicas": replicas}]
+    if DB_TARGETS:
+        # Invalid JSON or entries are reported by validate_config()
+        try:
+            extra = json.loads(DB_TARGETS)
+        except ValueError:
+            extra = []
+        if isinstance(extra, list):
+            targets.extend(target for target in extra if is_valid_target(target))
+    return targets
@@ -0,0 +1,135 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+# Connections kept open per connection string
+POOL_SIZE = 5
+CONNECT_TIMEOUT = 10
+# Connections idle longer than this are checked (SELECT 1) before they are reused
+VALIDATE_AFTER_IDLE = 30  # seconds
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """
+    Small thread-safe pool of pyodbc connections for one connection string.
+    Idle connections are reused; connections that raised a database error are
+    discarded instead of being returned to the pool. A connection idle for more
+    than VALIDATE_AFTER_IDLE is checked first: if it died (server restart or
+    failover), so did the other idle ones, and they are all closed.
+    """
+
+    def __init__(self, connection_string, size=POOL_SIZE):
+        self.connection_string = connection_string
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self):
+        """Get an idle connection or open a new one"""
+        return self.checkout()[0]
+
+    def checkout(self):
+        """
+        Get an idle connection (checked if it was idle a while) or open a new one.
+
+        Returns:
+            tuple: (connection, reused) - reused is False for a newly opened connection
+        """
+        import pyodbc
+
+        while True:
+            try:
+                conn, released_at = self._idle.get_nowait()
+            except queue.Empty:
+                return pyodbc.connect(self.connection_string, timeout=CONNECT_TIMEOUT), False
+            if time.monotonic() - released_at <= VALIDATE_AFTER_IDLE or is_alive(conn):
+                return conn, True
+            close_quietly(conn)
+            self.close_all()
+
+    def release(self, conn, discard=False):
+        """Return a connection to the pool (or close it if discarded or the pool is full)"""
+        import pyodbc
+
+        if not discard:
+            try:
+                conn.rollback()  # End any implicit transaction left by SELECTs
+                self._idle.put_nowait((conn, time.monotonic()))
+                return
+            except (queue.Full, pyodbc.Error):
+                pass
+        close_quietly(conn)
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection for the duration of a `with` block.
+
+        Example:
+            with get_pool(conn_str).connection() as conn:
+                cursor = conn.cursor()
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            # A failed block may leave a broken connection or a query running - don't reuse it
+            self.release(conn, discard=True)
+            raise
+        else:
+            self.release(conn)
+
+    def close_all(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            close_quietly(conn)
+
+
+def is_alive(conn):
+    """Check a pooled connection with a cheap round-trip"""
+    import pyodbc
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+        cursor.close()
+        return True
+    except pyodbc.Error:
+        return False
+
+
+def close_quietly(conn):
+    """Close a connection, ignoring errors (it may already be broken)"""
+    import pyodbc
+
+    try:
+        conn.close()
+    except pyodbc.Error:
+        pass
+
+
+def get_pool(connection_string):
+    """
+    Get the shared connection pool for a connection string.
+    Pools live for the lifetime of the process and are shared by all sessions.
+
+    Args:
+        connection_string (str): ODBC connection string
+
+    Returns:
+        ConnectionPool: Pool for this connection string
+    """
+    with _pools_lock:
+        pool = _pools.get(connection_string)
+        if pool is None:
+            pool = ConnectionPool(connection_string)
+            _pools[connection_string] = pool
+        return pool
@@ -0,0 +1,300 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import config
+from db_pool import get_pool
+
+# Cache sizes and lifetimes per database target
+SCHEMA_TTL = 3600  # seconds
+SCHEMA_ERROR_TTL = 60  # seconds - retry failed schema loads soon
+NL_SQL_CACHE_SIZE = 256
+RESULT_CACHE_SIZE = 32
+RESULT_CACHE_TTL = 300  # seconds
+REPLICA_RETRY_AFTER = 30  # seconds a failed replica is skipped before it is tried again
+
+_targets = OrderedDict()
+_targets_lock = threading.Lock()
+
+
+class LRUCache:
+    """Thread-safe bounded LRU cache with an optional time-to-live"""
+
+    def __init__(self, max_entries, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, stored_at = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def is_connection_error(error):
+    """Check whether a pyodbc error means the server couldn't be reached (SQLSTATE class 08 or timeout)"""
+    sqlstate = str(error.args[0]) if error.args else ""
+    return sqlstate.startswith("08") or sqlstate == "HYT00"
+
+
+class DatabaseTarget:
+    """
+    One database the app can query.
+    Each target has its own connection pool, schema catalog, NL->SQL cache
+    and result cache, so targets never evict each other's warm state.
+    Read queries can be routed to read replicas (round robin, skipping
+    replicas that recently failed); schema loads always use the primary.
+    """
+
+    def __init__(self, name, server, database, username, password, replicas=()):
+        self.name = name
+        self.server = server
+        self.database = database
+        self.username = username
+        self.password = password
+        self.replicas = tuple(replicas)
+        self.connection_string = config.build_connection_string(server, database, username, password)
+        self.replica_connection_strings = [
+            config.build_connection_string(host, database, username, password, read_only=True)
+            for host in self.replicas
+        ]
+        # Identifies the target in process-wide structures (jobs, async pools): a
+        # session's own target may share a name with another session's
+        self.key = hashlib.sha256(repr((name,) + self.settings()).encode("utf-8")).hexdigest()[:16]
+        self._replica_down_until = {}
+        self._next_replica = 0
+        self._replica_lock = threading.Lock()
+        self.nl_sql_cache = LRUCache(NL_SQL_CACHE_SIZE)
+        self.result_cache = LRUCache(RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL)
+        self._schema = None
+        self._schema_loaded_at = 0.0
+        self._schema_lock = threading.Lock()
+
+    @property
+    def pool(self):
+        """Connection pool for this database"""
+        return get_pool(self.connection_string)
+
+    def settings(self):
+        """Connection settings that identify this target"""
+        return (self.server, self.database, self.username, self.password, self.replicas)
+
+    def healthy_replicas(self):
+        """
+        Replica connection strings in round-robin order, skipping replicas that failed recently.
+
+        Returns:
+            list: Connection strings to try, in order
+        """
+        now = time.monotonic()
+        with self._replica_lock:
+            count = len(self.replica_connection_strings)
+            start = self._next_replica
+            self._next_replica = (start + 1) % count if count else 0
+            ordered = [self.replica_connection_strings[(start + i) % count] for i in range(count)]
+            return [conn_str for conn_str in ordered if self._replica_down_until.get(conn_str, 0) <= now]
+
+    def mark_replica_down(self, connection_string):
+        """Skip a replica for REPLICA_RETRY_AFTER seconds"""
+        with self._replica_lock:
+            self._replica_down_until[connection_string] = time.monotonic() + REPLICA_RETRY_AFTER
+
+    def replica_status(self):
+        """
+        Health of each replica.
+
+        Returns:
+            list: (host, is_healthy) tuples
+        """
+        now = time.monotonic()
+        with self._replica_lock:
+            return [
+                (host, self._replica_down_until.get(conn_str, 0) <= now)
+                for host, conn_str in zip(self.replicas, self.replica_connection_strings)
+            ]
+
+    def acquire_read(self, fresh=False):
+        """
+        Open (or reuse) a connection for a read query.
+        Tries the healthy replicas in round-robin order and falls back to the
+        primary when there are none, all fail, or fresh data is required.
+
+        Args:
+            fresh (bool): Read from the primary (no replica lag)
+
+        Returns:
+            tuple: (pool, connection, reused) - reused is False for a newly opened connection
+        """
+        import pyodbc
+
+        if not fresh:
+            for conn_str in self.healthy_replicas():
+                pool = get_pool(conn_str)
+                try:
+                    return (pool,) + pool.checkout()
+                except pyodbc.Error:
+                    self.mark_replica_down(conn_str)
+        pool = self.pool
+        return (pool,) + pool.checkout()
+
+    @contextmanager
+    def read_connection(self, fresh=False):
+        """
+        Borrow a connection for read queries for the duration of a `with` block.
+        A replica whose new connection is lost mid-query is marked down. A reused
+        connection that is lost may just be stale (the server restarted or failed
+        over since it was pooled): the pool's idle connections are closed instead,
+        so a retry connects afresh.
+
+        Args:
+            fresh (bool): Read from the primary (no replica lag)
+        """
+        import pyodbc
+
+        pool, conn, reused = self.acquire_read(fresh)
+        try:
+            yield conn
+        except BaseException as e:
+            pool.release(conn, discard=True)
+            if isinstance(e, pyodbc.Error) and is_connection_error(e):
+                if reused:
+                    pool.close_all()
+                elif pool is not self.pool:
+                    self.mark_replica_down(pool.connection_string)
+            raise
+        else:
+            pool.release(conn)
+
+    def get_schema(self, loader):
+        """
+        Get the cached schema text, loading it when missing or expired.
+
+        Args:
+            loader (callable): loader(connection_string, server, database) -> schema text
+
+        Returns:
+            str: Schema text
+        """
+        with self._schema_lock:
+            ttl = SCHEMA_ERROR_TTL if self._schema and "❌" in self._schema else SCHEMA_TTL
+            if self._schema is None or time.monotonic() - self._schema_loaded_at > ttl:
+                self._schema = loader(self.connection_string, self.server, self.database)
+                self._schema_loaded_at = time.monotonic()
+            return self._schema
+
+    def peek_schema(self):
+        """The schema if one was loaded (even if due for a reload), or None - never loads or waits"""
+        return self._schema
+
+    def load_schema_in_background(self, loader, executor):
+        """
+        Start loading the schema on an executor, unless it is loaded or already loading.
+
+        Args:
+            loader (callable): loader(connection_string, server, database) -> schema text
+            executor (Executor): Where to run the load
+        """
+        if self._schema is None and not self._schema_lock.locked():
+            executor.submit(self.get_schema, loader)
+
+    def clear_caches(self):
+        """Forget the schema, generated SQL and results of this database only"""
+        with self._schema_lock:
+            self._schema = None
+        self.nl_sql_cache.clear()
+        self.result_cache.clear()
+
+
+def build_target(name, server, database, username=None, password=None, replicas=(), existing=None):
+    """
+    Create a database target without registering it (e.g., a connection one
+    session entered), or keep an existing one whose settings are unchanged
+    (and so its warm caches).
+
+    Args:
+        name (str): Display name
+        server (str): SQL Server host
+        database (str): Database name
+        username (str): Login (defaults to DB_USERNAME)
+        password (str): Password (defaults to DB_PASSWORD)
+        replicas (list): Read-replica hosts (optional)
+        existing (DatabaseTarget): Target to keep if its settings match (optional)
+
+    Returns:
+        DatabaseTarget: existing, or a new target
+    """
+    username = username or config.DB_USERNAME
+    password = password or config.DB_PASSWORD
+    replicas = tuple(replicas or ())
+    if existing is not None and existing.name == name and existing.settings() == (server, database, username, password, replicas):
+        return existing
+    return DatabaseTarget(name, server, database, username, password, replicas)
+
+
+def register_target(name, server, database, username=None, password=None, replicas=()):
+    """
+    Add a database target for every session, or update it if its settings changed.
+    Unchanged targets keep their warm caches.
+
+    Args:
+        name (str): Display name
+        server (str): SQL Server host
+        database (str): Database name
+        username (str): Login (defaults to DB_USERNAME)
+        password (str): Password (defaults to DB_PASSWORD)
+        replicas (list): Read-replica hosts (optional)
+
+    Returns:
+        DatabaseTarget: The registered target
+    """
+    with _targets_lock:
+        target = build_target(name, server, database, username, password, replicas, existing=_targets.get(name))
+        _targets[name] = target
+        return target
+
+
+def load_configured_targets():
+    """Register the databases from config (DB_TARGETS plus the default DB_SERVER/DB_NAME)"""
+    for settings in config.get_database_targets():
+        register_target(
+            settings["name"], settings["server"], settings["database"],
+            settings.get("username"), settings.get("password"), settings.get("replicas")
+        )
+
+
+def get_target(name):
+    """Get a registered target by name (None if unknown)"""
+    if not _targets:
+        load_configured_targets()
+    return _targets.get(name)
+
+
+def list_targets():
+    """Names of all registered targets, in registration order"""
+    if not _targets:
+        load_configured_targets()
+    return list(_targets.keys())
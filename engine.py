@@ -0,0 +1,578 @@
+import asyncio
+import re
+import time
+
+from db_registry import get_target, list_targets, is_connection_error
+from pipeline import (
+    AsyncPipeline, StageTimeout, complete, build_ai_messages, get_nl_sql_cache_key, get_db_executor,
+    parse_ai_response, fix_sql_syntax, extract_sql_from_response, is_sql_query, validate_query_safety,
+    summarize_results
+)
+
+MAX_RETRIES = 3
+RETRY_DELAY = 1  # seconds
+MAX_REPAIR_ATTEMPTS = 2
+REPAIR_TIME_BUDGET = 20  # seconds
+# Rows an answer includes unless the caller asks for another limit
+DEFAULT_MAX_ROWS = 1000
+
+# Database errors the model can usually fix by rewriting the query
+REPAIRABLE_ERRORS = [
+    "Invalid column name",
+    "Invalid object name",
+    "Incorrect syntax",
+    "Ambiguous column name",
+    "could not be bound",
+    "is not contained in either an aggregate function or the GROUP BY clause",
+    "Conversion failed",
+]
+
+
+def record_query_run(target, query, started, row_count=None, error=None):
+    """
+    Append a query execution to the workload log.
+    Only queues the run (the log writes in batches), so it's safe to call on the event loop.
+    Logging problems never fail the query.
+
+    Args:
+        target (DatabaseTarget): Database the query ran on
+        query (str): Executed SQL
+        started (float): time.monotonic() when execution started
+        row_count (int): Rows returned (optional)
+        error (str): Error message if the query failed (optional)
+    """
+    from workload_log import get_workload_log
+
+    workload_log = get_workload_log()
+    if workload_log is None:
+        return
+    try:
+        workload_log.record(target.name, query, (time.monotonic() - started) * 1000, row_count, error)
+    except Exception:
+        pass
+
+
+def is_repairable_error(error_message):
+    """
+    Check if a database error is one the model can fix by rewriting the query.
+
+    Args:
+        error_message (str): Raw database error message
+
+    Returns:
+        bool: True if the query is worth sending back for repair
+    """
+    if not error_message:
+        return False
+    return any(marker.lower() in error_message.lower() for marker in REPAIRABLE_ERRORS)
+
+
+def check_query_compiles(cursor, query):
+    """
+    Cheaply validate a query with SET NOEXEC ON.
+    SQL Server parses and compiles the statement without executing it, so syntax
+    errors and unknown columns of existing tables are caught before it runs.
+    Missing tables are not: deferred name resolution postpones "Invalid object
+    name" errors to execution.
+
+    Args:
+        cursor: Open pyodbc cursor
+        query (str): SQL query to validate
+
+    Returns:
+        tuple: (is_valid, error_message)
+    """
+    import pyodbc
+
+    try:
+        cursor.execute("SET NOEXEC ON")
+        cursor.execute(query)
+        return True, None
+    except pyodbc.Error as e:
+        return False, str(e)
+    finally:
+        try:
+            cursor.execute("SET NOEXEC OFF")
+        except pyodbc.Error:
+            pass
+
+
+def get_relevant_schema(schema_text, query, error_message=""):
+    """
+    Extract only the schema fragment relevant to a failed query.
+    Keeps tables referenced by the query, tables they point to via foreign keys,
+    and tables owning any column named in the error message.
+
+    Args:
+        schema_text (str): Full schema text (load_database_schema() format)
+        query (str): Failed SQL query
+        error_message (str): Database error message
+
+    Returns:
+        str: Schema fragment (falls back to the full schema if nothing matches)
+    """
+    blocks = [block.strip() for block in schema_text.split("\n\n") if block.strip().startswith("Table:")]
+    if not blocks:
+        return schema_text
+
+    # Map full table name (e.g., "dbo.Students") to its schema block
+    tables = {}
+    for block in blocks:
+        full_name = block.splitlines()[0].replace("Table:", "").strip()
+        tables[full_name] = block
+
+    def is_referenced(full_name, text):
+        simple_name = full_name.split('.')[-1]
+        pattern = r'(?<![\w.])(?:\[?\w+\]?\.)?\[?' + re.escape(simple_name) + r'\]?(?!\w)'
+        return re.search(pattern, text, re.IGNORECASE) is not None
+
+    selected = [name for name in tables if is_referenced(name, query)]
+
+    # Follow outgoing foreign keys - the missing column often lives in a related table
+    for name in list(selected):
+        for ref_name in re.findall(r'FOREIGN KEY -> ([\w]+\.[\w]+)\.\w+', tables[name]):
+            if ref_name in tables and ref_name not in selected:
+                selected.append(ref_name)
+
+    # Tables that actually own a column named in the error (e.g., Invalid column name 'Score')
+    for column_name in re.findall(r"'([^']+)'", error_message or ""):
+        for name, block in tables.items():
+            if name not in selected and re.search(r'^- ' + re.escape(column_name) + r' \(', block, re.MULTILINE | re.IGNORECASE):
+                selected.append(name)
+
+    if not selected:
+        return schema_text
+
+    return "DATABASE SCHEMA (relevant tables):\n\n" + "\n\n".join(tables[name] for name in selected)
+
+
+def get_engine(database=None, client=None):
+    """
+    Get a QueryEngine for a registered database.
+
+    Args:
+        database (str): Target name (optional, default the first configured database)
+        client: AsyncAzureOpenAI client (optional, default from config)
+
+    Returns:
+        QueryEngine, or None if no database has that name
+    """
+    target = get_target(database or list_targets()[0])
+    return QueryEngine(target, client) if target else None
+
+
+class QueryEngine(AsyncPipeline):
+    """
+    The app's question answering without Streamlit: SQL generation with retries
+    and the NL→SQL cache, safety checks, compile checks and AI repairs of failing
+    queries, execution with the result cache, replica failover and the workload
+    log, then the summary.
+    The chat UI, the HTTP API (api.py) and the batch CLI (batch.py) all run
+    questions through it, so they share caches and behave the same.
+
+    Example:
+        engine = get_engine()
+        answer = run_sync(engine.ask("How many students are there?"))
+    """
+
+    def available_client(self):
+        """The AI client, or None if it can't be created (e.g., no API key configured)"""
+        try:
+            return self.client
+        except Exception:
+            return None
+
+    async def nl_sql_cache_key(self, question, history=None):
+        """NL→SQL cache key of a question in its conversation on this database"""
+        return get_nl_sql_cache_key(build_ai_messages(await self.system_prompt(), question, history))
+
+    async def generate_sql(self, question, history=None):
+        """
+        Generate SQL (or a conversational answer) for a question.
+        Transient AI failures are retried; failures are returned as "Error: ..." text.
+        Generated SQL is not cached here: only a query that ran (after any repairs)
+        goes into the NL→SQL cache, see remember_sql().
+
+        Args:
+            question (str): User question
+            history (list): Previous {"role", "content"} messages (optional)
+
+        Returns:
+            tuple: (query_or_response, needs_database)
+        """
+        messages = build_ai_messages(await self.system_prompt(), question, history)
+
+        # Same question in the same context on the same database -> reuse the SQL that answered it
+        cache_key = get_nl_sql_cache_key(messages)
+        cached_query = self.target.nl_sql_cache.get(cache_key)
+        if cached_query is not None:
+            return fix_sql_syntax(cached_query), True
+
+        client = self.available_client()
+        if not client:
+            return "Error: OpenAI client not initialized. Check your API configuration.", False
+
+        for attempt in range(MAX_RETRIES):
+            try:
+                # Slightly higher temperature for better understanding
+                ai_response = await complete(client, messages, temperature=0.3, stage="generate", deployment=self.deployment)
+                if not ai_response:
+                    return "Error: Empty response from AI", False
+
+                # Conversational answer (NO_QUERY_NEEDED or not SQL) or SQL query
+                response, needs_database = parse_ai_response(ai_response)
+                if needs_database:
+                    response = fix_sql_syntax(response)
+                return response, needs_database
+
+            except Exception as e:
+                error_str = str(e)
+
+                # Rate limited: back off longer on each attempt
+                if "429" in error_str or "rate" in error_str.lower():
+                    if attempt < MAX_RETRIES - 1:
+                        await asyncio.sleep(RETRY_DELAY * (attempt + 1))
+                        continue
+                    return "Error: Rate limit exceeded. Please try again in a moment.", False
+
+                elif "401" in error_str or "authentication" in error_str.lower():
+                    return "Error: Authentication failed. Please check your API key in the sidebar.", False
+
+                elif "404" in error_str or "not found" in error_str.lower():
+                    return f"Error: Model '{self.deployment}' not found. Check deployment name.", False
+
+                else:
+                    if attempt < MAX_RETRIES - 1:
+                        await asyncio.sleep(RETRY_DELAY)
+                        continue
+                    return f"Error: {error_str}", False
+
+        return "Error: Maximum retries exceeded", False
+
+    def remember_sql(self, cache_key, query):
+        """
+        Cache the SQL that answered a question, once it ran successfully
+        (the final query after any repairs, never an unverified one).
+
+        Args:
+            cache_key (str): NL→SQL cache key of the question (see nl_sql_cache_key())
+            query (str): Query that produced the results
+        """
+        self.target.nl_sql_cache.put(cache_key, query)
+
+    async def execute(self, query, max_rows=None, as_arrow=True, fresh=False, job=None):
+        """
+        Validate and execute a query.
+        Queries run on a read replica when the database has any (falling back to
+        the primary); fresh-data queries run on the primary. Successful results are
+        kept briefly in the target's result cache, so repeating a question doesn't
+        run the query again.
+
+        Args:
+            query (str): SQL query to execute
+            max_rows (int): Maximum rows to fetch (optional, default all rows)
+            as_arrow (bool): Return a pyarrow Table with native column types
+            fresh (bool): Read from the primary and skip cached results
+            job (QueryJob): Background job running this query (optional)
+
+        Returns:
+            pa.Table (or list of dictionaries), or error dict
+        """
+        import pyodbc
+
+        # Validate query safety first
+        is_safe, error_msg = validate_query_safety(query)
+        if not is_safe:
+            return {"error": f"🛡️ Security: {error_msg}"}
+
+        cache_key = (query, max_rows, as_arrow)
+        if not fresh:
+            cached = self.target.result_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        for attempt in range(2):
+            started = time.monotonic()
+            try:
+                results = await self.database.fetch(query, max_rows, as_arrow, fresh, job)
+                record_query_run(self.target, query, started, len(results))
+                self.target.result_cache.put(cache_key, results)
+                return results
+
+            except pyodbc.Error as e:
+                if attempt == 0 and is_connection_error(e) and not (job and job.cancel_requested):
+                    # A replica that went away was marked down, and a stale pooled
+                    # connection (server restart or failover) had its pool emptied -
+                    # either way, retry once on a fresh connection
+                    continue
+                error_msg = str(e)
+                record_query_run(self.target, query, started, None, error_msg)
+                # Keep the raw driver message in "detail" so the repair loop can use it
+                if "Invalid object name" in error_msg:
+                    return {"error": f"Table or view not found. Please check the table name and schema.", "detail": error_msg}
+                elif "Invalid column name" in error_msg:
+                    return {"error": f"Column not found in the table.", "detail": error_msg}
+                elif "Syntax error" in error_msg or "Incorrect syntax" in error_msg:
+                    return {"error": f"SQL syntax error: {error_msg}", "detail": error_msg}
+                else:
+                    return {"error": f"Database error: {error_msg}", "detail": error_msg}
+
+            except StageTimeout as e:
+                record_query_run(self.target, query, started, None, str(e))
+                return {"error": f"Query timed out after {e.seconds:g} seconds."}
+
+            except Exception as e:
+                return {"error": f"Unexpected error: {str(e)}"}
+
+    async def check_compiles(self, query, fresh=False, job=None):
+        """
+        Validate a query with SET NOEXEC ON (compiled, not executed).
+        Best effort: connection problems count as valid, execution reports them.
+        Missing tables are not caught: with deferred name resolution, SQL Server
+        only reports "Invalid object name" when the query executes.
+
+        Returns:
+            tuple: (is_valid, error_message)
+        """
+        import pyodbc
+
+        def work():
+            with self.target.read_connection(fresh=fresh) as conn:
+                cursor = conn.cursor()
+                if job:
+                    job.attach_cursor(cursor)
+                result = check_query_compiles(cursor, query)
+                cursor.close()
+                return result
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(get_db_executor(), work)
+        except pyodbc.Error:
+            return True, None
+
+    async def repair_sql(self, question, query, error_message, schema_fragment, timeout=None):
+        """
+        Ask the model to fix a query that failed validation or execution.
+
+        Args:
+            question (str): Original user question
+            query (str): SQL query that failed
+            error_message (str): Raw database error message
+            schema_fragment (str): Schema of the tables relevant to the query
+            timeout (float): Seconds for the AI call (optional, default STAGE_TIMEOUTS["repair"])
+
+        Returns:
+            str: Corrected SQL query, or None if no usable fix was returned
+        """
+        client = self.available_client()
+        if not client:
+            return None
+
+        repair_prompt = f"""
+User asked: "{question}"
+
+This SQL Server query failed:
+{query}
+
+Error:
+{error_message}
+
+{schema_fragment}
+
+Fix the query so it answers the user's question and runs on Microsoft SQL Server.
+Use only the tables and columns listed above.
+Return ONLY the corrected SQL SELECT query (no explanations, no markdown).
+"""
+
+        try:
+            ai_response = await complete(
+                client,
+                [
+                    {"role": "system", "content": "You are an expert Microsoft SQL Server developer who fixes broken SELECT queries."},
+                    {"role": "user", "content": repair_prompt}
+                ],
+                temperature=0,
+                stage="repair",
+                timeout=timeout,
+                deployment=self.deployment
+            )
+            if not ai_response:
+                return None
+
+            fixed_query = fix_sql_syntax(extract_sql_from_response(ai_response))
+            if not is_sql_query(fixed_query) or fixed_query == query:
+                return None
+            return fixed_query
+
+        except Exception:
+            return None
+
+    async def execute_with_repair(self, question, query, max_rows=None, as_arrow=True, fresh=False, job=None):
+        """
+        Execute a generated query, automatically repairing it when it fails.
+        A query with a cached result is answered from the result cache right away.
+        Otherwise it is first validated with SET NOEXEC ON, so broken queries
+        (syntax, unknown columns of existing tables) are fixed before they are
+        executed. Execution errors are repaired as well - including missing
+        tables, which NOEXEC can't see because of deferred name resolution.
+        Repairs are bounded by MAX_REPAIR_ATTEMPTS and REPAIR_TIME_BUDGET.
+
+        Args:
+            question (str): Original user question
+            query (str): SQL query to execute
+            max_rows (int): Maximum rows to fetch (optional, default all rows)
+            as_arrow (bool): Return results as a pyarrow Table
+            fresh (bool): Read from the primary and skip cached results
+            job (QueryJob): Background job running this query (optional)
+
+        Returns:
+            tuple: (results, final_query, repairs)
+                - results: As returned by execute()
+                - final_query: The query that produced the results
+                - repairs: List of {"query", "error"} dicts for each failed attempt
+        """
+        started = time.monotonic()
+        repairs = []
+        schema_text = None
+
+        async def try_repair(failed_query, error_message):
+            nonlocal schema_text
+            remaining = REPAIR_TIME_BUDGET - (time.monotonic() - started)
+            if len(repairs) >= MAX_REPAIR_ATTEMPTS or remaining <= 0 or not is_repairable_error(error_message):
+                return None
+            if job and job.cancel_requested:
+                return None
+            repairs.append({"query": failed_query, "error": error_message})
+            if schema_text is None:
+                schema_text = await self.schema_text()
+            schema_fragment = get_relevant_schema(schema_text, failed_query, error_message)
+            fixed_query = await self.repair_sql(question, failed_query, error_message, schema_fragment, remaining)
+            if fixed_query and validate_query_safety(fixed_query)[0]:
+                return fixed_query
+            return None
+
+        # A cached result means the query already ran - skip the compile round-trip
+        if not fresh:
+            cached = self.target.result_cache.get((query, max_rows, as_arrow))  # execute()'s cache key
+            if cached is not None:
+                return cached, query, repairs
+
+        # Stage 1: cheap compile-only validation
+        if validate_query_safety(query)[0]:
+            while True:
+                is_valid, error_message = await self.check_compiles(query, fresh, job)
+                if is_valid:
+                    break
+                fixed_query = await try_repair(query, error_message)
+                if not fixed_query:
+                    break
+                query = fixed_query
+
+        # Stage 2: execute, repairing runtime errors (e.g., conversion failures)
+        while True:
+            results = await self.execute(query, max_rows, as_arrow, fresh, job)
+            if not (isinstance(results, dict) and "error" in results):
+                return results, query, repairs
+            fixed_query = await try_repair(query, results.get("detail", ""))
+            if not fixed_query:
+                return results, query, repairs
+            query = fixed_query
+
+    async def count_rows(self, query, fresh=False):
+        """
+        Count all rows a query returns, on the server.
+
+        Returns:
+            int: Row count, or None if the query can't be counted (CTEs, errors)
+        """
+        from pagination import build_count_query, prepare_inner_query
+
+        inner_query, _ = prepare_inner_query(query)
+        if inner_query is None:
+            return None
+        sql, _ = build_count_query(inner_query)
+        try:
+            rows = await self.database.fetch(sql, fresh=fresh)
+        except Exception:
+            return None
+        return int(next(iter(rows[0].values()))) if rows else None
+
+    async def summarize(self, question, query, results, total_rows=None, truncated=False):
+        """Summarize results; returns (summary, encoding report or None)"""
+        return await summarize_results(
+            self.available_client(), question, query, results, total_rows, truncated=truncated,
+            deployment=self.deployment
+        )
+
+    async def ask(self, question, history=None, max_rows=DEFAULT_MAX_ROWS, fresh=False, summarize=True):
+        """
+        Answer a question end to end as a JSON-serializable dict.
+
+        Args:
+            question (str): User question
+            history (list): Previous {"role", "content"} messages (optional)
+            max_rows (int): Rows to return (one more is fetched to detect truncation)
+            fresh (bool): Read from the primary and skip cached results
+            summarize (bool): Add a natural-language summary
+
+        Returns:
+            dict: "question", "database", "status" ("answered", "conversational" or "error"),
+                  "timings" (seconds per stage) and, depending on the status, "response",
+                  "error", or "query" (after any repairs), "repairs", "columns", "rows", "row_count", "truncated",
+                  "total_rows" (all rows of a truncated result, None if it couldn't be counted)
+                  and "summary"
+        """
+        from arrow_transport import arrow_to_records
+
+        loop = asyncio.get_running_loop()
+        timings = {}
+        answer = {"question": question, "database": self.target.name, "timings": timings}
+
+        started = loop.time()
+        try:
+            response, needs_database = await self.generate_sql(question, history)
+        except StageTimeout as e:
+            response, needs_database = f"Error: AI request timed out after {e.seconds:g} seconds.", False
+        except Exception as e:
+            response, needs_database = f"Error: {e}", False
+        timings["generate"] = round(loop.time() - started, 3)
+        if not needs_database:
+            if response.startswith("Error:"):
+                answer.update(status="error", error=response[len("Error:"):].strip())
+            else:
+                answer.update(status="conversational", response=response)
+            return answer
+        started = loop.time()
+        results, response, repairs = await self.execute_with_repair(question, response, max_rows=max_rows + 1, fresh=fresh)
+        timings["execute"] = round(loop.time() - started, 3)
+        answer.update(query=response, repairs=repairs)
+        if isinstance(results, dict):
+            answer.update(status="error", error=results["error"])
+            return answer
+        self.remember_sql(await self.nl_sql_cache_key(question, history), response)
+
+        truncated = results.num_rows > max_rows
+        rows = arrow_to_records(results, max_rows)
+        answer.update(
+            status="answered",
+            columns=results.column_names,
+            rows=rows,
+            row_count=len(rows),
+            truncated=truncated
+        )
+        total_rows = len(rows)
+        if truncated:
+            # The extra fetched row only shows there are more - count them all
+            started = loop.time()
+            total_rows = await self.count_rows(response, fresh)
+            timings["count"] = round(loop.time() - started, 3)
+        answer["total_rows"] = total_rows
+
+        if summarize:
+            started = loop.time()
+            # A truncated result is summarized as a sample of the counted total (or of "more than" its rows)
+            answer["summary"], _ = await self.summarize(
+                question, response, rows, total_rows, truncated=truncated and total_rows is None
+            )
+            timings["summarize"] = round(loop.time() - started, 3)
+        return answer
@@ -0,0 +1,131 @@
+import csv
+import gzip
+import os
+import tempfile
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from arrow_transport import arrow_schema_from_description, rows_to_record_batch
+
+# Rows read per fetchmany() call while exporting
+EXPORT_BATCH_SIZE = 5000
+
+# Display name -> (format, file extension)
+EXPORT_FORMATS = {
+    "CSV (gzip)": ("csv", ".csv.gz"),
+    "Parquet (zstd)": ("parquet", ".parquet"),
+}
+
+
+def write_csv(cursor, path, batch_size, on_batch):
+    """Stream cursor rows into a gzip-compressed CSV file"""
+    with gzip.open(path, "wt", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow([column[0] for column in cursor.description])
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            writer.writerows(rows)
+            on_batch(len(rows))
+
+
+def write_parquet(cursor, path, batch_size, on_batch):
+    """
+    Stream cursor rows into a zstd-compressed Parquet file, one row group per batch.
+    Parquet needs one schema for the whole file: when a value doesn't fit its
+    column type, that column is written as strings in every batch (the row
+    groups already written are rewritten once).
+    """
+    schema = arrow_schema_from_description(cursor.description)
+    writer = pq.ParquetWriter(path, schema, compression="zstd")
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            table = pa.Table.from_batches([rows_to_record_batch(rows, schema)])
+            if table.schema != schema:
+                schema = pa.schema([
+                    fallback if fallback.type == pa.string() else field
+                    for field, fallback in zip(schema, table.schema)
+                ])
+                writer.close()
+                writer = rewrite_parquet(path, schema)
+            writer.write_table(table.cast(schema))
+            on_batch(len(rows))
+    finally:
+        writer.close()
+
+
+def rewrite_parquet(path, schema):
+    """
+    Rewrite a Parquet file with a wider schema (columns that became strings).
+
+    Returns:
+        pq.ParquetWriter: Open writer on path, for the remaining batches
+    """
+    partial_path = path + ".partial"
+    os.replace(path, partial_path)
+    writer = pq.ParquetWriter(path, schema, compression="zstd")
+    try:
+        for batch in pq.ParquetFile(partial_path).iter_batches():
+            writer.write_table(pa.Table.from_batches([batch]).cast(schema))
+    except BaseException:
+        writer.close()
+        raise
+    finally:
+        os.remove(partial_path)
+    return writer
+
+
+def export_query(cursor, query, export_format, progress_callback=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Re-run a query and stream the full result into a compressed file.
+    Rows are written batch by batch from fetchmany(), so memory use stays
+    flat whatever the row count.
+
+    Args:
+        cursor: Open pyodbc cursor
+        query (str): SQL query to export (already validated as safe)
+        export_format (str): Key of EXPORT_FORMATS
+        progress_callback (callable): Called as progress_callback(rows_written, rows_per_second) (optional)
+        batch_size (int): Rows per fetchmany() call
+
+    Returns:
+        dict: {"path", "rows", "bytes", "seconds", "rows_per_second"}
+    """
+    file_format, extension = EXPORT_FORMATS[export_format]
+    file_descriptor, path = tempfile.mkstemp(prefix="query_export_", suffix=extension)
+    os.close(file_descriptor)
+
+    started = time.monotonic()
+    rows_written = 0
+
+    def on_batch(row_count):
+        nonlocal rows_written
+        rows_written += row_count
+        if progress_callback:
+            elapsed = max(time.monotonic() - started, 1e-6)
+            progress_callback(rows_written, rows_written / elapsed)
+
+    try:
+        cursor.execute(query)
+        if file_format == "csv":
+            write_csv(cursor, path, batch_size, on_batch)
+        else:
+            write_parquet(cursor, path, batch_size, on_batch)
+    except BaseException:
+        os.remove(path)
+        raise
+
+    seconds = max(time.monotonic() - started, 1e-6)
+    return {
+        "path": path,
+        "rows": rows_written,
+        "bytes": os.path.getsize(path),
+        "seconds": seconds,
+        "rows_per_second": rows_written / seconds,
+    }
@@ -0,0 +1,346 @@
+import re
+
+from local_summary import friendly_name, is_id_column
+
+# Complete result sets kept per session for follow-up refinements
+FOLLOWUP_CACHE_SIZE = 3
+# String columns with more distinct values are not searched for bare filter values
+MAX_FILTER_VALUES = 500
+
+# A refinement starts with one of these, or refers back to the previous result
+REFINEMENT_START = re.compile(
+    r'^\s*(?:(?:now|then|and|ok|okay|please|can you|could you)\s+)*'
+    r'(?:sort|order|rank|filter|only|just|keep|limit|top|bottom|first|last|group|break|show only|show just|exclude)\b'
+)
+REFERENCE_WORDS = re.compile(r'\b(?:those|these|them|that list|this list|the results?|the list|the table|ones|instead)\b')
+# Words that may follow "top N" in a refinement (besides column names); anything else is a new question
+TOP_N_WORDS = {
+    "of", "from", "the", "those", "these", "them", "ones", "that", "this", "list", "table",
+    "result", "results", "row", "rows", "record", "records", "entries", "items", "only", "please",
+}
+
+COMPARISON_WORDS = {
+    ">=": ">=", "<=": "<=", "!=": "!=", "=": "==", ">": ">", "<": "<",
+    "is not": "!=", "not": "!=", "is": "==", "equals": "==", "equal to": "==",
+    "over": ">", "above": ">", "more than": ">", "greater than": ">", "at least": ">=",
+    "under": "<", "below": "<", "less than": "<", "fewer than": "<", "at most": "<=",
+}
+OPERATOR_PATTERN = "|".join(
+    re.escape(word) + (r'\b' if word[-1].isalpha() else '')
+    for word in sorted(COMPARISON_WORDS, key=len, reverse=True)
+)
+OPERATOR_SYMBOLS = {">=": "≥", "<=": "≤", "!=": "≠", "==": "=", ">": ">", "<": "<"}
+
+
+class RefinementError(Exception):
+    """The refinement can't be answered from the cached result"""
+
+
+def column_aliases(columns):
+    """
+    Map the ways a user may name each column to the column.
+    Example: "GradeLevel" -> "gradelevel", "grade level", "grade levels", and "grade"/"level"
+    when no other column uses that word (ID columns only match by their full name).
+
+    Args:
+        columns (list): Column names
+
+    Returns:
+        dict: lowercase alias -> column name
+    """
+    aliases = {}
+    word_owners = {}
+    for column in columns:
+        name = friendly_name(column)
+        for alias in (column.lower(), name, name + "s"):
+            aliases.setdefault(alias, column)
+        if is_id_column(column):
+            continue
+        for word in name.split():
+            if len(word) >= 4:
+                word_owners.setdefault(word, set()).add(column)
+    for word, owners in word_owners.items():
+        if len(owners) == 1:
+            column = next(iter(owners))
+            for alias in (word, word + "s"):
+                aliases.setdefault(alias, column)
+    return aliases
+
+
+def column_pattern(aliases):
+    """Regex group matching any column alias (longest first)"""
+    alternatives = sorted(aliases, key=len, reverse=True)
+    return r'(?P<col>' + "|".join(re.escape(alias) for alias in alternatives) + r')\b'
+
+
+def is_refinement(user_prompt):
+    """Check if a question refines the previous result rather than asking something new"""
+    text = user_prompt.strip().lower()
+    return bool(REFINEMENT_START.search(text) or REFERENCE_WORDS.search(text))
+
+
+def find_text_value(text, values):
+    """Find the longest known value of a text column that appears in the text as whole words"""
+    best = None
+    for value in values:
+        value_text = str(value).lower()
+        if len(value_text) >= 2 and re.search(r'(?<!\w)' + re.escape(value_text) + r'(?!\w)', text):
+            if best is None or len(value_text) > len(str(best)):
+                best = value
+    return best
+
+
+def parse_refinement(user_prompt, frame):
+    """
+    Parse a follow-up into refinement steps on a cached result.
+    Supported: filter (column op value, "only <column> <value>", or a known text value),
+    group by a column, sort by a column, and top/bottom N (optionally by a column).
+
+    Args:
+        user_prompt (str): Follow-up question
+        frame (pd.DataFrame): Cached result
+
+    Returns:
+        list: Steps as dicts ("filter", "group", "sort", "top"), or None if the
+              prompt isn't a refinement this result can answer
+    """
+    import pandas as pd
+
+    text = " ".join(user_prompt.lower().replace("?", " ").split())
+    if not is_refinement(text):
+        return None
+    aliases = column_aliases(list(frame.columns))
+    column = column_pattern(aliases)
+    steps = []
+    used = []  # Text spans already read as a step
+
+    def overlaps(span):
+        return any(span[0] < end and start < span[1] for start, end in used)
+
+    # Group: "group those by class", "average score per class", "break it down by grade"
+    match = re.search(
+        r'\b(?:group\w*|break\w*(?:\s+\w+)?\s+down|aggregat\w*|total\w*|sum\w*|averag\w*|count\w*|how many)'
+        r'(?:\s+\w+){0,3}?\s+(?:by|per|for each)\s+(?:the\s+|each\s+)?' + column,
+        text
+    )
+    if match:
+        if re.search(r'\b(?:count|how many|number of)\b', text):
+            aggregate = "count"
+        elif re.search(r'\b(?:sum|total)\w*\b', text):
+            aggregate = "sum"
+        else:
+            aggregate = "mean"
+        steps.append({"op": "group", "column": aliases[match.group("col")], "aggregate": aggregate})
+        used.append(match.span())
+
+    # Sort: "sort those by score descending", "order by last name"
+    match = re.search(
+        r'\b(?:sort|order|rank)\w*(?:\s+\w+){0,2}?\s+by\s+(?:the\s+)?(?:their\s+)?' + column
+        + r'(?:\s+(?P<direction>asc\w*|desc\w*|highest first|lowest first|largest first|smallest first'
+        r'|high to low|low to high|a to z|z to a))?',
+        text
+    )
+    if match:
+        direction = match.group("direction") or ""
+        descending = direction.startswith("desc") or direction in (
+            "highest first", "largest first", "high to low", "z to a"
+        ) or (not direction and text.lstrip().startswith("rank"))
+        steps.append({"op": "sort", "column": aliases[match.group("col")], "descending": descending})
+        used.append(match.span())
+
+    # Top N: "top 5", "bottom 3 by attendance rate", "first 10 of those"
+    match = re.search(r'\b(?P<kind>top|first|bottom|last|highest|lowest)\s+(?P<n>\d+)\b(?P<rest>[^,;]*)', text)
+    if match:
+        # Up to "and"/"then" (another step may follow); "top 3 teachers with ..." is a new question
+        rest = re.split(r'\b(?:and|then)\b', match.group("rest"), maxsplit=1)[0]
+        by_match = re.search(r'\b(?:by|on|in)\s+(?:the\s+)?(?:their\s+)?', rest)
+        nouns = rest[:by_match.start()] if by_match else rest
+        if any(word not in TOP_N_WORDS for word in re.sub(r'\b' + column, " ", nouns).split()):
+            return None
+        col = None
+        if by_match:
+            # "by <column>", or "in the list"; "by books checked out" names a column this result doesn't have
+            target = rest[by_match.end():]
+            col_match = re.match(column, target)
+            if col_match:
+                col = aliases[col_match.group("col")]
+            elif any(word not in TOP_N_WORDS for word in target.split()):
+                return None
+        steps.append({
+            "op": "top",
+            "n": int(match.group("n")),
+            "column": col,
+            "largest": match.group("kind") in ("top", "highest", "first"),
+            "keep_order": match.group("kind") in ("first", "last") and not col,
+        })
+        used.append((match.start(), match.end("n") + len(rest)))
+
+    # Filter with a comparison: "where score is over 90", "grade level = 10"
+    # ("is" before another operator belongs to it; on its own it means equals)
+    for match in re.finditer(
+        column + r'\s*(?:is\s+)?(?P<op>' + OPERATOR_PATTERN + r')\s*(?P<value>\'[^\']*\'|"[^"]*"|[\w.\-/]+)',
+        text
+    ):
+        if overlaps(match.span()):
+            continue
+        steps.append({
+            "op": "filter",
+            "column": aliases[match.group("col")],
+            "operator": COMPARISON_WORDS[match.group("op")],
+            "value": match.group("value").strip("'\""),
+        })
+
+    # Filter without an operator: "only grade 10", "just the science ones"
+    if not any(step["op"] == "filter" for step in steps):
+        match = re.search(
+            r'\b(?:only|just|exclude)\s+(?:show\s+|keep\s+|include\s+)?(?:the\s+)?(?:ones\s+)?'
+            r'(?:in\s+|from\s+|for\s+|with\s+)?' + column + r'\s+(?P<value>[\w.\-/]+)',
+            text
+        )
+        if match and not overlaps(match.span()):
+            steps.append({
+                "op": "filter",
+                "column": aliases[match.group("col")],
+                "operator": "!=" if match.group(0).startswith("exclude") else "==",
+                "value": match.group("value"),
+            })
+
+    # Filter by a known text value: "only Smith", "exclude the math classes"
+    if not any(step["op"] == "filter" for step in steps):
+        match = re.search(r'\b(?:only|just|exclude|without|except)\b(?P<rest>.*)$', text)
+        if match:
+            for name in frame.columns:
+                if not pd.api.types.is_string_dtype(frame[name]) or is_id_column(name):
+                    continue
+                values = frame[name].dropna().unique()
+                if len(values) > MAX_FILTER_VALUES:
+                    continue
+                value = find_text_value(match.group("rest"), values)
+                if value is not None:
+                    excluded = re.match(r'\b(?:exclude|without|except)', match.group(0)) is not None
+                    steps.append({"op": "filter", "column": name, "operator": "!=" if excluded else "==", "value": str(value)})
+                    break
+
+    # A sort or grouping on a column this result doesn't have needs SQL
+    if re.search(r'\b(?:sort|order|rank)\w*\b.*\bby\b', text) and not any(step["op"] == "sort" for step in steps):
+        return None
+    if re.search(r'\b(?:group|break)\w*\b.*\b(?:by|per)\b', text) and not any(step["op"] == "group" for step in steps):
+        return None
+    return steps or None
+
+
+def filter_mask(series, operator, value):
+    """
+    Build a vectorized filter mask for one column.
+
+    Raises:
+        RefinementError: If the comparison doesn't fit the column type
+    """
+    import pandas as pd
+
+    if pd.api.types.is_bool_dtype(series):
+        target = value.lower() in ("true", "yes", "1")
+        if operator not in ("==", "!="):
+            raise RefinementError(f"can't compare {series.name} with {operator}")
+        return series == target if operator == "==" else series != target
+    if pd.api.types.is_numeric_dtype(series):
+        try:
+            target = float(value)
+        except ValueError:
+            raise RefinementError(f"{value} is not a number")
+        values = series.astype("float64")
+    elif pd.api.types.is_datetime64_any_dtype(series):
+        try:
+            target = pd.Timestamp(value)
+        except ValueError:
+            raise RefinementError(f"{value} is not a date")
+        values = series
+    else:
+        if operator not in ("==", "!="):
+            raise RefinementError(f"can't compare text column {series.name} with {operator}")
+        values = series.astype(str).str.lower()
+        target = value.lower()
+
+    if operator == "==":
+        return values == target
+    if operator == "!=":
+        return values != target
+    if operator == ">":
+        return values > target
+    if operator == ">=":
+        return values >= target
+    if operator == "<":
+        return values < target
+    return values <= target
+
+
+def apply_refinement(frame, steps):
+    """
+    Apply refinement steps with vectorized pandas operations
+    (filters first, then grouping, sorting and top N).
+
+    Args:
+        frame (pd.DataFrame): Cached result
+        steps (list): Steps from parse_refinement()
+
+    Returns:
+        tuple: (refined DataFrame, list of step descriptions)
+
+    Raises:
+        RefinementError: If a step can't be applied to this result
+    """
+    import pandas as pd
+
+    order = {"filter": 0, "group": 1, "sort": 2, "top": 3}
+    descriptions = []
+    for step in sorted(steps, key=lambda step: order[step["op"]]):
+        column = step.get("column")
+        if column is not None and column not in frame.columns:
+            raise RefinementError(f"{column} is not in the result")
+
+        if step["op"] == "filter":
+            frame = frame[filter_mask(frame[column], step["operator"], step["value"])]
+            descriptions.append(f"{column} {OPERATOR_SYMBOLS[step['operator']]} {step['value']}")
+
+        elif step["op"] == "group":
+            numeric = [
+                name for name in frame.columns
+                if name != column and not is_id_column(name) and pd.api.types.is_numeric_dtype(frame[name])
+                and not pd.api.types.is_bool_dtype(frame[name])
+            ]
+            if step["aggregate"] == "count" or not numeric:
+                frame = frame.groupby(column, dropna=False, sort=True).size().reset_index(name="Count")
+                descriptions.append(f"counted per {column}")
+            else:
+                frame = frame.groupby(column, dropna=False, sort=True)[numeric].agg(step["aggregate"]).reset_index()
+                word = "averaged" if step["aggregate"] == "mean" else "summed"
+                descriptions.append(f"{word} per {column}")
+
+        elif step["op"] == "sort":
+            frame = frame.sort_values(column, ascending=not step["descending"], kind="stable")
+            descriptions.append(f"sorted by {column} ({'descending' if step['descending'] else 'ascending'})")
+
+        elif step["op"] == "top":
+            count = step["n"]
+            if step["keep_order"]:
+                frame = frame.head(count) if step["largest"] else frame.tail(count)
+                descriptions.append(f"{'first' if step['largest'] else 'last'} {count} rows")
+                continue
+            if column is None:
+                numeric = [
+                    name for name in frame.columns
+                    if not is_id_column(name) and pd.api.types.is_numeric_dtype(frame[name])
+                    and not pd.api.types.is_bool_dtype(frame[name])
+                ]
+                if not numeric:
+                    frame = frame.head(count) if step["largest"] else frame.tail(count)
+                    descriptions.append(f"{'top' if step['largest'] else 'bottom'} {count} rows")
+                    continue
+                column = numeric[-1]
+            if pd.api.types.is_numeric_dtype(frame[column]):
+                frame = frame.nlargest(count, column) if step["largest"] else frame.nsmallest(count, column)
+            else:
+                frame = frame.sort_values(column, ascending=not step["largest"], kind="stable").head(count)
+            descriptions.append(f"{'top' if step['largest'] else 'bottom'} {count} by {column}")
+
+    return frame.reset_index(drop=True), descriptions
@@ -0,0 +1,245 @@
+import re
+
+from workload_log import query_fingerprint
+
+# Plan statistics of cached statements (needs VIEW SERVER STATE)
+PLAN_STATS_QUERY = """
+SELECT TOP 200
+    SUBSTRING(st.text, (qs.statement_start_offset / 2) + 1,
+        ((CASE qs.statement_end_offset WHEN -1 THEN DATALENGTH(st.text)
+          ELSE qs.statement_end_offset END - qs.statement_start_offset) / 2) + 1) AS statement_text,
+    qs.execution_count,
+    qs.total_elapsed_time / 1000.0 AS total_elapsed_ms,
+    qs.total_worker_time / 1000.0 AS total_cpu_ms,
+    qs.total_logical_reads,
+    qs.total_rows,
+    qs.last_execution_time
+FROM sys.dm_exec_query_stats qs
+CROSS APPLY sys.dm_exec_sql_text(qs.sql_handle) st
+ORDER BY qs.total_elapsed_time DESC
+"""
+
+# Indexes the optimizer asked for in this database (needs VIEW SERVER STATE)
+MISSING_INDEX_QUERY = """
+SELECT TOP 20
+    mid.statement,
+    mid.equality_columns,
+    mid.inequality_columns,
+    mid.included_columns,
+    migs.user_seeks,
+    migs.avg_user_impact,
+    migs.user_seeks * migs.avg_total_user_cost * (migs.avg_user_impact / 100.0) AS improvement
+FROM sys.dm_db_missing_index_details mid
+JOIN sys.dm_db_missing_index_groups mig ON mig.index_handle = mid.index_handle
+JOIN sys.dm_db_missing_index_group_stats migs ON migs.group_handle = mig.index_group_handle
+WHERE mid.database_id = DB_ID()
+ORDER BY improvement DESC
+"""
+
+# Most key columns in a suggested index
+MAX_INDEX_COLUMNS = 3
+
+PREDICATE_OPERATORS = r'(=|<>|!=|<=|>=|<|>|\bBETWEEN\b|\bLIKE\b|\bIN\b)'
+SQL_KEYWORDS = {
+    'and', 'or', 'not', 'null', 'is', 'in', 'like', 'between', 'select', 'from', 'where', 'on',
+    'join', 'case', 'when', 'then', 'else', 'end', 'as', 'exists', 'top', 'distinct',
+}
+
+
+def match_plan_stats(plan_rows, workload):
+    """
+    Attach server plan statistics to logged queries by fingerprint.
+
+    Args:
+        plan_rows (list): Rows of PLAN_STATS_QUERY
+        workload (list): Dicts from WorkloadLog.top_queries()
+
+    Returns:
+        list: The workload dicts that matched, with "executions", "server_total_ms",
+              "server_cpu_ms" and "logical_reads" added
+    """
+    by_fingerprint = {}
+    for row in plan_rows:
+        statement_text, executions, total_ms, cpu_ms, logical_reads = row[0], row[1], row[2], row[3], row[4]
+        stats = by_fingerprint.setdefault(
+            query_fingerprint(statement_text or ""),
+            {"executions": 0, "server_total_ms": 0.0, "server_cpu_ms": 0.0, "logical_reads": 0}
+        )
+        stats["executions"] += executions
+        stats["server_total_ms"] += float(total_ms)
+        stats["server_cpu_ms"] += float(cpu_ms)
+        stats["logical_reads"] += logical_reads
+
+    matched = []
+    for entry in workload:
+        stats = by_fingerprint.get(entry["fingerprint"])
+        if stats:
+            matched.append({**entry, **stats})
+    return matched
+
+
+def format_create_index(table, key_columns, included_columns=None):
+    """
+    Build a CREATE INDEX statement.
+
+    Args:
+        table (str): Table name (e.g., "[dbo].[Attendance]" or "dbo.Attendance")
+        key_columns (list): Key columns in order
+        included_columns (list): INCLUDE columns (optional)
+
+    Returns:
+        str: CREATE INDEX statement
+    """
+    table_name = table.replace('[', '').replace(']', '').split('.')[-1]
+    column_names = [column.replace('[', '').replace(']', '') for column in key_columns]
+    index_name = f"IX_{table_name}_{'_'.join(column_names)}"
+    statement = f"CREATE INDEX [{index_name}] ON {table} ({', '.join(f'[{name}]' for name in column_names)})"
+    if included_columns:
+        included = [column.replace('[', '').replace(']', '') for column in included_columns]
+        statement += f" INCLUDE ({', '.join(f'[{name}]' for name in included)})"
+    return statement
+
+
+def missing_index_suggestions(missing_rows):
+    """
+    Turn rows of MISSING_INDEX_QUERY into suggestions.
+
+    Returns:
+        list: Dicts with "table", "columns", "statement", "reason" and "score"
+    """
+    suggestions = []
+    for statement, equality, inequality, included, seeks, impact, improvement in missing_rows:
+        key_columns = [c.strip() for c in ",".join(filter(None, [equality, inequality])).split(",") if c.strip()]
+        if not key_columns:
+            continue
+        included_columns = [c.strip() for c in (included or "").split(",") if c.strip()]
+        suggestions.append({
+            "table": statement,
+            "columns": ", ".join(column.strip("[]") for column in key_columns),
+            "statement": format_create_index(statement, key_columns, included_columns),
+            "reason": f"SQL Server missing-index DMV: {seeks:,} seeks, ~{float(impact):.0f}% estimated improvement",
+            "score": float(improvement or 0),
+        })
+    return suggestions
+
+
+def parse_schema_columns(schema_text):
+    """
+    Read table columns and primary keys from the schema text.
+
+    Returns:
+        dict: lowercase table name -> {"name", "columns" (lowercase -> name), "primary_key" (lowercase names)}
+    """
+    tables = {}
+    for block in (schema_text or "").split("\n\n"):
+        lines = block.strip().splitlines()
+        if not lines or not lines[0].startswith("Table:"):
+            continue
+        full_name = lines[0][len("Table:"):].strip()
+        columns = {}
+        primary_key = set()
+        for line in lines[1:]:
+            match = re.match(r'^- (\w+) \((.*)$', line)
+            if match:
+                columns[match.group(1).lower()] = match.group(1)
+                if "PRIMARY KEY" in match.group(2):
+                    primary_key.add(match.group(1).lower())
+        tables[full_name.split('.')[-1].lower()] = {"name": full_name, "columns": columns, "primary_key": primary_key}
+    return tables
+
+
+def find_aliases(query):
+    """
+    Map table aliases (and table names) used in a query to table names.
+
+    Returns:
+        dict: lowercase alias -> lowercase table name (without schema)
+    """
+    aliases = {}
+    pattern = r'\b(?:FROM|JOIN)\s+(?:\[?\w+\]?\.)?\[?(\w+)\]?(?:\s+(?:AS\s+)?\[?(\w+)\]?)?'
+    for table, alias in re.findall(pattern, query, re.IGNORECASE):
+        aliases[table.lower()] = table.lower()
+        if alias and alias.lower() not in SQL_KEYWORDS:
+            aliases[alias.lower()] = table.lower()
+    return aliases
+
+
+def find_predicate_columns(query, schema_tables):
+    """
+    Find the columns a query filters or joins on.
+
+    Args:
+        query (str): SQL query
+        schema_tables (dict): From parse_schema_columns()
+
+    Returns:
+        dict: lowercase table name -> {"equality": [columns], "range": [columns]}
+    """
+    aliases = find_aliases(query)
+    single_table = next(iter(set(aliases.values()))) if len(set(aliases.values())) == 1 else None
+    found = {}
+
+    def add(qualifier, column, kind):
+        table = aliases.get(qualifier.lower()) if qualifier else single_table
+        info = schema_tables.get(table) if table else None
+        if not info or column.lower() not in info["columns"]:
+            return
+        entry = found.setdefault(table, {"equality": [], "range": []})
+        name = info["columns"][column.lower()]
+        if name not in entry["equality"] and name not in entry["range"]:
+            entry[kind].append(name)
+
+    # Only look at WHERE / ON / HAVING conditions, not the SELECT list
+    for condition in re.findall(
+        r'\b(?:WHERE|ON|HAVING)\b(.*?)(?=\bGROUP\s+BY\b|\bORDER\s+BY\b|\bJOIN\b|\bWHERE\b|\bUNION\b|$)',
+        query, re.IGNORECASE | re.DOTALL
+    ):
+        # column <op> ...
+        for qualifier, column, operator in re.findall(
+            r'(?:\[?(\w+)\]?\.)?\[?(\w+)\]?\s*' + PREDICATE_OPERATORS, condition, re.IGNORECASE
+        ):
+            kind = "equality" if operator.strip().upper() in ("=", "IN") else "range"
+            add(qualifier, column, kind)
+        # ... = other.column (join columns on the right-hand side)
+        for qualifier, column in re.findall(r'=\s*\[?(\w+)\]?\.\[?(\w+)\]?', condition):
+            add(qualifier, column, "equality")
+    return found
+
+
+def heuristic_index_suggestions(workload, schema_text):
+    """
+    Suggest indexes from the logged workload when the missing-index DMVs are unavailable.
+    For each table, the equality columns (then range columns) the hot queries
+    filter or join on become the index key, weighted by the queries' total time.
+    Tables whose primary key already leads with those columns are skipped.
+
+    Args:
+        workload (list): Dicts from WorkloadLog.top_queries()
+        schema_text (str): Schema from get_database_schema()
+
+    Returns:
+        list: Dicts with "table", "columns", "statement", "reason" and "score"
+    """
+    schema_tables = parse_schema_columns(schema_text)
+    candidates = {}
+    for entry in workload:
+        for table, columns in find_predicate_columns(entry["query"], schema_tables).items():
+            key_columns = (columns["equality"] + columns["range"])[:MAX_INDEX_COLUMNS]
+            if not key_columns or key_columns[0].lower() in schema_tables[table]["primary_key"]:
+                continue
+            candidate = candidates.setdefault((table, tuple(key_columns)), {"score": 0.0, "runs": 0})
+            candidate["score"] += entry["total_ms"]
+            candidate["runs"] += entry["runs"]
+
+    suggestions = []
+    for (table, key_columns), candidate in candidates.items():
+        table_name = schema_tables[table]["name"]
+        suggestions.append({
+            "table": table_name,
+            "columns": ", ".join(key_columns),
+            "statement": format_create_index(table_name, list(key_columns)),
+            "reason": f"Filtered/joined on by {candidate['runs']:,} logged runs ({candidate['score'] / 1000:,.1f}s total)",
+            "score": candidate["score"],
+        })
+    suggestions.sort(key=lambda suggestion: suggestion["score"], reverse=True)
+    return suggestions
@@ -0,0 +1,263 @@
+import re
+
+# Results larger than this always go to the AI summary
+LOCAL_SUMMARY_MAX_ROWS = 10
+LOCAL_SUMMARY_MAX_COLUMNS = 6
+
+# Questions containing these words need real interpretation, not a template
+INTERPRETIVE_KEYWORDS = [
+    'why', 'explain', 'compare', 'comparison', 'trend', 'analy', 'insight',
+    'recommend', 'should', 'interpret', 'pattern', 'correlat', 'improve', 'suggest'
+]
+
+RANKING_KEYWORDS = ['top', 'best', 'worst', 'highest', 'lowest', 'most', 'least', 'bottom']
+# Ranking words that ask for the low end, and how the answer introduces the list
+LOW_RANKING_INTROS = {
+    'bottom': "Here are the bottom {count} results by {name}:",
+    'worst': "Here are the {count} worst results by {name}:",
+    'lowest': "Here are the {count} results with the lowest {name}:",
+    'least': "Here are the {count} results with the least {name}:",
+    'fewest': "Here are the {count} results with the fewest {name}:",
+}
+
+
+def friendly_name(column):
+    """
+    Convert a column name to readable words.
+    Example: "AvgScore" -> "avg score", "total_students" -> "total students"
+
+    Args:
+        column (str): Column name
+
+    Returns:
+        str: Lowercase readable name
+    """
+    words = re.sub(r'(?<=[a-z0-9])(?=[A-Z])|_', ' ', column)
+    return re.sub(r'\s+', ' ', words).strip().lower()
+
+
+def format_number(value):
+    """
+    Format a value for display in a sentence.
+
+    Args:
+        value: Cell value
+
+    Returns:
+        str: Formatted value
+    """
+    if isinstance(value, bool):
+        return "Yes" if value else "No"
+    if isinstance(value, int):
+        return f"{value:,}"
+    if isinstance(value, float):
+        if value.is_integer():
+            return f"{int(value):,}"
+        return f"{value:,.2f}"
+    if value is None:
+        return "N/A"
+    return str(value)
+
+
+def is_numeric(value):
+    """Check if a value is a number (booleans are not)"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def is_id_column(column):
+    """Check if a column is an identifier (StudentID, class_id, ...)"""
+    return column.lower() == 'id' or column.endswith('ID') or column.lower().endswith('_id')
+
+
+def needs_interpretation(user_prompt):
+    """
+    Check if the question asks for analysis rather than a plain answer.
+
+    Args:
+        user_prompt (str): User's question
+
+    Returns:
+        bool: True if the AI summary should be used
+    """
+    prompt_lower = user_prompt.lower()
+    return any(keyword in prompt_lower for keyword in INTERPRETIVE_KEYWORDS)
+
+
+def split_columns(results):
+    """
+    Split columns into label columns and numeric value columns.
+
+    Args:
+        results (list): Query results as list of dictionaries
+
+    Returns:
+        tuple: (label_columns, value_columns)
+    """
+    columns = list(results[0].keys())
+    label_columns = []
+    value_columns = []
+    for column in columns:
+        values = [row.get(column) for row in results if row.get(column) is not None]
+        if values and all(is_numeric(value) for value in values) and not is_id_column(column):
+            value_columns.append(column)
+        elif not is_id_column(column):
+            label_columns.append(column)
+    return label_columns, value_columns
+
+
+def row_label(row, label_columns):
+    """Build a display label for a row from its label columns"""
+    return " ".join(format_number(row.get(column)) for column in label_columns)
+
+
+def singular(noun):
+    """Naive singular form for count answers (students -> student)"""
+    if noun.endswith('ies'):
+        return noun[:-3] + 'y'
+    if noun.endswith('s') and not noun.endswith('ss'):
+        return noun[:-1]
+    return noun
+
+
+def summarize_scalar(user_prompt, column, value):
+    """
+    Summarize a single-value result.
+
+    Args:
+        user_prompt (str): User's question
+        column (str): Column name
+        value: The value
+
+    Returns:
+        str: Natural language answer
+    """
+    if value is None:
+        return f"No value was found for {friendly_name(column)}."
+
+    match = re.search(
+        r'how many ([a-z][a-z\s]*?)(?:\s+(?:are|is|do|does|did|have|has|were|was|in|on|at|for|with)\b|\?|$)',
+        user_prompt.strip().lower()
+    )
+    if match and is_numeric(value):
+        noun = match.group(1).strip()
+        if value == 1:
+            return f"There is 1 {singular(noun)}."
+        return f"There are {format_number(value)} {noun}."
+
+    return f"The {friendly_name(column)} is {format_number(value)}."
+
+
+def summarize_single_row(row):
+    """Summarize a single-row result as a list of fields"""
+    lines = ["Here is the matching record:", ""]
+    for column, value in row.items():
+        lines.append(f"- **{column}:** {format_number(value)}")
+    return "\n".join(lines)
+
+
+def ranking_intro(user_prompt):
+    """Intro template of a ranking answer, worded for the end of the ranking the question asks for"""
+    words = re.findall(r'[a-z]+', user_prompt.lower())
+    for word in words:
+        if word in LOW_RANKING_INTROS:
+            return LOW_RANKING_INTROS[word]
+    return "Here are the top {count} results by {name}:"
+
+
+def summarize_ranking(user_prompt, results, label_columns, value_column):
+    """Summarize a top-N (or bottom-N) result as a numbered list"""
+    intro = ranking_intro(user_prompt)
+    lines = [intro.format(count=len(results), name=friendly_name(value_column)), ""]
+    for position, row in enumerate(results, 1):
+        lines.append(f"{position}. {row_label(row, label_columns)} — {format_number(row.get(value_column))}")
+    return "\n".join(lines)
+
+
+def summarize_grouped(results, label_columns, value_columns):
+    """Summarize a grouped aggregate with one line per group and the extremes"""
+    group_name = " / ".join(friendly_name(column) for column in label_columns)
+    if len(value_columns) == 1:
+        value_column = value_columns[0]
+        lines = [f"Here is the {friendly_name(value_column)} by {group_name}:", ""]
+        for row in results:
+            lines.append(f"- **{row_label(row, label_columns)}:** {format_number(row.get(value_column))}")
+
+        numeric_rows = [row for row in results if is_numeric(row.get(value_column))]
+        if len(numeric_rows) > 1:
+            highest = max(numeric_rows, key=lambda row: row[value_column])
+            lowest = min(numeric_rows, key=lambda row: row[value_column])
+            lines.append("")
+            lines.append(
+                f"The highest is **{row_label(highest, label_columns)}** ({format_number(highest[value_column])}) "
+                f"and the lowest is **{row_label(lowest, label_columns)}** ({format_number(lowest[value_column])})."
+            )
+        return "\n".join(lines)
+
+    lines = [f"Here are the results by {group_name}:", ""]
+    for row in results:
+        values = ", ".join(f"{friendly_name(column)} {format_number(row.get(column))}" for column in value_columns)
+        lines.append(f"- **{row_label(row, label_columns)}:** {values}")
+    return "\n".join(lines)
+
+
+def summarize_table(results):
+    """Summarize a small table with one bullet per row"""
+    columns = list(results[0].keys())
+    # Lead with the first descriptive column rather than an identifier
+    first = next((column for column in columns if not is_id_column(column)), columns[0])
+    rest = [column for column in columns if column != first and not is_id_column(column)]
+    lines = [f"I found {len(results)} results:", ""]
+    for row in results:
+        details = ", ".join(f"{column}: {format_number(row.get(column))}" for column in rest)
+        line = f"- **{format_number(row.get(first))}**"
+        lines.append(f"{line} ({details})" if details else line)
+    return "\n".join(lines)
+
+
+def summarize_locally(user_prompt, query, results):
+    """
+    Generate a natural language answer from templates for simple result shapes.
+    Covers empty, scalar, single-row, top-N, grouped-aggregate and small tables.
+
+    Args:
+        user_prompt (str): Original user question
+        query (str): SQL query that was executed
+        results (list): Query results as list of dictionaries
+
+    Returns:
+        str: Summary, or None if the result needs the AI summary
+    """
+    if not isinstance(results, list):
+        return None
+
+    if not results:
+        return "No matching records were found."
+
+    if needs_interpretation(user_prompt):
+        return None
+
+    if len(results) > LOCAL_SUMMARY_MAX_ROWS or len(results[0]) > LOCAL_SUMMARY_MAX_COLUMNS:
+        return None
+
+    if len(results) == 1 and len(results[0]) == 1:
+        column, value = next(iter(results[0].items()))
+        return summarize_scalar(user_prompt, column, value)
+
+    if len(results) == 1:
+        return summarize_single_row(results[0])
+
+    label_columns, value_columns = split_columns(results)
+    query_upper = query.upper()
+
+    if label_columns and value_columns:
+        is_ranking = (
+            re.search(r'\bTOP\s*\(?\s*\d+', query_upper) is not None
+            or any(re.search(r'\b' + keyword + r'\b', user_prompt.lower()) for keyword in RANKING_KEYWORDS)
+        ) and 'ORDER BY' in query_upper
+        if is_ranking:
+            return summarize_ranking(user_prompt, results, label_columns, value_columns[-1])
+
+        if 'GROUP BY' in query_upper:
+            return summarize_grouped(results, label_columns, value_columns)
+
+    return summarize_table(results)
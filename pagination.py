@@ -0,0 +1,284 @@
+import re
+
+# Rows fetched per page of the results viewer
+RESULT_PAGE_SIZE = 200
+# Column types SQL Server can't sort on (ORDER BY fails)
+UNSORTABLE_TYPES = ("TEXT", "NTEXT", "XML", "IMAGE")
+
+
+def quote_identifier(name):
+    """
+    Quote a column name for SQL Server.
+
+    Args:
+        name (str): Column name
+
+    Returns:
+        str: Bracket-quoted identifier
+    """
+    return "[" + name.replace("]", "]]") + "]"
+
+
+def find_top_level_order_by(query):
+    """
+    Find the position of the outermost trailing ORDER BY clause.
+    ORDER BY inside parentheses (subqueries, OVER clauses) is ignored.
+
+    Args:
+        query (str): SQL query
+
+    Returns:
+        int: Start index of the ORDER BY clause, or -1 if there is none
+    """
+    depth = 0
+    position = -1
+    in_string = False
+    for index, char in enumerate(query):
+        if char == "'":
+            in_string = not in_string
+        elif in_string:
+            continue
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif depth == 0 and query[index:index + 5].upper() == "ORDER" and re.match(r'ORDER\s+BY\b', query[index:], re.IGNORECASE):
+            if index == 0 or not (query[index - 1].isalnum() or query[index - 1] == "_"):
+                position = index
+    return position
+
+
+def prepare_inner_query(query):
+    """
+    Make a query usable as a derived table for paging.
+
+    Args:
+        query (str): Generated SELECT query
+
+    Returns:
+        tuple: (inner_query, order_by_clause)
+            - inner_query: Query that can be wrapped, or None if it cannot be (CTEs)
+            - order_by_clause: The query's own ORDER BY expressions, or None
+    """
+    query = query.strip().rstrip(";").strip()
+    if query.upper().startswith("WITH"):
+        # A CTE cannot be placed inside a derived table
+        return None, None
+
+    position = find_top_level_order_by(query)
+    if position < 0:
+        return query, None
+
+    order_by_clause = re.sub(r'^ORDER\s+BY\s+', '', query[position:], flags=re.IGNORECASE).strip()
+    has_top = re.match(r'SELECT\s+(DISTINCT\s+)?TOP\b', query, re.IGNORECASE) is not None
+    has_offset = re.search(r'\bOFFSET\s+\S+\s+ROWS?\b', query[position:], re.IGNORECASE) is not None
+    if has_top or has_offset:
+        # ORDER BY is allowed in a derived table together with TOP/OFFSET
+        return query, order_by_clause
+    # ORDER BY alone is not allowed in a derived table - OFFSET 0 ROWS keeps it legal
+    return f"{query} OFFSET 0 ROWS", order_by_clause
+
+
+def translate_order_by(order_by_clause, columns):
+    """
+    Translate the query's ORDER BY to the outer paging query.
+    Only terms that name an output column can be reused (e.g., "s.LastName DESC" -> "[LastName] DESC").
+
+    Args:
+        order_by_clause (str): ORDER BY expressions of the inner query
+        columns (list): Output column names
+
+    Returns:
+        str: Outer ORDER BY expressions, or None if a term cannot be translated
+    """
+    if not order_by_clause:
+        return None
+    order_by_clause = re.split(r'\bOFFSET\b', order_by_clause, flags=re.IGNORECASE)[0]
+    column_lookup = {column.lower(): column for column in columns}
+    terms = []
+    for term in order_by_clause.split(","):
+        match = re.match(r'^\s*(?:[\w\[\]]+\.)?\[?([\w ]+?)\]?\s*(ASC|DESC)?\s*$', term, re.IGNORECASE)
+        if not match or match.group(1).lower() not in column_lookup:
+            return None
+        direction = (match.group(2) or "ASC").upper()
+        terms.append(f"{quote_identifier(column_lookup[match.group(1).lower()])} {direction}")
+    return ", ".join(terms) if terms else None
+
+
+def find_ordered_key(query, columns, schema_text):
+    """
+    Find a unique key column that allows keyset pagination.
+    Only single-table queries without JOIN/GROUP BY/DISTINCT/UNION qualify,
+    and the table's single-column primary key must be in the output.
+
+    Args:
+        query (str): SQL query
+        columns (list): Output column names
+        schema_text (str): Schema from get_database_schema()
+
+    Returns:
+        str: Key column name, or None
+    """
+    if re.search(r'\b(JOIN|GROUP\s+BY|DISTINCT|UNION|INTERSECT|EXCEPT|APPLY)\b', query, re.IGNORECASE):
+        return None
+    match = re.search(r'\bFROM\s+((?:\[?\w+\]?\.)?\[?(\w+)\]?)', query, re.IGNORECASE)
+    if not match or not schema_text:
+        return None
+    table_name = match.group(2)
+
+    for block in schema_text.split("\n\n"):
+        header = block.strip().splitlines()[0] if block.strip() else ""
+        if not header.startswith("Table:") or header.split(".")[-1].strip().lower() != table_name.lower():
+            continue
+        key_columns = re.findall(r'^- (\w+) \([^)]*PRIMARY KEY', block, re.MULTILINE)
+        if len(key_columns) == 1:
+            for column in columns:
+                if column.lower() == key_columns[0].lower():
+                    return column
+    return None
+
+
+def find_unsortable_columns(query, columns, schema_text):
+    """
+    Find output columns SQL Server can't sort on: text, ntext, xml and image
+    columns of the tables the query reads (matched by name, so aliased ones are missed).
+
+    Args:
+        query (str): SQL query
+        columns (list): Output column names
+        schema_text (str): Schema from get_database_schema()
+
+    Returns:
+        list: Output column names that must not appear in ORDER BY
+    """
+    if not schema_text:
+        return []
+    tables = {
+        name.lower() for name in re.findall(r'\b(?:FROM|JOIN)\s+(?:\[?\w+\]?\.)?\[?(\w+)\]?', query, re.IGNORECASE)
+    }
+    unsortable = set()
+    for block in schema_text.split("\n\n"):
+        header = block.strip().splitlines()[0] if block.strip() else ""
+        if not header.startswith("Table:") or header.split(".")[-1].strip().lower() not in tables:
+            continue
+        for name, data_type in re.findall(r'^- (\w+) \((\w+)', block, re.MULTILINE):
+            if data_type.upper() in UNSORTABLE_TYPES:
+                unsortable.add(name.lower())
+    return [column for column in columns if column.lower() in unsortable]
+
+
+def orders_by_key(default_order, key_column):
+    """
+    Check whether the query's own order is already the paging order: it sorts
+    on the unique key, so page 1 holds exactly the query's first rows.
+
+    Args:
+        default_order (str): Outer ORDER BY from translate_order_by() (or None)
+        key_column (str): Unique key column from find_ordered_key() (or None)
+
+    Returns:
+        bool: True if the query's first rows can be reused as page 1
+    """
+    return bool(default_order and key_column) and quote_identifier(key_column) in default_order
+
+
+def escape_like(text):
+    """Escape LIKE wildcards (%, _ and [) so text matches literally"""
+    return text.replace("[", "[[]").replace("%", "[%]").replace("_", "[_]")
+
+
+def build_filter(filter_column, filter_text):
+    """
+    Build a WHERE condition for a text filter.
+
+    Args:
+        filter_column (str): Column to filter (must be an output column)
+        filter_text (str): Text the column must contain
+
+    Returns:
+        tuple: (condition, params) - condition is None when there is no filter
+    """
+    if not filter_column or not filter_text:
+        return None, []
+    return f"CAST({quote_identifier(filter_column)} AS NVARCHAR(MAX)) LIKE ?", [f"%{escape_like(filter_text)}%"]
+
+
+def build_count_query(inner_query, filter_column=None, filter_text=None):
+    """
+    Build a query counting all rows of the result (with the filter applied).
+
+    Returns:
+        tuple: (sql, params)
+    """
+    condition, params = build_filter(filter_column, filter_text)
+    sql = f"SELECT COUNT_BIG(*) FROM ({inner_query}) AS q"
+    if condition:
+        sql += f" WHERE {condition}"
+    return sql, params
+
+
+def build_page_query(inner_query, columns, page, page_size=RESULT_PAGE_SIZE, sort_column=None,
+                     descending=False, default_order=None, filter_column=None, filter_text=None,
+                     key_column=None, keyset_after=None, tiebreak_columns=None):
+    """
+    Build the query for one page of results.
+    Uses OFFSET ... FETCH NEXT, or keyset pagination (WHERE key > last key)
+    when sorting by a unique key and the previous page's last key is known.
+    The order always ends with the key column (or all tiebreak columns), so rows
+    with equal sort values keep their place and no row shows up on two pages.
+
+    Args:
+        inner_query (str): Query from prepare_inner_query()
+        columns (list): Output column names
+        page (int): Zero-based page number
+        page_size (int): Rows per page
+        sort_column (str): Column chosen by the user (optional)
+        descending (bool): Sort direction for sort_column
+        default_order (str): Outer ORDER BY from translate_order_by() (optional)
+        filter_column (str): Column for the text filter (optional)
+        filter_text (str): Filter text (optional)
+        key_column (str): Unique key column for keyset pagination (optional)
+        keyset_after: Last key value of the previous page (optional)
+        tiebreak_columns (list): Columns that can be sorted on, to break ties without
+                                 a key column (optional, default all columns); the first
+                                 one orders a query without its own order
+
+    Returns:
+        tuple: (sql, params)
+    """
+    conditions = []
+    params = []
+
+    condition, filter_params = build_filter(filter_column, filter_text)
+    if condition:
+        conditions.append(condition)
+        params.extend(filter_params)
+
+    if sort_column:
+        order_by = f"{quote_identifier(sort_column)} {'DESC' if descending else 'ASC'}"
+    else:
+        order_by = default_order or f"{quote_identifier((tiebreak_columns or columns)[0])} ASC"
+
+    offset = page * page_size
+    use_keyset = (
+        key_column is not None
+        and keyset_after is not None
+        and (sort_column == key_column or (not sort_column and order_by == f"{quote_identifier(key_column)} ASC"))
+    )
+    if use_keyset:
+        operator = "<" if sort_column and descending else ">"
+        conditions.append(f"{quote_identifier(key_column)} {operator} ?")
+        params.append(keyset_after)
+        offset = 0
+
+    tiebreak = [key_column] if key_column else (columns if tiebreak_columns is None else tiebreak_columns)
+    for column in tiebreak:
+        if quote_identifier(column) not in order_by:
+            order_by += f", {quote_identifier(column)} ASC"
+
+    sql = f"SELECT * FROM ({inner_query}) AS q"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {order_by} OFFSET {int(offset)} ROWS FETCH NEXT {int(page_size)} ROWS ONLY"
+    return sql, params
+
@@ -0,0 +1,968 @@
+import asyncio
+import datetime
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from decimal import Decimal
+
+import config
+from db_pool import POOL_SIZE
+from db_registry import get_target, is_connection_error, list_targets
+from local_summary import summarize_locally
+from result_encoder import encode_results_for_prompt
+
+# Seconds each pipeline stage may run before it is cancelled
+STAGE_TIMEOUTS = {
+    "schema": 30,
+    "generate": 60,
+    "repair": 20,
+    "execute": 300,
+    "summarize": 60,
+}
+SUMMARY_TOKEN_BUDGET = 1500  # estimated prompt tokens for results sent to the summary
+# Connections per aioodbc pool (one pool per connection string)
+ASYNC_POOL_SIZE = 5
+# Fewest threads for blocking database work (pools open extra connections beyond POOL_SIZE when busy)
+MIN_DB_THREADS = 32
+
+_loop = None
+_loop_lock = threading.Lock()
+_db_executor = None
+_db_executor_lock = threading.Lock()
+_async_clients = {}
+_async_clients_lock = threading.Lock()
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+class StageTimeout(Exception):
+    """A pipeline stage ran longer than its timeout and was cancelled"""
+
+    def __init__(self, stage, seconds):
+        super().__init__(f"{stage} timed out after {seconds:g}s")
+        self.stage = stage
+        self.seconds = seconds
+
+
+def get_event_loop():
+    """Get the process-wide event loop the pipeline runs on (started in a daemon thread on first use)"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="pipeline-loop", daemon=True).start()
+        return _loop
+
+
+def run_sync(coro, timeout=None):
+    """
+    Run a pipeline coroutine from synchronous code (Streamlit script or worker threads)
+    and wait for its result. All sessions share one event loop, so waiting
+    callers don't each hold their own I/O.
+    If the caller stops waiting (timeout, Streamlit rerun/stop), the coroutine is cancelled.
+    
+    Args:
+        coro: Coroutine to run
+        timeout (float): Seconds to wait (optional)
+        
+    Returns:
+        The coroutine's result (its exceptions are re-raised)
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+    try:
+        return future.result(timeout)
+    except FutureTimeoutError:
+        future.cancel()
+        raise TimeoutError(f"Timed out after {timeout:g}s")
+    except BaseException:
+        future.cancel()
+        raise
+
+
+def get_db_executor():
+    """
+    Get the thread pool blocking database work (pyodbc statements, schema loads) runs on.
+    It is separate from the event loop's default executor and has a thread per
+    pooled connection of the configured databases (POOL_SIZE per primary and
+    replica), at least MIN_DB_THREADS, so one session's slow queries don't queue
+    other sessions' statements behind a handful of default workers.
+    """
+    global _db_executor
+    with _db_executor_lock:
+        if _db_executor is None:
+            connections = sum(POOL_SIZE * (1 + len(get_target(name).replicas)) for name in list_targets())
+            _db_executor = ThreadPoolExecutor(max(MIN_DB_THREADS, connections), thread_name_prefix="pipeline-db")
+        return _db_executor
+
+
+async def run_stage(stage, awaitable, timeout=None):
+    """
+    Await one pipeline stage under its timeout.
+    
+    Args:
+        stage (str): Stage name (key of STAGE_TIMEOUTS)
+        awaitable: Stage coroutine
+        timeout (float): Seconds (optional, default STAGE_TIMEOUTS[stage])
+        
+    Raises:
+        StageTimeout: If the stage took too long (it is cancelled)
+    """
+    timeout = STAGE_TIMEOUTS[stage] if timeout is None else timeout
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise StageTimeout(stage, timeout)
+
+
+def get_async_openai_client(api_key=None, endpoint=None, api_version=None):
+    """
+    Get a shared AsyncAzureOpenAI client for these settings (default from config).
+    Clients are only used on the pipeline's event loop.
+    """
+    from openai import AsyncAzureOpenAI
+    
+    settings = (
+        api_key or config.AZURE_OPENAI_API_KEY,
+        endpoint or config.AZURE_OPENAI_ENDPOINT,
+        api_version or config.AZURE_OPENAI_API_VERSION,
+    )
+    with _async_clients_lock:
+        client = _async_clients.get(settings)
+        if client is None:
+            client = AsyncAzureOpenAI(api_key=settings[0], azure_endpoint=settings[1], api_version=settings[2])
+            _async_clients[settings] = client
+        return client
+
+
+async def complete(client, messages, temperature=0.3, stage="generate", timeout=None, deployment=None):
+    """
+    One chat completion under a stage timeout.
+    
+    Args:
+        client: AsyncAzureOpenAI client
+        messages (list): Chat messages
+        temperature (float): Sampling temperature
+        stage (str): Stage name for the timeout
+        timeout (float): Seconds (optional, default STAGE_TIMEOUTS[stage])
+        deployment (str): Model deployment (optional, default config.AZURE_OPENAI_DEPLOYMENT)
+        
+    Returns:
+        str: Response text (stripped, "" if empty)
+    """
+    response = await run_stage(
+        stage,
+        client.chat.completions.create(
+            model=deployment or config.AZURE_OPENAI_DEPLOYMENT,
+            messages=messages,
+            temperature=temperature
+        ),
+        timeout
+    )
+    return (response.choices[0].message.content or "").strip()
+
+
+def build_system_prompt(current_schema):
+    """
+    Build the SQL generation system prompt for a database schema.
+    
+    Args:
+        current_schema (str): Schema text from load_database_schema()
+        
+    Returns:
+        str: System prompt
+    """
+    return f"""You are a helpful assistant for a database system. 
+Your job is to convert user questions into SQL queries for Microsoft SQL Server.
+
+{current_schema}
+
+IMPORTANT RULES:
+1. If the user asks a question that requires database information, generate a SQL SELECT query
+2. If the user asks general questions like "What can you do?", "Help", "Hello", respond with "NO_QUERY_NEEDED:" followed by your response
+3. Generate ONLY SELECT queries (no INSERT, UPDATE, DELETE, DROP, etc.)
+4. Use proper JOIN syntax when querying multiple tables
+5. Use WHERE clauses for filtering
+6. When joining names from multiple columns, use + for concatenation (e.g., FirstName + ' ' + LastName)
+7. Use appropriate filters based on the database context (e.g., IsActive, Status, etc.)
+8. ALWAYS use schema-qualified table names (schema.table) when tables have schema prefixes
+9. PAY ATTENTION to conversation history - if the user refers to "them", "those", "it", etc., check previous context
+10. If a user asks a follow-up question, consider what was discussed before
+
+SQL SERVER SPECIFIC SYNTAX (VERY IMPORTANT):
+- Use TOP N instead of LIMIT N (e.g., SELECT TOP 1 * FROM TableName)
+- Use + for string concatenation
+- Use GETDATE() for current date
+- Use DATEPART() for date parts
+- Use LEN() instead of LENGTH()
+- Use ISNULL() instead of IFNULL()
+- When using GROUP BY with aggregates, include all non-aggregated columns
+
+EXAMPLES:
+User: "Show me all customers"
+Response: SELECT * FROM dbo.Customers
+
+User: "What are their names?"  (follow-up to previous query about customers)
+Response: SELECT CustomerID, FirstName + ' ' + LastName AS FullName FROM dbo.Customers
+
+User: "How many orders do we have?"
+Response: SELECT COUNT(*) AS TotalOrders FROM dbo.Orders
+
+User: "Hello"
+Response: NO_QUERY_NEEDED: Hello! I can help you query your database. Ask me questions about your data!
+
+RESPONSE FORMAT:
+- If a database query is needed: Return ONLY the SQL query (no explanations, no markdown)
+- If no query is needed: Start with "NO_QUERY_NEEDED:" followed by your conversational response
+
+Now process the user's input based on the conversation context.
+"""
+
+
+def build_ai_messages(system_prompt, user_prompt, conversation_history=None):
+    """
+    Build the chat messages for SQL generation: system prompt, recent history, question.
+    
+    Args:
+        system_prompt (str): System prompt with the schema
+        user_prompt (str): User's question
+        conversation_history (list): Previous messages for context (optional)
+        
+    Returns:
+        list: Chat completion messages
+    """
+    messages = [{"role": "system", "content": system_prompt}]
+    
+    # Add conversation history (limit to last 10 messages to avoid token overflow)
+    if conversation_history:
+        # Filter out the welcome message and limit history
+        filtered_history = [msg for msg in conversation_history if msg.get("role") != "system"]
+        # Take last 10 messages (5 exchanges)
+        recent_history = filtered_history[-10:] if len(filtered_history) > 10 else filtered_history
+        
+        for msg in recent_history:
+            role = msg.get("role")
+            content = msg.get("content", "")
+            
+            # Clean up assistant messages - remove SQL code blocks to save tokens
+            # Keep only the natural language summary
+            if role == "assistant" and "**SQL Query:**" in content:
+                # Extract only the summary part (before the SQL block)
+                summary_part = content.split("**SQL Query:**")[0].strip()
+                if summary_part:
+                    messages.append({"role": "assistant", "content": summary_part})
+            elif content and role in ["user", "assistant"]:
+                messages.append({"role": role, "content": content})
+    
+    # Add current user prompt
+    messages.append({"role": "user", "content": user_prompt})
+    return messages
+
+
+def get_nl_sql_cache_key(messages):
+    """NL→SQL cache key: the conversation and question, normalized (the system prompt is per database anyway)"""
+    return tuple(
+        (msg["role"], " ".join(msg["content"].lower().split())) for msg in messages[1:]
+    )
+
+
+def is_sql_query(text):
+    """
+    Check if the text is a SQL query.
+    
+    Args:
+        text (str): Text to check
+        
+    Returns:
+        bool: True if it's a SQL query, False otherwise
+    """
+    text_upper = text.strip().upper()
+    sql_keywords = ['SELECT', 'WITH']
+    return any(text_upper.startswith(keyword) for keyword in sql_keywords)
+
+
+def fix_sql_syntax(query):
+    """
+    Fix common SQL syntax issues for SQL Server.
+    
+    Args:
+        query (str): SQL query to fix
+        
+    Returns:
+        str: Fixed SQL query
+    """
+    # Replace LIMIT with TOP
+    # Pattern: LIMIT n at the end of query
+    limit_pattern = r'\s+LIMIT\s+(\d+)\s*;?\s*$'
+    match = re.search(limit_pattern, query, re.IGNORECASE)
+    if match:
+        limit_value = match.group(1)
+        # Remove LIMIT clause
+        query = re.sub(limit_pattern, '', query, flags=re.IGNORECASE)
+        # Add TOP after SELECT
+        query = re.sub(r'\bSELECT\b', f'SELECT TOP {limit_value}', query, count=1, flags=re.IGNORECASE)
+    
+    # Replace LENGTH() with LEN()
+    query = re.sub(r'\bLENGTH\s*\(', 'LEN(', query, flags=re.IGNORECASE)
+    
+    # Replace IFNULL() with ISNULL()
+    query = re.sub(r'\bIFNULL\s*\(', 'ISNULL(', query, flags=re.IGNORECASE)
+    
+    return query.strip()
+
+
+def extract_sql_from_response(ai_response):
+    """
+    Robustly extract SQL query from AI response, handling various markdown formats.
+    
+    Args:
+        ai_response (str): AI response text
+        
+    Returns:
+        str: Extracted SQL query
+    """
+    # Try to find code block with sql marker
+    code_block_pattern = r'```(?:sql|SQL)?\s*\n?(.*?)\n?```'
+    match = re.search(code_block_pattern, ai_response, re.DOTALL | re.IGNORECASE)
+    
+    if match:
+        return match.group(1).strip()
+    
+    # Fallback: return as-is
+    return ai_response.strip()
+
+
+def parse_ai_response(ai_response):
+    """
+    Interpret the model's answer to a question.
+    
+    Args:
+        ai_response (str): Response text
+        
+    Returns:
+        tuple: (query_or_response, needs_database)
+    """
+    # Check if AI indicates no query is needed
+    if ai_response.startswith("NO_QUERY_NEEDED:"):
+        return ai_response.replace("NO_QUERY_NEEDED:", "").strip(), False
+    
+    # Extract SQL from markdown code blocks
+    query = extract_sql_from_response(ai_response)
+    
+    # If it's not a SQL query, treat it as a conversational response
+    return query, is_sql_query(query)
+
+
+async def summarize_results(client, user_prompt, query, results, total_rows=None, timeout=None, truncated=False,
+                            deployment=None):
+    """
+    Summarize results (locally from templates, or with Azure OpenAI).
+    
+    Args:
+        client: AsyncAzureOpenAI client (None if unavailable)
+        user_prompt (str): Original user question
+        query (str): SQL query that was executed
+        results (list): Query results
+        total_rows (int): Total rows of the full result if results is one page (optional)
+        timeout (float): Seconds for the AI call (optional, default STAGE_TIMEOUTS["summarize"])
+        truncated (bool): results stop at a row limit and the total is unknown
+        deployment (str): Model deployment (optional, default config.AZURE_OPENAI_DEPLOYMENT)
+        
+    Returns:
+        tuple: (summary, encoding report or None)
+    """
+    # Simple result shapes are answered from templates without a network round-trip
+    total_rows = total_rows if total_rows is not None else len(results)
+    local_summary = summarize_locally(user_prompt, query, results) if total_rows == len(results) and not truncated else None
+    if local_summary:
+        return local_summary, None
+    
+    if not client:
+        return "Summary unavailable: OpenAI client not initialized.", None
+    
+    encoding_report = None
+    try:
+        # Encode results compactly (CSV table, or statistics + sample) within a token budget
+        encoded_results, encoding_report = encode_results_for_prompt(
+            results, SUMMARY_TOKEN_BUDGET, total_rows=total_rows, truncated=truncated
+        )
+        
+        summary_prompt = f"""
+User asked: "{user_prompt}"
+
+SQL Query executed: {query}
+
+Results: {encoded_results}
+
+Provide a clear, natural language answer to the user's question based on these results.
+
+IMPORTANT FORMATTING RULES:
+- Use proper spacing between words
+- Format numbers with appropriate spacing (e.g., "received a 4,067.80" not "receiveda4067.7988")
+- Use complete sentences with proper punctuation
+- Add line breaks between different points if listing multiple items
+- Be concise and friendly
+- If there are multiple results, summarize them clearly with bullet points or numbered lists
+- If there are more results than shown, mention the total count
+"""
+        
+        summary = await complete(
+            client,
+            [
+                {"role": "system", "content": "You are a helpful assistant that explains database query results in natural language. Always use proper spacing between words, format numbers clearly, and write in complete, well-structured sentences."},
+                {"role": "user", "content": summary_prompt}
+            ],
+            temperature=0.7,
+            stage="summarize",
+            timeout=timeout,
+            deployment=deployment
+        )
+        return (summary or "Summary generation returned empty response."), encoding_report
+    
+    except Exception as e:
+        error_str = str(e)
+        if "token" in error_str.lower() or "length" in error_str.lower():
+            row_count = f"more than {len(results)}" if truncated else total_rows
+            return f"⚠️ Results too large to summarize ({row_count} rows). Showing data table below.", encoding_report
+        return f"Error generating summary: {error_str}", encoding_report
+
+
+def load_database_schema(connection_string, db_server, db_name):
+    """
+    Dynamically retrieve the database schema from SQL Server.
+    
+    Args:
+        connection_string: Connection string
+        db_server: Database server name
+        db_name: Database name
+    
+    Returns:
+        str: Formatted database schema information
+    """
+    try:
+        # Inside the try: a missing ODBC driver (e.g., libodbc.so.2) is reported like any connection problem
+        import pyodbc
+        
+        conn = pyodbc.connect(connection_string, timeout=10)
+        cursor = conn.cursor()
+        
+        # Query to get all tables and their columns with data types from ALL schemas
+        schema_query = """
+        SELECT 
+            t.TABLE_SCHEMA,
+            t.TABLE_NAME,
+            c.COLUMN_NAME,
+            c.DATA_TYPE,
+            c.CHARACTER_MAXIMUM_LENGTH,
+            c.NUMERIC_PRECISION,
+            c.NUMERIC_SCALE,
+            c.IS_NULLABLE,
+            CASE 
+                WHEN pk.COLUMN_NAME IS NOT NULL THEN 'PRIMARY KEY'
+                WHEN fk.COLUMN_NAME IS NOT NULL THEN 'FOREIGN KEY'
+                ELSE ''
+            END AS KEY_TYPE,
+            fk.REFERENCED_TABLE_SCHEMA,
+            fk.REFERENCED_TABLE_NAME,
+            fk.REFERENCED_COLUMN_NAME,
+            c.COLUMN_DEFAULT
+        FROM 
+            INFORMATION_SCHEMA.TABLES t
+        INNER JOIN 
+            INFORMATION_SCHEMA.COLUMNS c ON t.TABLE_SCHEMA = c.TABLE_SCHEMA AND t.TABLE_NAME = c.TABLE_NAME
+        LEFT JOIN (
+            SELECT 
+                ku.TABLE_SCHEMA,
+                ku.TABLE_NAME,
+                ku.COLUMN_NAME
+            FROM 
+                INFORMATION_SCHEMA.TABLE_CONSTRAINTS tc
+            INNER JOIN 
+                INFORMATION_SCHEMA.KEY_COLUMN_USAGE ku 
+                ON tc.CONSTRAINT_SCHEMA = ku.CONSTRAINT_SCHEMA 
+                AND tc.CONSTRAINT_NAME = ku.CONSTRAINT_NAME
+            WHERE 
+                tc.CONSTRAINT_TYPE = 'PRIMARY KEY'
+        ) pk ON c.TABLE_SCHEMA = pk.TABLE_SCHEMA AND c.TABLE_NAME = pk.TABLE_NAME AND c.COLUMN_NAME = pk.COLUMN_NAME
+        LEFT JOIN (
+            SELECT 
+                ku.TABLE_SCHEMA,
+                ku.TABLE_NAME,
+                ku.COLUMN_NAME,
+                ccu.TABLE_SCHEMA AS REFERENCED_TABLE_SCHEMA,
+                ccu.TABLE_NAME AS REFERENCED_TABLE_NAME,
+                ccu.COLUMN_NAME AS REFERENCED_COLUMN_NAME
+            FROM 
+                INFORMATION_SCHEMA.TABLE_CONSTRAINTS tc
+            INNER JOIN 
+                INFORMATION_SCHEMA.KEY_COLUMN_USAGE ku 
+                ON tc.CONSTRAINT_SCHEMA = ku.CONSTRAINT_SCHEMA 
+                AND tc.CONSTRAINT_NAME = ku.CONSTRAINT_NAME
+            INNER JOIN 
+                INFORMATION_SCHEMA.CONSTRAINT_COLUMN_USAGE ccu 
+                ON tc.CONSTRAINT_SCHEMA = ccu.CONSTRAINT_SCHEMA 
+                AND tc.CONSTRAINT_NAME = ccu.CONSTRAINT_NAME
+            WHERE 
+                tc.CONSTRAINT_TYPE = 'FOREIGN KEY'
+        ) fk ON c.TABLE_SCHEMA = fk.TABLE_SCHEMA AND c.TABLE_NAME = fk.TABLE_NAME AND c.COLUMN_NAME = fk.COLUMN_NAME
+        WHERE 
+            t.TABLE_TYPE = 'BASE TABLE'
+            AND t.TABLE_SCHEMA NOT IN ('sys', 'INFORMATION_SCHEMA')
+        ORDER BY 
+            t.TABLE_SCHEMA, t.TABLE_NAME, c.ORDINAL_POSITION
+        """
+        
+        cursor.execute(schema_query)
+        rows = cursor.fetchall()
+        
+        # Build schema string and collect table names
+        schema_text = "DATABASE SCHEMA:\n\n"
+        current_table = None
+        current_schema = None
+        table_names = []
+        
+        for row in rows:
+            table_schema = row[0]
+            table_name = row[1]
+            column_name = row[2]
+            data_type = row[3].upper()
+            max_length = row[4]
+            numeric_precision = row[5]
+            numeric_scale = row[6]
+            is_nullable = row[7]
+            key_type = row[8]
+            ref_schema = row[9]
+            ref_table = row[10]
+            ref_column = row[11]
+            
+            # Create full table identifier with schema
+            full_table_name = f"{table_schema}.{table_name}"
+            
+            # Start new table section
+            if current_schema != table_schema or current_table != table_name:
+                if current_table is not None:
+                    schema_text += "\n"
+                schema_text += f"Table: {full_table_name}\n"
+                current_schema = table_schema
+                current_table = table_name
+                if full_table_name not in table_names:
+                    table_names.append(full_table_name)
+            
+            # Format data type with length/precision
+            if max_length and data_type in ['NVARCHAR', 'VARCHAR', 'CHAR', 'NCHAR']:
+                type_info = f"{data_type}({max_length})"
+            elif numeric_precision and data_type in ['DECIMAL', 'NUMERIC']:
+                type_info = f"{data_type}({numeric_precision},{numeric_scale})"
+            else:
+                type_info = data_type
+            
+            # Build column description
+            column_desc = f"- {column_name} ({type_info}"
+            
+            if key_type == 'PRIMARY KEY':
+                column_desc += ", PRIMARY KEY"
+            elif key_type == 'FOREIGN KEY':
+                if ref_schema:
+                    column_desc += f", FOREIGN KEY -> {ref_schema}.{ref_table}.{ref_column}"
+                else:
+                    column_desc += f", FOREIGN KEY -> {ref_table}.{ref_column}"
+            
+            column_desc += ")"
+            
+            schema_text += column_desc + "\n"
+        
+        cursor.close()
+        conn.close()
+        
+        return schema_text
+    
+    except ImportError as e:
+        # pyodbc (or the ODBC driver manager it loads) is missing - checked first, pyodbc isn't bound then
+        return f"DATABASE SCHEMA:\n\n❌ ODBC driver not available: {str(e)}"
+    
+    except pyodbc.Error as e:
+        # Specific database errors
+        error_msg = str(e)
+        
+        if "Login failed" in error_msg or "authentication" in error_msg.lower():
+            return "DATABASE SCHEMA:\n\n❌ Authentication failed. Please check your username and password in the sidebar."
+        elif "Cannot open database" in error_msg:
+            return f"DATABASE SCHEMA:\n\n❌ Database '{db_name}' not found. Please check the database name."
+        elif "timeout" in error_msg.lower():
+            return f"DATABASE SCHEMA:\n\n❌ Connection timeout. Please check if SQL Server is running on '{db_server}'."
+        else:
+            return f"DATABASE SCHEMA:\n\n❌ Database connection failed: {error_msg}"
+    
+    except Exception as e:
+        # Other errors
+        return f"DATABASE SCHEMA:\n\n❌ Schema retrieval failed: {str(e)}"
+
+
+def validate_query_safety(query):
+    """
+    Validate that the query is safe to execute (SELECT only, no dangerous operations).
+    
+    Args:
+        query (str): SQL query to validate
+        
+    Returns:
+        tuple: (is_safe, error_message)
+    """
+    query_upper = query.strip().upper()
+    
+    # Check it starts with SELECT or WITH (CTE)
+    if not (query_upper.startswith('SELECT') or query_upper.startswith('WITH')):
+        return False, "Only SELECT queries are allowed"
+    
+    # Check for dangerous keywords
+    dangerous_keywords = [
+        'DROP', 'DELETE', 'UPDATE', 'INSERT', 'ALTER', 'CREATE', 
+        'TRUNCATE', 'EXEC', 'EXECUTE', 'SP_', 'XP_', 'MERGE'
+    ]
+    
+    for keyword in dangerous_keywords:
+        # Use word boundaries to avoid false positives (e.g., "DROPPED" column name)
+        pattern = r'\b' + keyword + r'\b'
+        if re.search(pattern, query_upper):
+            return False, f"Dangerous keyword detected: {keyword}"
+    
+    # Check for semicolons (multiple statements)
+    if ';' in query.rstrip(';'):  # Allow trailing semicolon
+        return False, "Multiple statements not allowed"
+    
+    return True, None
+
+
+def convert_row(columns, row):
+    """
+    Convert a database row to a JSON-friendly dictionary.
+    
+    Args:
+        columns (list): Column names
+        row: pyodbc row
+        
+    Returns:
+        dict: Column name -> value
+    """
+    row_dict = {}
+    for idx, value in enumerate(row):
+        column_name = columns[idx]
+        
+        # Handle different data types
+        if value is None:
+            row_dict[column_name] = None
+        elif isinstance(value, Decimal):
+            # Preserve precision - don't round
+            row_dict[column_name] = float(value)
+        elif isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+            # Handle datetime objects
+            row_dict[column_name] = value.isoformat()
+        elif isinstance(value, (bytes, bytearray)):
+            # Handle binary data
+            try:
+                row_dict[column_name] = value.decode('utf-8', errors='ignore')
+            except:
+                row_dict[column_name] = '<binary data>'
+        elif isinstance(value, bool):
+            # Handle boolean
+            row_dict[column_name] = value
+        elif isinstance(value, (int, float, str)):
+            # Handle basic types
+            row_dict[column_name] = value
+        else:
+            # Fallback: convert to string for unknown types (UUID, XML, etc.)
+            try:
+                row_dict[column_name] = str(value)
+            except:
+                row_dict[column_name] = '<unprintable>'
+    return row_dict
+
+
+def fetch_query_results(cursor, query, max_rows=None, as_arrow=False, job=None):
+    """
+    Execute a query on a cursor and fetch its results.
+    
+    Args:
+        cursor: Open pyodbc cursor
+        query (str): SQL query to execute
+        max_rows (int): Maximum rows to fetch (optional, default all rows)
+        as_arrow (bool): Return a pyarrow Table with native column types
+        job (QueryJob): Background job to report progress to and cancel through (optional)
+        
+    Returns:
+        list: Query results as list of dictionaries (or pyarrow Table)
+    """
+    if job:
+        job.attach_cursor(cursor)
+    
+    # Execute query
+    cursor.execute(query)
+    
+    if as_arrow:
+        from arrow_transport import fetch_arrow_table
+        
+        # Arrow path: rows go straight into typed columns, no per-cell dicts
+        table = fetch_arrow_table(cursor, max_rows, on_batch=job.add_rows if job else None)
+        cursor.close()
+        return table
+    
+    # Get column names
+    columns = [column[0] for column in cursor.description]
+    
+    # Fetch results (only the first max_rows when limited)
+    rows = cursor.fetchmany(max_rows) if max_rows else cursor.fetchall()
+    cursor.close()
+    if job:
+        job.add_rows(len(rows))
+    
+    # Convert to list of dictionaries
+    return [convert_row(columns, row) for row in rows]
+
+
+def _set_started(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class TaskCanceller:
+    """Lets QueryJob.cancel() (any thread) cancel the asyncio task running a statement"""
+
+    def __init__(self, task, loop):
+        self._task = task
+        self._loop = loop
+
+    def cancel(self):
+        self._loop.call_soon_threadsafe(self._task.cancel)
+
+
+class AsyncDatabase:
+    """
+    Async read access to one database target: healthy replicas in round-robin
+    order, falling back to the primary (like DatabaseTarget.read_connection()).
+    With aioodbc installed, queries run on aioodbc connection pools; otherwise
+    on the target's pyodbc pools in worker threads. Either way, cancelling the
+    awaiting task stops the statement (the cursor is cancelled, or with aioodbc
+    the connection is closed instead of returned to the pool).
+    """
+
+    def __init__(self, target):
+        self.target = target
+        try:
+            import aioodbc
+        except ImportError:
+            aioodbc = None
+        self._aioodbc = aioodbc
+        self._pools = {}
+        self._pools_lock = None
+
+    @property
+    def uses_aioodbc(self):
+        return self._aioodbc is not None
+
+    async def fetch(self, query, max_rows=None, as_arrow=False, fresh=False, job=None, timeout=None):
+        """
+        Execute a read query and fetch its results.
+        The timeout counts from when the statement starts, not while it waits
+        for a free worker or connection.
+        
+        Args:
+            query (str): SQL query (already validated)
+            max_rows (int): Maximum rows to fetch (optional, default all rows)
+            as_arrow (bool): Return a pyarrow Table with native column types
+            fresh (bool): Read from the primary (no replica lag)
+            job (QueryJob): Background job to report progress to and cancel through (optional)
+            timeout (float): Seconds the statement may run (optional, default STAGE_TIMEOUTS["execute"])
+            
+        Returns:
+            list: Query results as list of dictionaries (or pyarrow Table)
+            
+        Raises:
+            pyodbc.Error: If the query fails
+            StageTimeout: If the statement ran too long (it is cancelled)
+        """
+        if self._aioodbc is None:
+            return await self._fetch_in_thread(query, max_rows, as_arrow, fresh, job, timeout)
+        return await self._fetch_aioodbc(query, max_rows, as_arrow, fresh, job, timeout)
+
+    async def _fetch_in_thread(self, query, max_rows, as_arrow, fresh, job, timeout):
+        loop = asyncio.get_running_loop()
+        statement_started = loop.create_future()
+        cancelled = threading.Event()
+        cursors = []
+
+        def work():
+            with self.target.read_connection(fresh=fresh) as conn:
+                cursor = conn.cursor()
+                cursors.append(cursor)
+                if cancelled.is_set():
+                    raise asyncio.CancelledError()
+                loop.call_soon_threadsafe(_set_started, statement_started)
+                return fetch_query_results(cursor, query, max_rows, as_arrow, job)
+
+        work_future = loop.run_in_executor(get_db_executor(), work)
+        try:
+            # Waiting for a worker and a connection doesn't count against the timeout
+            await asyncio.wait([statement_started, work_future], return_when=asyncio.FIRST_COMPLETED)
+            return await run_stage("execute", work_future, timeout)
+        except (asyncio.CancelledError, StageTimeout):
+            # A queued statement never starts; a running one keeps its thread until the server stops it
+            cancelled.set()
+            work_future.cancel()
+            for cursor in cursors:
+                try:
+                    cursor.cancel()
+                except Exception:
+                    pass
+            raise
+
+    async def _get_pool(self, connection_string):
+        if self._pools_lock is None:
+            self._pools_lock = asyncio.Lock()
+        async with self._pools_lock:
+            pool = self._pools.get(connection_string)
+            if pool is None:
+                pool = await self._aioodbc.create_pool(dsn=connection_string, minsize=0, maxsize=ASYNC_POOL_SIZE)
+                self._pools[connection_string] = pool
+            return pool
+
+    async def _fetch_aioodbc(self, query, max_rows, as_arrow, fresh, job, timeout):
+        """
+        A replica is only marked down when connecting to it fails (or a new
+        connection to it is lost). A pooled connection that is lost may just be
+        stale after a restart or failover: the pool's idle connections are
+        closed and the statement is retried once on a new connection.
+        """
+        import pyodbc
+
+        candidates = [] if fresh else self.target.healthy_replicas()
+        for connection_string in candidates + [self.target.connection_string]:
+            is_replica = connection_string != self.target.connection_string
+            pool = await self._get_pool(connection_string)
+            for attempt in range(2):
+                try:
+                    conn = await pool.acquire()
+                except pyodbc.Error as e:
+                    if is_replica and is_connection_error(e):
+                        self.target.mark_replica_down(connection_string)
+                        break
+                    raise
+                try:
+                    return await self._fetch_on_connection(pool, conn, query, max_rows, as_arrow, job, timeout)
+                except pyodbc.Error as e:
+                    if not is_connection_error(e) or (job and job.cancel_requested):
+                        raise
+                    if attempt == 0:
+                        await pool.clear()
+                        continue
+                    if not is_replica:
+                        raise
+                    self.target.mark_replica_down(connection_string)
+
+    async def _fetch_on_connection(self, pool, conn, query, max_rows, as_arrow, job, timeout):
+        async def run_statement(conn):
+            # Fetched and converted in batches (like fetch_arrow_table() on the thread path),
+            # so progress is reported as rows arrive and raw rows never pile up
+            from arrow_transport import ARROW_BATCH_SIZE
+
+            cursor = await conn.cursor()
+            await cursor.execute(query)
+            if as_arrow:
+                from arrow_transport import arrow_schema_from_description, rows_to_record_batch
+
+                schema = arrow_schema_from_description(cursor.description)
+            columns = [column[0] for column in cursor.description]
+
+            def convert(rows):
+                if as_arrow:
+                    return rows_to_record_batch(rows, schema)
+                return [convert_row(columns, row) for row in rows]
+
+            batches = []
+            fetched = 0
+            while max_rows is None or fetched < max_rows:
+                size = ARROW_BATCH_SIZE if max_rows is None else min(ARROW_BATCH_SIZE, max_rows - fetched)
+                rows = await cursor.fetchmany(size)
+                if not rows:
+                    break
+                batches.append(convert(rows))
+                fetched += len(rows)
+                if job:
+                    job.add_rows(len(rows))
+            await cursor.close()
+            if as_arrow:
+                from arrow_transport import table_from_batches
+
+                return table_from_batches(schema, batches)
+            return [row for batch in batches for row in batch]
+
+        try:
+            if job:
+                job.attach_cursor(TaskCanceller(asyncio.current_task(), asyncio.get_running_loop()))
+            # Timed from here: waiting for a pooled connection doesn't count
+            results = await run_stage("execute", run_statement(conn), timeout)
+        except BaseException:
+            # Don't hand a connection with a statement in flight (or a broken one) to the next query
+            await conn.close()
+            await pool.release(conn)
+            raise
+        await pool.release(conn)
+        return results
+
+    async def close(self):
+        """Close the aioodbc pools (connections in use are closed when they are released)"""
+        pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            pool.close()
+            await pool.wait_closed()
+
+
+def get_async_database(target):
+    """Get the shared async database layer of a target"""
+    with _databases_lock:
+        database = _databases.get(target.key)
+        if database is None or database.target is not target:
+            if database is not None and database.uses_aioodbc:
+                # The target was rebuilt (e.g., new settings) - don't leave its old pools open
+                asyncio.run_coroutine_threadsafe(database.close(), get_event_loop())
+            database = AsyncDatabase(target)
+            _databases[target.key] = database
+        return database
+
+
+class AsyncPipeline:
+    """
+    Shared parts of the question -> SQL -> results -> summary pipeline for one
+    database, without Streamlit: the async AI client, the async database layer,
+    the schema and the summary stage (engine.QueryEngine builds the full
+    pipeline on them). Every stage runs under its STAGE_TIMEOUTS entry;
+    cancelling the task running a stage cancels it, including a running
+    statement. Use it with `await` from asyncio code (an API server), or
+    through run_sync() from threads. The client and deployment default to the
+    configured ones; the chat UI passes each session's own.
+    """
+
+    def __init__(self, target, client=None, deployment=None):
+        self.target = target
+        self._client = client
+        self.deployment = deployment or config.AZURE_OPENAI_DEPLOYMENT
+        self.database = get_async_database(target)
+
+    @property
+    def client(self):
+        """AI client (the shared config client unless one was passed; created on first use)"""
+        if self._client is None:
+            self._client = get_async_openai_client()
+        return self._client
+
+    async def schema_text(self):
+        """The target's (cached) schema text"""
+        return await run_stage("schema", asyncio.get_running_loop().run_in_executor(
+            get_db_executor(), self.target.get_schema, load_database_schema
+        ))
+
+    async def system_prompt(self):
+        """System prompt with the target's schema"""
+        return build_system_prompt(await self.schema_text())
+
+    async def summarize(self, question, query, results, total_rows=None):
+        """Summarize results; returns (summary, encoding report or None)"""
+        return await summarize_results(self.client, question, query, results, total_rows, deployment=self.deployment)
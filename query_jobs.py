@@ -0,0 +1,219 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from db_registry import RESULT_CACHE_TTL
+
+# Queries running at the same time (shared by all sessions)
+JOB_WORKERS = 4
+# Speculative (prefetch) jobs running at the same time, on their own low-priority pool
+BACKGROUND_WORKERS = 1
+# Finished jobs are kept this long, so reruns and reconnects pick up their results
+JOB_RESULT_TTL = 900  # seconds
+# New submissions only reuse a job that finished this recently, so deduplication
+# never serves rows staler than the result cache would
+JOB_REUSE_TTL = RESULT_CACHE_TTL
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    """Raised when a cancelled job tries to start another statement"""
+
+
+class QueryJob:
+    """
+    A query running in the background.
+    The worker reports progress through add_rows() and registers its cursor
+    with attach_cursor(), so cancel() can interrupt the query on the server.
+    Sessions sharing the job are tracked as waiters; leave() only cancels it
+    once the last one stops waiting.
+    """
+
+    def __init__(self, key, context=None, background=False):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.context = context or {}
+        self.background = background  # speculative job nobody is waiting for yet
+        self.status = "queued"  # queued, running, done, failed, cancelled
+        self.result = None
+        self.error = None
+        self.rows_fetched = 0
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_requested = False
+        self._cursor = None
+        self._func = None
+        self._waiters = set()
+        self._lock = threading.Lock()
+
+    @property
+    def is_finished(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    @property
+    def elapsed(self):
+        """Seconds since the job started running (0 while queued)"""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def attach_cursor(self, cursor):
+        """Register the cursor the job is about to execute on (raises JobCancelled if cancel was requested)"""
+        with self._lock:
+            if self.cancel_requested:
+                raise JobCancelled("Query cancelled")
+            self._cursor = cursor
+
+    def detach_cursor(self):
+        with self._lock:
+            self._cursor = None
+
+    def add_rows(self, count):
+        """Report rows fetched so far"""
+        self.rows_fetched += count
+
+    def add_waiter(self, waiter):
+        """Record that a session is waiting for this job"""
+        with self._lock:
+            self._waiters.add(waiter)
+
+    def leave(self, waiter):
+        """
+        Stop waiting for the job (a session's Cancel).
+        The job is cancelled only if no other session is waiting for it.
+
+        Returns:
+            bool: True if the job was cancelled
+        """
+        with self._lock:
+            self._waiters.discard(waiter)
+            if self._waiters:
+                return False
+        self.cancel()
+        return True
+
+    def cancel(self):
+        """Ask the job to stop for everyone; a running statement is cancelled with cursor.cancel()"""
+        with self._lock:
+            self.cancel_requested = True
+            if self._cursor is not None:
+                try:
+                    self._cursor.cancel()
+                except Exception:
+                    pass
+
+
+class JobManager:
+    """
+    Runs queries on a thread pool and keeps their results for JOB_RESULT_TTL.
+    Jobs are deduplicated by key: submitting a query that is already running
+    (or finished within JOB_REUSE_TTL) returns the existing job instead of
+    re-running it, and adds the submitting session to its waiters. A shared
+    job runs with the first submitter's func (and so its context).
+    Background jobs run on a separate low-priority pool; submitting the same
+    key in the foreground takes over the job (and runs it now if still queued).
+    """
+
+    def __init__(self, workers=JOB_WORKERS, background_workers=BACKGROUND_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query-job")
+        self._background_executor = ThreadPoolExecutor(
+            max_workers=background_workers, thread_name_prefix="query-job-background"
+        )
+        self._jobs = {}
+        self._by_key = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, func, context=None, reuse_finished=True, background=False, waiter=None):
+        """
+        Run func(job) in the background.
+
+        Args:
+            key (tuple): Deduplication key (e.g., database and SQL)
+            func (callable): Called as func(job); its return value becomes job.result
+            context (dict): Data the UI needs to present the result (optional)
+            reuse_finished (bool): Reuse the result of a job finished within JOB_REUSE_TTL (False only joins a running job)
+            background (bool): Run on the low-priority pool (speculative work)
+            waiter: Session waiting for the result (optional; see QueryJob.leave())
+
+        Returns:
+            QueryJob: New or existing job for this key
+        """
+        with self._lock:
+            self._purge()
+            job = self._jobs.get(self._by_key.get(key))
+            if job is not None and job.status not in ("failed", "cancelled"):
+                if not job.is_finished or (reuse_finished and time.monotonic() - job.finished_at <= JOB_REUSE_TTL):
+                    if job.background and not background:
+                        self._promote(job)
+                    if waiter is not None:
+                        job.add_waiter(waiter)
+                    return job
+            job = QueryJob(key, context, background=background)
+            job._func = func
+            if waiter is not None:
+                job.add_waiter(waiter)
+            self._jobs[job.id] = job
+            self._by_key[key] = job.id
+        executor = self._background_executor if background else self._executor
+        executor.submit(self._run, job, func)
+        return job
+
+    def count_background(self):
+        """Number of background jobs queued or running"""
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.background and not job.is_finished)
+
+    def get(self, job_id):
+        """Get a job by ID (None if unknown or expired)"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _promote(self, job):
+        """Hand a background job to the foreground (caller holds the lock)"""
+        job.background = False
+        if job.status == "queued":
+            # Whichever pool gets to it first runs it
+            self._executor.submit(self._run, job, job._func)
+
+    def _run(self, job, func):
+        with job._lock:
+            if job.status != "queued":
+                return
+            if job.cancel_requested:
+                job.finished_at = time.monotonic()
+                job.status = "cancelled"
+                return
+            job.started_at = time.monotonic()
+            job.status = "running"
+        status = "done"
+        try:
+            job.result = func(job)
+        except Exception as e:
+            job.error = str(e)
+            status = "failed"
+        job.detach_cursor()
+        # finished_at is set before the status so readers never see a finished job without it
+        job.finished_at = time.monotonic()
+        job.status = "cancelled" if job.cancel_requested else status
+
+    def _purge(self):
+        """Forget finished jobs older than JOB_RESULT_TTL (caller holds the lock)"""
+        now = time.monotonic()
+        for job_id, job in list(self._jobs.items()):
+            if job.is_finished and now - job.finished_at > JOB_RESULT_TTL:
+                del self._jobs[job_id]
+                if self._by_key.get(job.key) == job_id:
+                    del self._by_key[job.key]
+
+
+def get_job_manager():
+    """Get the process-wide job manager"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
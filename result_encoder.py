@@ -0,0 +1,238 @@
+import csv
+import io
+import json
+import math
+
+# Rough token estimate for GPT-style tokenizers (about 4 characters per token)
+CHARS_PER_TOKEN = 4
+
+# Rows always kept at the start of a sample so the model sees the natural order
+HEAD_SAMPLE_ROWS = 3
+
+# Rows the former prompt sent as indented JSON (savings are reported against it)
+JSON_PROMPT_ROWS = 100
+
+
+def estimate_tokens(text):
+    """
+    Estimate the number of prompt tokens a text will use.
+
+    Args:
+        text (str): Text to measure
+
+    Returns:
+        int: Estimated token count
+    """
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def is_numeric(value):
+    """Check if a value is a number (booleans are treated as categories)"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def format_value(value):
+    """
+    Format a single cell compactly.
+
+    Args:
+        value: Cell value
+
+    Returns:
+        str: Compact text representation
+    """
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        # Drop float noise (e.g., 4067.798800000001) but keep real precision
+        return f"{value:.10g}"
+    return str(value)
+
+
+def encode_table(columns, rows):
+    """
+    Encode rows as CSV with the header written once.
+
+    Args:
+        columns (list): Column names
+        rows (list): Rows as dictionaries
+
+    Returns:
+        str: CSV text
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([format_value(row.get(column)) for column in columns])
+    return buffer.getvalue()
+
+
+def compute_column_stats(columns, rows):
+    """
+    Pre-compute per-column statistics over all rows.
+
+    Args:
+        columns (list): Column names
+        rows (list): Rows as dictionaries
+
+    Returns:
+        dict: Column name -> {"count", "distinct", "min", "max", "mean"}
+              (min/max/mean only for numeric columns)
+    """
+    stats = {}
+    for column in columns:
+        values = [row.get(column) for row in rows if row.get(column) is not None]
+        column_stats = {
+            "count": len(values),
+            "distinct": len(set(format_value(value) for value in values)),
+        }
+        if values and all(is_numeric(value) for value in values):
+            column_stats["min"] = min(values)
+            column_stats["max"] = max(values)
+            column_stats["mean"] = sum(values) / len(values)
+        elif values and all(isinstance(value, str) for value in values):
+            # ISO dates and plain text still have a meaningful range
+            column_stats["min"] = min(values)
+            column_stats["max"] = max(values)
+        stats[column] = column_stats
+    return stats
+
+
+def format_column_stats(stats):
+    """
+    Format column statistics as compact text lines.
+
+    Args:
+        stats (dict): Output of compute_column_stats()
+
+    Returns:
+        str: One line per column
+    """
+    lines = []
+    for column, column_stats in stats.items():
+        parts = [f"count={column_stats['count']}", f"distinct={column_stats['distinct']}"]
+        for key in ("min", "max", "mean"):
+            if key in column_stats:
+                parts.append(f"{key}={format_value(column_stats[key])}")
+        lines.append(f"- {column}: " + ", ".join(parts))
+    return "\n".join(lines)
+
+
+def sample_row_indices(columns, rows, max_rows):
+    """
+    Choose which rows to include in a sample.
+    Keeps the first rows, the rows holding the min and max of each numeric column
+    (outliers), then fills the rest with evenly spaced rows.
+
+    Args:
+        columns (list): Column names
+        rows (list): Rows as dictionaries
+        max_rows (int): Maximum number of rows in the sample
+
+    Returns:
+        list: Sorted row indices
+    """
+    if max_rows >= len(rows):
+        return list(range(len(rows)))
+
+    selected = []
+
+    def add(index):
+        if index not in selected and len(selected) < max_rows:
+            selected.append(index)
+
+    for index in range(min(HEAD_SAMPLE_ROWS, len(rows))):
+        add(index)
+
+    # Outliers: extreme values of every numeric column
+    for column in columns:
+        numeric = [(row.get(column), index) for index, row in enumerate(rows) if is_numeric(row.get(column))]
+        if numeric:
+            add(min(numeric)[1])
+            add(max(numeric)[1])
+
+    # Evenly spaced rows for the remaining slots
+    remaining = max_rows - len(selected)
+    if remaining > 0:
+        step = len(rows) / remaining
+        for slot in range(remaining):
+            add(int(slot * step))
+        index = 0
+        while len(selected) < max_rows and index < len(rows):
+            add(index)
+            index += 1
+
+    return sorted(selected)
+
+
+def encode_results_for_prompt(results, token_budget, total_rows=None, truncated=False):
+    """
+    Encode query results for the summary prompt within a token budget.
+    Small results are sent as a CSV table with the header once. Larger results
+    are sent as column statistics over all rows plus a sample that keeps outliers.
+
+    Args:
+        results (list): Query results as list of dictionaries
+        token_budget (int): Maximum estimated tokens for the encoded results
+        total_rows (int): Total rows of the full result, if results is truncated (optional)
+        truncated (bool): results stop at a row limit and the total is unknown
+
+    Returns:
+        tuple: (encoded_text, report)
+            - encoded_text: Text to embed in the prompt
+            - report: dict with "format", "rows_total", "rows_included",
+              "tokens", "json_tokens" (the former JSON prompt) and "tokens_saved"
+    """
+    total_rows = total_rows if total_rows is not None else len(results)
+
+    if not results:
+        report = {"format": "empty", "rows_total": total_rows, "rows_included": 0,
+                  "tokens": 0, "json_tokens": 0, "tokens_saved": 0}
+        return "No rows returned.", report
+
+    columns = list(results[0].keys())
+    if truncated:
+        row_note = f"more than {len(results)} rows (first {len(results)} retrieved, total not counted)"
+    elif total_rows == len(results):
+        row_note = f"{total_rows} rows"
+    else:
+        row_note = f"{total_rows} rows ({len(results)} retrieved)"
+
+    table = encode_table(columns, results)
+    encoded = f"{row_note}, CSV:\n{table}"
+    included_rows = results
+    encoding_format = "table"
+
+    if estimate_tokens(encoded) > token_budget:
+        stats_text = format_column_stats(compute_column_stats(columns, results))
+        header = f"{row_note}. Column statistics over the retrieved rows:\n{stats_text}\n\nSample rows (CSV, includes extremes):\n"
+
+        # Size the sample from the average row cost, then shrink until it fits
+        row_tokens = max(1, estimate_tokens(table) / (len(results) + 1))
+        sample_size = int((token_budget - estimate_tokens(header)) / row_tokens)
+        sample_size = max(1, min(sample_size, len(results)))
+
+        while True:
+            indices = sample_row_indices(columns, results, sample_size)
+            included_rows = [results[index] for index in indices]
+            encoded = header + encode_table(columns, included_rows)
+            if estimate_tokens(encoded) <= token_budget or sample_size == 1:
+                break
+            sample_size = max(1, int(sample_size * 0.8))
+        encoding_format = "stats+sample"
+
+    tokens = estimate_tokens(encoded)
+    # Saving against what the former prompt sent: the first JSON_PROMPT_ROWS rows as JSON
+    json_tokens = estimate_tokens(json.dumps(results[:JSON_PROMPT_ROWS], indent=2, default=str))
+    report = {
+        "format": encoding_format,
+        "rows_total": total_rows,
+        "rows_included": len(included_rows),
+        "tokens": tokens,
+        "json_tokens": json_tokens,
+        "tokens_saved": max(0, json_tokens - tokens),
+    }
+    return encoded, report
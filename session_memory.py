@@ -0,0 +1,382 @@
+import atexit
+import gzip
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import config
+
+MB = 1024 * 1024
+# Artifacts of sessions idle this long are written to disk (before the session expires;
+# half the idle timeout when that is shorter)
+IDLE_SPILL_AFTER = 600  # seconds
+# Idle sessions and budgets are checked at most this often by sweep()
+SWEEP_INTERVAL = 30  # seconds
+# Nesting depth measured by estimate_size()
+MAX_SIZE_DEPTH = 6
+SPILL_DIR_PREFIX = "session_spill_"
+
+_memory = None
+_memory_lock = threading.Lock()
+
+
+def estimate_size(value, depth=0):
+    """
+    Estimate the memory a value holds.
+    DataFrames and Arrow tables report their buffers; dicts, lists, tuples and
+    sets are measured recursively; other objects count only themselves (shared
+    clients and connections aren't attributed to a session).
+
+    Args:
+        value: Value to measure
+        depth (int): Current nesting depth
+
+    Returns:
+        int: Estimated size in bytes
+    """
+    module = type(value).__module__
+    if module.startswith("pandas") and hasattr(value, "memory_usage"):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, "sum") else usage)
+    if module.startswith("pyarrow") and hasattr(value, "nbytes"):
+        return int(value.nbytes)
+    size = sys.getsizeof(value)
+    if depth >= MAX_SIZE_DEPTH:
+        return size
+    if isinstance(value, dict):
+        size += sum(estimate_size(key, depth + 1) + estimate_size(item, depth + 1) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, depth + 1) for item in value)
+    return size
+
+
+def process_memory():
+    """
+    Memory use of this process.
+
+    Returns:
+        dict: "rss" (current resident bytes, None where /proc isn't available)
+              and "peak" (peak resident bytes, None on Windows)
+    """
+    rss = None
+    try:
+        with open("/proc/self/statm") as statm:
+            rss = int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    peak = None
+    try:
+        import resource
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    except ImportError:
+        pass
+    return {"rss": rss, "peak": peak}
+
+
+def remove_stale_spill_dirs(base_dir, max_age):
+    """Delete spill directories of earlier processes that haven't been touched for max_age seconds"""
+    try:
+        names = os.listdir(base_dir)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(base_dir, name)
+        try:
+            if name.startswith(SPILL_DIR_PREFIX) and time.time() - os.path.getmtime(path) > max_age:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+class SessionMemory:
+    """
+    Process-wide accounting of per-session memory with budgets.
+    Large session artifacts (result DataFrames) are held here instead of in
+    st.session_state, so they can be measured and spilled: when a session's
+    artifacts exceed session_budget, or all sessions' exceed total_budget, the
+    least recently used are written to compressed files (zstd Parquet for tables,
+    gzip pickle otherwise) and loaded back on their next use. Artifacts of idle
+    sessions are spilled after idle_spill_after; sessions idle for idle_timeout
+    are forgotten and their files deleted. Only what is held here is released:
+    the rest of an idle session's st.session_state (messages, client) stays
+    with Streamlit until the browser session ends.
+    """
+
+    def __init__(self, spill_dir=None, session_budget=64 * MB, total_budget=512 * MB, idle_timeout=3600):
+        base_dir = spill_dir or tempfile.gettempdir()
+        os.makedirs(base_dir, exist_ok=True)
+        remove_stale_spill_dirs(base_dir, idle_timeout)
+        self.spill_dir = tempfile.mkdtemp(prefix=SPILL_DIR_PREFIX, dir=base_dir)
+        atexit.register(shutil.rmtree, self.spill_dir, True)
+        self.session_budget = session_budget
+        self.total_budget = total_budget
+        self.idle_timeout = idle_timeout
+        self.idle_spill_after = min(IDLE_SPILL_AFTER, idle_timeout / 2)
+        self.memory_bytes = 0
+        self.spilled_bytes = 0
+        self.spill_count = 0
+        self._artifacts = OrderedDict()  # (session_id, key) -> artifact, least recently used first
+        self._sessions = {}
+        self._last_sweep = time.monotonic()
+        self._lock = threading.Lock()
+
+    def put(self, session_id, value):
+        """
+        Hold an artifact for a session (spilling others if a budget is exceeded).
+
+        Returns:
+            str: Key to get() the artifact with
+        """
+        key = uuid.uuid4().hex[:12]
+        size = estimate_size(value)
+        with self._lock:
+            session = self._session(session_id)
+            self._artifacts[(session_id, key)] = {"value": value, "size": size, "path": None, "spilled_size": 0}
+            session["memory_bytes"] += size
+            self.memory_bytes += size
+            self._enforce(protect=(session_id, key))
+        return key
+
+    def add_file(self, session_id, path):
+        """
+        Hand a session's temporary file (e.g. an export) to the manager, so it is
+        deleted by discard() or when the session expires.
+
+        Returns:
+            str: Key to discard() the file with
+        """
+        key = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._session(session_id)
+            self._artifacts[(session_id, key)] = {"value": None, "size": 0, "path": path, "spilled_size": 0, "format": "file"}
+        return key
+
+    def get(self, session_id, key):
+        """
+        Get an artifact, loading it back from disk if it was spilled.
+
+        Returns:
+            The artifact, or None if it expired or couldn't be loaded
+        """
+        with self._lock:
+            artifact = self._artifacts.get((session_id, key))
+            if artifact is None or artifact.get("format") == "file":
+                return None
+            self._artifacts.move_to_end((session_id, key))
+            self._session(session_id)
+            if artifact["value"] is None:
+                if not self._load((session_id, key), artifact):
+                    return None
+                self._enforce(protect=(session_id, key))
+            return artifact["value"]
+
+    def discard(self, session_id, key):
+        """Forget an artifact (and delete its file)"""
+        with self._lock:
+            artifact = self._artifacts.pop((session_id, key), None)
+            if artifact is not None:
+                self._release(session_id, artifact)
+
+    def touch(self, session_id, state_bytes=None):
+        """
+        Record that a session is active.
+
+        Args:
+            session_id (str): Session
+            state_bytes (int): Measured size of its st.session_state (optional)
+        """
+        with self._lock:
+            session = self._session(session_id)
+            if state_bytes is not None:
+                session["state_bytes"] = state_bytes
+
+    def sweep(self, force=False):
+        """Spill the artifacts of idle sessions and expire sessions idle for idle_timeout (throttled)"""
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_sweep < SWEEP_INTERVAL:
+                return
+            self._last_sweep = now
+            for session_id, session in list(self._sessions.items()):
+                idle = now - session["last_seen"]
+                if idle > self.idle_timeout:
+                    self._expire(session_id)
+                elif idle > self.idle_spill_after and session["memory_bytes"]:
+                    for artifact_key, artifact in list(self._artifacts.items()):
+                        if artifact_key[0] == session_id and artifact["value"] is not None:
+                            self._spill(artifact_key, artifact)
+
+    def expire(self, session_id):
+        """Forget a session and its artifacts"""
+        with self._lock:
+            self._expire(session_id)
+
+    def stats(self):
+        """
+        Snapshot for the diagnostics panel.
+
+        Returns:
+            dict: Totals, budgets and "sessions" (dicts with "session", "idle_seconds",
+                  "state_bytes", "memory_bytes", "spilled_bytes" and "artifacts"), largest first
+        """
+        now = time.monotonic()
+        with self._lock:
+            artifact_counts = {}
+            for session_id, _ in self._artifacts:
+                artifact_counts[session_id] = artifact_counts.get(session_id, 0) + 1
+            sessions = [
+                {
+                    "session": session_id,
+                    "idle_seconds": round(now - session["last_seen"]),
+                    "state_bytes": session["state_bytes"],
+                    "memory_bytes": session["memory_bytes"],
+                    "spilled_bytes": session["spilled_bytes"],
+                    "artifacts": artifact_counts.get(session_id, 0),
+                }
+                for session_id, session in self._sessions.items()
+            ]
+            sessions.sort(key=lambda entry: entry["state_bytes"] + entry["memory_bytes"], reverse=True)
+            return {
+                "sessions": sessions,
+                "memory_bytes": self.memory_bytes,
+                "spilled_bytes": self.spilled_bytes,
+                "spill_count": self.spill_count,
+                "session_budget": self.session_budget,
+                "total_budget": self.total_budget,
+                "idle_timeout": self.idle_timeout,
+                "idle_spill_after": self.idle_spill_after,
+                "spill_dir": self.spill_dir,
+            }
+
+    def _session(self, session_id):
+        """Accounting entry of a session (created on first use; marks it active)"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = {"state_bytes": 0, "memory_bytes": 0, "spilled_bytes": 0}
+            self._sessions[session_id] = session
+        session["last_seen"] = time.monotonic()
+        return session
+
+    def _enforce(self, protect=None):
+        """Spill least recently used artifacts until every session and the total are within budget"""
+        for artifact_key, artifact in list(self._artifacts.items()):
+            if self.memory_bytes <= self.total_budget and all(
+                session["memory_bytes"] <= self.session_budget for session in self._sessions.values()
+            ):
+                return
+            if artifact["value"] is None or artifact_key == protect:
+                continue
+            session = self._sessions[artifact_key[0]]
+            if session["memory_bytes"] > self.session_budget or self.memory_bytes > self.total_budget:
+                self._spill(artifact_key, artifact)
+
+    def _spill(self, artifact_key, artifact):
+        """Write an artifact to a compressed file and drop it from memory (dropped entirely if it can't be written)"""
+        session_id, key = artifact_key
+        value = artifact["value"]
+        module = type(value).__module__
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            if module.startswith("pandas") or module.startswith("pyarrow"):
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+
+                table = value if module.startswith("pyarrow") else pa.Table.from_pandas(value)
+                path = os.path.join(self.spill_dir, f"{session_id}-{key}.parquet")
+                pq.write_table(table, path, compression="zstd")
+                artifact["format"] = "pandas" if module.startswith("pandas") else "arrow"
+            else:
+                path = os.path.join(self.spill_dir, f"{session_id}-{key}.pkl.gz")
+                with gzip.open(path, "wb") as spill_file:
+                    pickle.dump(value, spill_file, protocol=pickle.HIGHEST_PROTOCOL)
+                artifact["format"] = "pickle"
+            spilled_size = os.path.getsize(path)
+        except Exception:
+            # Not serializable or disk full: evict instead (the caller falls back to a new query)
+            self._artifacts.pop(artifact_key, None)
+            self._release(session_id, artifact)
+            return
+
+        session = self._sessions[session_id]
+        session["memory_bytes"] -= artifact["size"]
+        self.memory_bytes -= artifact["size"]
+        session["spilled_bytes"] += spilled_size
+        self.spilled_bytes += spilled_size
+        self.spill_count += 1
+        artifact.update(value=None, path=path, spilled_size=spilled_size)
+
+    def _load(self, artifact_key, artifact):
+        """Read a spilled artifact back into memory; False (and the artifact forgotten) if that fails"""
+        session_id, _ = artifact_key
+        try:
+            if artifact["format"] == "pickle":
+                with gzip.open(artifact["path"], "rb") as spill_file:
+                    value = pickle.load(spill_file)
+            else:
+                import pyarrow.parquet as pq
+
+                value = pq.read_table(artifact["path"])
+                if artifact["format"] == "pandas":
+                    value = value.to_pandas()
+        except Exception:
+            self._artifacts.pop(artifact_key, None)
+            self._release(session_id, artifact)
+            return False
+
+        session = self._sessions[session_id]
+        self._remove_file(artifact)
+        session["spilled_bytes"] -= artifact["spilled_size"]
+        self.spilled_bytes -= artifact["spilled_size"]
+        session["memory_bytes"] += artifact["size"]
+        self.memory_bytes += artifact["size"]
+        artifact.update(value=value, path=None, spilled_size=0)
+        return True
+
+    def _release(self, session_id, artifact):
+        """Remove a forgotten artifact from the accounting and delete its file"""
+        session = self._sessions.get(session_id)
+        if artifact["value"] is not None:
+            self.memory_bytes -= artifact["size"]
+            if session:
+                session["memory_bytes"] -= artifact["size"]
+        else:
+            self.spilled_bytes -= artifact["spilled_size"]
+            if session:
+                session["spilled_bytes"] -= artifact["spilled_size"]
+        self._remove_file(artifact)
+        artifact["value"] = None
+
+    def _expire(self, session_id):
+        for artifact_key in [artifact_key for artifact_key in self._artifacts if artifact_key[0] == session_id]:
+            self._release(session_id, self._artifacts.pop(artifact_key))
+        self._sessions.pop(session_id, None)
+
+    @staticmethod
+    def _remove_file(artifact):
+        if artifact["path"]:
+            try:
+                os.remove(artifact["path"])
+            except OSError:
+                pass
+            artifact["path"] = None
+
+
+def get_session_memory():
+    """Get the process-wide session memory manager (budgets from config)"""
+    global _memory
+    with _memory_lock:
+        if _memory is None:
+            _memory = SessionMemory(
+                config.SESSION_SPILL_DIR or None,
+                int(config.SESSION_MEMORY_BUDGET_MB * MB),
+                int(config.SESSION_MEMORY_TOTAL_MB * MB),
+                config.SESSION_IDLE_TIMEOUT_MINUTES * 60,
+            )
+        return _memory
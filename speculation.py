@@ -0,0 +1,133 @@
+import re
+import time
+
+from followups import parse_refinement
+from local_summary import friendly_name, is_id_column
+
+# Suggestion chips shown after an answer
+MAX_SUGGESTIONS = 3
+# Suggestions whose SQL is generated and executed before they are clicked
+MAX_SPECULATIVE_QUERIES = 2
+# Speculative AI calls allowed per session per hour (SQL generation and summaries)
+SPECULATION_HOURLY_BUDGET = 20
+# Speculative queries still running after this long are cancelled
+SPECULATION_TIMEOUT = 15  # seconds
+# Speculative jobs queued or running across all sessions before new ones are skipped
+SPECULATION_QUEUE_LIMIT = 4
+# Past questions scanned for follow-up patterns
+HISTORY_SAMPLE_SIZE = 2000
+# Word overlap (Jaccard) for a past question to count as the same kind of question
+MIN_SIMILARITY = 0.5
+
+
+def question_template(question):
+    """
+    Reduce a question to its shape, so questions differing only in literals match.
+    Example: "Show grade 10 students with score over 90?" -> "show grade # students with score over #"
+
+    Args:
+        question (str): User question
+
+    Returns:
+        str: Template text
+    """
+    text = question.lower()
+    text = re.sub(r'"[^"]*"|\'[^\']*\'', '"…"', text)
+    text = re.sub(r'\b\d+(?:[.,]\d+)*\b', '#', text)
+    text = re.sub(r'[^\w#"…\s]', ' ', text)
+    return " ".join(text.split())
+
+
+def similarity(first, second):
+    """Word overlap (Jaccard) between two question templates"""
+    first_words, second_words = set(first.split()), set(second.split())
+    if not first_words or not second_words:
+        return 0.0
+    return len(first_words & second_words) / len(first_words | second_words)
+
+
+def predict_from_history(user_prompt, question_pairs, limit=MAX_SUGGESTIONS):
+    """
+    Predict follow-up questions from what was asked after similar questions before.
+    Follow-ups are grouped by template and weighted by how similar the earlier
+    question was; the most recent wording of each template is suggested.
+
+    Args:
+        user_prompt (str): Question just answered
+        question_pairs (list): (question, next question) tuples, newest first
+        limit (int): Most predictions
+
+    Returns:
+        list: Predicted questions, most likely first
+    """
+    current = question_template(user_prompt)
+    scores = {}
+    examples = {}
+    for previous, following in question_pairs:
+        score = similarity(current, question_template(previous))
+        if score < MIN_SIMILARITY:
+            continue
+        template = question_template(following)
+        if not template or similarity(current, template) == 1.0:
+            continue
+        scores[template] = scores.get(template, 0.0) + score
+        examples.setdefault(template, following.strip())
+    ranked = sorted(scores, key=lambda template: scores[template], reverse=True)
+    return [examples[template] for template in ranked[:limit]]
+
+
+def refinement_suggestions(frame, limit=MAX_SUGGESTIONS):
+    """
+    Suggest refinements of a result that followups.py answers without a query
+    (top N, sort, group by), phrased with the result's own columns.
+
+    Args:
+        frame (pd.DataFrame): Complete result
+        limit (int): Most suggestions
+
+    Returns:
+        list: Suggested questions
+    """
+    import pandas as pd
+
+    numeric = [
+        name for name in frame.columns
+        if not is_id_column(name) and pd.api.types.is_numeric_dtype(frame[name])
+        and not pd.api.types.is_bool_dtype(frame[name])
+    ]
+    labels = [
+        name for name in frame.columns
+        if not is_id_column(name) and pd.api.types.is_string_dtype(frame[name])
+    ]
+    candidates = []
+    if numeric and len(frame) > 5:
+        candidates.append(f"Top 5 by {friendly_name(numeric[-1])}")
+    if labels and numeric and 1 < frame[labels[0]].nunique() < len(frame):
+        candidates.append(f"Group them by {friendly_name(labels[0])}")
+    if numeric and len(frame) > 1:
+        candidates.append(f"Sort those by {friendly_name(numeric[-1])} descending")
+    return [question for question in candidates if parse_refinement(question, frame)][:limit]
+
+
+class SpeculationBudget:
+    """
+    Per-session cost budget for speculative AI calls: at most hourly_limit
+    calls in any sliding hour.
+    """
+
+    def __init__(self, hourly_limit=SPECULATION_HOURLY_BUDGET):
+        self.hourly_limit = hourly_limit
+        self._calls = []
+
+    def remaining(self):
+        """Calls still allowed in the current hour"""
+        cutoff = time.monotonic() - 3600
+        self._calls = [called_at for called_at in self._calls if called_at > cutoff]
+        return self.hourly_limit - len(self._calls)
+
+    def try_spend(self, calls=1):
+        """Reserve calls; False (and nothing reserved) if the budget doesn't allow them"""
+        if self.remaining() < calls:
+            return False
+        self._calls.extend([time.monotonic()] * calls)
+        return True
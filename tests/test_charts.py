@@ -0,0 +1,73 @@
+import datetime
+import math
+
+import pyarrow as pa
+import pytest
+
+from charts import MAX_BAR_CATEGORIES, choose_date_bucket, infer_chart, lttb_indices, prepare_chart_table
+
+DAY = 86400
+
+
+@pytest.mark.parametrize("span_seconds, is_timestamp, expected", [
+    (2 * DAY, True, "hour"),
+    (2 * DAY, False, "day"),
+    (3 * 365 * DAY, True, "day"),
+    (20 * 365 * DAY, True, "week"),
+    (100 * 365 * DAY, True, "month"),
+    (10000 * 365 * DAY, True, "year"),
+])
+def test_choose_date_bucket(span_seconds, is_timestamp, expected):
+    assert choose_date_bucket(span_seconds, is_timestamp)[0] == expected
+
+
+def test_lttb_keeps_the_ends_and_the_peak():
+    xs = list(range(1000))
+    ys = [math.sin(x / 50) for x in xs]
+    ys[503] = 25.0
+    indices = lttb_indices(xs, ys, 100)
+    assert len(indices) == 100
+    assert indices[0] == 0 and indices[-1] == 999
+    assert indices == sorted(set(indices))
+    assert 503 in indices
+
+
+def test_lttb_returns_everything_below_the_threshold():
+    assert lttb_indices([1, 2, 3], [1, 2, 3], 10) == [0, 1, 2]
+    assert lttb_indices(list(range(10)), list(range(10)), 2) == list(range(10))
+
+
+def test_infer_chart():
+    schema = pa.schema([("StudentID", pa.int64()), ("ExamDate", pa.date32()), ("Score", pa.float64())])
+    assert infer_chart(schema) == {"type": "line", "x": "ExamDate", "x_kind": "temporal", "y": ["Score"]}
+    schema = pa.schema([("ClassName", pa.string()), ("AvgScore", pa.decimal128(5, 2))])
+    assert infer_chart(schema)["type"] == "bar"
+    assert infer_chart(pa.schema([("Name", pa.string())])) is None
+
+
+def test_long_series_are_downsampled_in_order():
+    start = datetime.date(2020, 1, 1)
+    count = 5000
+    table = pa.table({
+        "ExamDate": [start + datetime.timedelta(days=count - 1 - i) for i in range(count)],
+        "Score": [float(i % 13) for i in range(count)],
+    })
+    spec = infer_chart(table.schema)
+    chart, original_rows = prepare_chart_table(table, spec, max_points=500)
+    assert original_rows == count
+    assert chart.num_rows == 500
+    dates = chart.column("ExamDate").to_pylist()
+    assert dates == sorted(dates)
+    assert dates[0] == start and dates[-1] == start + datetime.timedelta(days=count - 1)
+
+
+def test_bars_are_averaged_per_category_and_capped():
+    table = pa.table({
+        "ClassName": [f"Class {i % 80}" for i in range(160)],
+        "Score": [float(i) for i in range(160)],
+    })
+    chart, original_rows = prepare_chart_table(table, infer_chart(table.schema))
+    assert original_rows == 160
+    assert chart.num_rows == MAX_BAR_CATEGORIES
+    assert chart.column("ClassName")[0].as_py() == "Class 79"
+    assert chart.column("Score")[0].as_py() == (79 + 159) / 2
@@ -0,0 +1,57 @@
+import pandas as pd
+import pytest
+
+from followups import apply_refinement, parse_refinement
+
+
+@pytest.fixture
+def scores():
+    return pd.DataFrame({
+        "StudentName": ["Ann", "Ben", "Cid", "Dee"],
+        "ClassName": ["Math", "Math", "Science", "Science"],
+        "GradeLevel": [10, 11, 10, 11],
+        "Score": [91.5, 78.0, 88.25, 95.0],
+    })
+
+
+@pytest.mark.parametrize("question", [
+    "Top 3 teachers with most books checked out",
+    "first 10 books in the library",
+    "top 5 by books checked out",
+    "bottom 3 classes by enrollment",
+    "sort those by attendance rate",
+    "group them by department",
+])
+def test_new_questions_are_not_refinements(scores, question):
+    assert parse_refinement(question, scores) is None
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("top 2", [{"op": "top", "n": 2, "column": None, "largest": True, "keep_order": False}]),
+    ("top 2 by score", [{"op": "top", "n": 2, "column": "Score", "largest": True, "keep_order": False}]),
+    ("first 3 of those", [{"op": "top", "n": 3, "column": None, "largest": True, "keep_order": True}]),
+    ("bottom 2 students by score", [{"op": "top", "n": 2, "column": "Score", "largest": False, "keep_order": False}]),
+    ("first 2 in the list", [{"op": "top", "n": 2, "column": None, "largest": True, "keep_order": True}]),
+])
+def test_top_n_refinements(scores, question, expected):
+    assert parse_refinement(question, scores) == expected
+
+
+def test_top_n_with_another_step(scores):
+    steps = parse_refinement("only grade 10 and top 1 by score", scores)
+    frame, _ = apply_refinement(scores, steps)
+    assert frame["StudentName"].tolist() == ["Ann"]
+
+
+@pytest.mark.parametrize("question, operator, value", [
+    ("only where score is over 90", ">", "90"),
+    ("only the ones where score is at least 80", ">=", "80"),
+    ("only where score is at most 80", "<=", "80"),
+    ("only those where score is greater than 90", ">", "90"),
+    ("only where score is not 78", "!=", "78"),
+    ("only where score is 95", "==", "95"),
+])
+def test_is_before_a_comparison(scores, question, operator, value):
+    assert parse_refinement(question, scores) == [
+        {"op": "filter", "column": "Score", "operator": operator, "value": value}
+    ]
@@ -0,0 +1,122 @@
+import pytest
+
+from pagination import (
+    build_filter, build_page_query, find_ordered_key, find_top_level_order_by, find_unsortable_columns,
+    orders_by_key, prepare_inner_query, translate_order_by
+)
+
+SCHEMA = """DATABASE SCHEMA:
+
+Table: dbo.Students
+- StudentID (INT, PRIMARY KEY)
+- LastName (NVARCHAR(50))
+- Notes (NTEXT)
+
+Table: dbo.Enrollments
+- StudentID (INT, PRIMARY KEY)
+- ClassID (INT, PRIMARY KEY)
+- Transcript (XML)
+"""
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("SELECT * FROM dbo.Students", -1),
+    ("SELECT * FROM dbo.Students ORDER BY LastName", 27),
+    ("SELECT * FROM (SELECT TOP 5 * FROM dbo.Students ORDER BY LastName) s", -1),
+    ("SELECT ROW_NUMBER() OVER (ORDER BY LastName) AS n FROM dbo.Students", -1),
+    ("SELECT 'ORDER BY x' AS label FROM dbo.Students", -1),
+    ("SELECT BORDER BY FROM dbo.Students", -1),
+])
+def test_top_level_order_by(query, expected):
+    assert find_top_level_order_by(query) == expected
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("SELECT * FROM dbo.Students;", ("SELECT * FROM dbo.Students", None)),
+    ("SELECT * FROM dbo.Students ORDER BY LastName DESC",
+     ("SELECT * FROM dbo.Students ORDER BY LastName DESC OFFSET 0 ROWS", "LastName DESC")),
+    ("SELECT TOP 10 * FROM dbo.Students ORDER BY LastName",
+     ("SELECT TOP 10 * FROM dbo.Students ORDER BY LastName", "LastName")),
+    ("WITH s AS (SELECT * FROM dbo.Students) SELECT * FROM s", (None, None)),
+])
+def test_prepare_inner_query(query, expected):
+    assert prepare_inner_query(query) == expected
+
+
+@pytest.mark.parametrize("clause, expected", [
+    ("s.LastName DESC, StudentID", "[LastName] DESC, [StudentID] ASC"),
+    ("[LastName] ASC OFFSET 0 ROWS", "[LastName] ASC"),
+    ("LEN(LastName)", None),
+    (None, None),
+])
+def test_translate_order_by(clause, expected):
+    assert translate_order_by(clause, ["StudentID", "LastName"]) == expected
+
+
+def test_ordered_key_needs_a_single_table_and_its_key():
+    columns = ["StudentID", "LastName"]
+    assert find_ordered_key("SELECT StudentID, LastName FROM dbo.Students", columns, SCHEMA) == "StudentID"
+    assert find_ordered_key("SELECT LastName FROM dbo.Students", ["LastName"], SCHEMA) is None
+    assert find_ordered_key(
+        "SELECT s.StudentID, LastName FROM dbo.Students s JOIN dbo.Enrollments e ON e.StudentID = s.StudentID",
+        columns, SCHEMA
+    ) is None
+    # A composite key doesn't identify a row on its own
+    assert find_ordered_key("SELECT StudentID, ClassID FROM dbo.Enrollments", ["StudentID", "ClassID"], SCHEMA) is None
+
+
+def test_unsortable_columns():
+    query = "SELECT s.StudentID, s.Notes, e.Transcript FROM dbo.Students s JOIN dbo.Enrollments e ON 1 = 1"
+    assert find_unsortable_columns(query, ["StudentID", "Notes", "Transcript"], SCHEMA) == ["Notes", "Transcript"]
+
+
+def test_orders_by_key():
+    assert orders_by_key("[StudentID] DESC", "StudentID")
+    assert not orders_by_key("[LastName] ASC", "StudentID")
+    assert not orders_by_key(None, "StudentID")
+
+
+def test_filter_escapes_like_wildcards():
+    assert build_filter("Name", "50%_[a]") == ("CAST([Name] AS NVARCHAR(MAX)) LIKE ?", ["%50[%][_][[]a]%"])
+    assert build_filter("Name", "") == (None, [])
+
+
+def test_offset_page_query_breaks_ties_on_every_column():
+    sql, params = build_page_query(
+        "SELECT * FROM dbo.Students", ["StudentID", "LastName"], 2, page_size=50,
+        sort_column="LastName", descending=True
+    )
+    assert sql == (
+        "SELECT * FROM (SELECT * FROM dbo.Students) AS q ORDER BY [LastName] DESC, [StudentID] ASC "
+        "OFFSET 100 ROWS FETCH NEXT 50 ROWS ONLY"
+    )
+    assert params == []
+
+
+def test_keyset_page_query():
+    sql, params = build_page_query(
+        "SELECT * FROM dbo.Students", ["StudentID", "LastName"], 3, page_size=50,
+        filter_column="LastName", filter_text="Sm", key_column="StudentID", keyset_after=150
+    )
+    assert sql == (
+        "SELECT * FROM (SELECT * FROM dbo.Students) AS q "
+        "WHERE CAST([LastName] AS NVARCHAR(MAX)) LIKE ? AND [StudentID] > ? "
+        "ORDER BY [StudentID] ASC OFFSET 0 ROWS FETCH NEXT 50 ROWS ONLY"
+    )
+    assert params == ["%Sm%", 150]
+
+
+def test_keyset_is_not_used_for_another_order():
+    sql, params = build_page_query(
+        "SELECT * FROM dbo.Students", ["StudentID", "LastName"], 1, page_size=50,
+        sort_column="LastName", key_column="StudentID", keyset_after=50
+    )
+    assert "OFFSET 50 ROWS" in sql and "[StudentID] > ?" not in sql
+    assert sql.endswith("ORDER BY [LastName] ASC, [StudentID] ASC OFFSET 50 ROWS FETCH NEXT 50 ROWS ONLY")
+
+
+def test_unsortable_columns_are_left_out_of_the_order():
+    sql, _ = build_page_query(
+        "SELECT Notes, LastName FROM dbo.Students", ["Notes", "LastName"], 0, tiebreak_columns=["LastName"]
+    )
+    assert "[Notes]" not in sql
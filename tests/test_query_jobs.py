@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+
+import query_jobs
+from query_jobs import JobManager
+from speculation import SpeculationBudget
+
+
+def wait_until_finished(job, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not job.is_finished:
+        assert time.monotonic() < deadline, "job did not finish"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def manager():
+    return JobManager(workers=2, background_workers=1)
+
+
+def test_running_job_is_shared(manager):
+    release = threading.Event()
+    calls = []
+
+    def run(job):
+        calls.append(job.id)
+        release.wait(5)
+        return "rows"
+
+    first = manager.submit(("db", "SELECT 1"), run, waiter="a")
+    second = manager.submit(("db", "SELECT 1"), run, waiter="b")
+    assert second is first
+    release.set()
+    wait_until_finished(first)
+    assert first.status == "done" and first.result == "rows"
+    assert len(calls) == 1
+
+
+def test_cancel_waits_for_the_last_waiter(manager):
+    release = threading.Event()
+    job = manager.submit(("db", "SELECT 1"), lambda job: release.wait(5), waiter="a")
+    manager.submit(("db", "SELECT 1"), lambda job: None, waiter="b")
+    assert not job.leave("a")
+    assert not job.cancel_requested
+    assert job.leave("b")
+    release.set()
+    wait_until_finished(job)
+    assert job.status == "cancelled"
+
+
+def test_finished_jobs_are_reused_only_within_the_ttl(manager, monkeypatch):
+    first = manager.submit(("db", "SELECT 1"), lambda job: 1)
+    wait_until_finished(first)
+    assert manager.submit(("db", "SELECT 1"), lambda job: 2) is first
+    assert manager.submit(("db", "SELECT 1"), lambda job: 2, reuse_finished=False) is not first
+
+    second = manager.submit(("db", "SELECT 2"), lambda job: 1)
+    wait_until_finished(second)
+    monkeypatch.setattr(query_jobs, "JOB_REUSE_TTL", 0)
+    second.finished_at -= 1
+    third = manager.submit(("db", "SELECT 2"), lambda job: 2)
+    assert third is not second
+    wait_until_finished(third)
+    assert third.result == 2
+
+
+def test_failed_jobs_are_not_reused(manager):
+    def fail(job):
+        raise RuntimeError("Invalid object name 'Studnets'")
+
+    failed = manager.submit(("db", "SELECT 1"), fail)
+    wait_until_finished(failed)
+    assert failed.status == "failed"
+    assert failed.error == "Invalid object name 'Studnets'"
+    assert manager.submit(("db", "SELECT 1"), lambda job: 1) is not failed
+
+
+def test_expired_jobs_are_forgotten(manager, monkeypatch):
+    job = manager.submit(("db", "SELECT 1"), lambda job: 1)
+    wait_until_finished(job)
+    monkeypatch.setattr(query_jobs, "JOB_RESULT_TTL", 0)
+    job.finished_at -= 1
+    manager.submit(("db", "SELECT 2"), lambda job: 2)
+    assert manager.get(job.id) is None
+
+
+def test_foreground_submit_takes_over_a_background_job(manager):
+    release = threading.Event()
+    # Keep the only background worker busy so the speculative job stays queued
+    manager.submit(("db", "busy"), lambda job: release.wait(5), background=True)
+    speculative = manager.submit(("db", "SELECT 1"), lambda job: "rows", background=True)
+    assert manager.count_background() == 2
+    assert manager.submit(("db", "SELECT 1"), lambda job: "other", waiter="a") is speculative
+    assert not speculative.background
+    wait_until_finished(speculative)
+    assert speculative.result == "rows"
+    release.set()
+
+
+def test_speculation_budget():
+    budget = SpeculationBudget(hourly_limit=3)
+    assert budget.try_spend(2)
+    assert not budget.try_spend(2)
+    assert budget.remaining() == 1
+    budget._calls = [time.monotonic() - 3601] * 2
+    assert budget.remaining() == 3
@@ -0,0 +1,61 @@
+import json
+
+from result_encoder import (
+    JSON_PROMPT_ROWS, encode_results_for_prompt, encode_table, estimate_tokens, format_value, sample_row_indices
+)
+
+
+def make_rows(count):
+    return [{"StudentName": f"Student {i}", "Score": float(i % 97), "Grade": 9 + i % 4} for i in range(count)]
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("abcde") == 2
+
+
+def test_values_are_formatted_compactly():
+    assert format_value(None) == ""
+    assert format_value(4067.798800000001) == "4067.7988"
+    assert encode_table(["a", "b"], [{"a": 1, "b": "x, y"}]) == 'a,b\n1,"x, y"\n'
+
+
+def test_small_results_are_sent_as_a_table():
+    rows = make_rows(5)
+    encoded, report = encode_results_for_prompt(rows, token_budget=1500)
+    assert encoded.startswith("5 rows, CSV:\nStudentName,Score,Grade\n")
+    assert report["format"] == "table"
+    assert report["rows_included"] == 5
+    assert report["tokens"] == estimate_tokens(encoded)
+
+
+def test_large_results_stay_within_the_budget():
+    rows = make_rows(2000)
+    encoded, report = encode_results_for_prompt(rows, token_budget=800, total_rows=5000)
+    assert report["format"] == "stats+sample"
+    assert report["rows_total"] == 5000
+    assert report["tokens"] <= 800
+    assert 0 < report["rows_included"] < len(rows)
+    assert "- Score: count=2000, distinct=97, min=0, max=96" in encoded
+
+
+def test_savings_are_measured_against_the_former_json_prompt():
+    rows = make_rows(1000)
+    _, report = encode_results_for_prompt(rows, token_budget=800)
+    expected = estimate_tokens(json.dumps(rows[:JSON_PROMPT_ROWS], indent=2, default=str))
+    assert report["json_tokens"] == expected
+    assert report["tokens_saved"] == max(0, expected - report["tokens"])
+
+
+def test_sample_keeps_head_and_extremes():
+    rows = [{"value": value} for value in [5, 6, 7, 1, 8, 100, 9, 10, 11, 12]]
+    indices = sample_row_indices(["value"], rows, 6)
+    assert len(indices) == 6
+    assert {0, 1, 2, 3, 5} <= set(indices)
+
+
+def test_empty_and_truncated_results():
+    assert encode_results_for_prompt([], 100)[0] == "No rows returned."
+    encoded, _ = encode_results_for_prompt(make_rows(3), 1500, truncated=True)
+    assert encoded.startswith("more than 3 rows (first 3 retrieved, total not counted)")
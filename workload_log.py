@@ -0,0 +1,226 @@
+import atexit
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+
+import config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS query_log (
+    log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recorded_at REAL NOT NULL,
+    database_name TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    query TEXT NOT NULL,
+    duration_ms REAL NOT NULL,
+    row_count INTEGER,
+    tables TEXT NOT NULL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_query_log_fingerprint ON query_log (database_name, fingerprint);
+CREATE INDEX IF NOT EXISTS ix_query_log_recorded ON query_log (recorded_at);
+"""
+
+# Runs are written in batches by a background thread, at least this often
+FLUSH_INTERVAL = 2.0  # seconds
+# ... or as soon as this many are waiting
+FLUSH_BATCH_SIZE = 500
+# Runs older than config.WORKLOAD_LOG_RETENTION_DAYS are deleted at most this often
+RETENTION_SWEEP_INTERVAL = 3600  # seconds
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def normalize_query(query):
+    """
+    Normalize a query so runs that differ only in literals, parameters or formatting match.
+    Statement text from the DMVs normalizes like the logged query it came from:
+    the parameter declarations of prepared statements ("(@P1 int)SELECT ...")
+    are dropped and parameters (@P1, @name) become "?" like literals.
+    Example: "SELECT * FROM Scores WHERE Quarter = 2" -> "select * from scores where quarter = ?"
+
+    Args:
+        query (str): SQL query
+
+    Returns:
+        str: Normalized query text
+    """
+    text = re.sub(r'--[^\n]*|/\*.*?\*/', ' ', query, flags=re.DOTALL)
+    text = re.sub(r'^\s*\(\s*@\w+\s.*?\)\s*(?=(?:select|with)\b)', '', text, flags=re.DOTALL | re.IGNORECASE)
+    text = re.sub(r"N?'(?:[^']|'')*'", '?', text)
+    text = re.sub(r'(?<![@\w])@\w+', '?', text)  # @P1, @name (not @@ROWCOUNT)
+    text = re.sub(r'\b\d+(\.\d+)?\b', '?', text)
+    text = re.sub(r'\(\s*\?(\s*,\s*\?)*\s*\)', '(?)', text)  # IN (1, 2, 3) -> IN (?)
+    text = re.sub(r'\s+', ' ', text).strip().rstrip(';').strip()
+    return text.lower()
+
+
+def query_fingerprint(query):
+    """Short stable hash of the normalized query"""
+    return hashlib.sha1(normalize_query(query).encode('utf-8')).hexdigest()[:16]
+
+
+def find_tables(query):
+    """
+    Find the tables a query reads (FROM and JOIN targets).
+
+    Returns:
+        list: Table names as written, without brackets (e.g., "dbo.Attendance")
+    """
+    names = re.findall(r'\b(?:FROM|JOIN)\s+((?:\[?\w+\]?\.)?\[?\w+\]?)', query, re.IGNORECASE)
+    tables = []
+    for name in names:
+        name = name.replace('[', '').replace(']', '')
+        if name.lower() not in [table.lower() for table in tables]:
+            tables.append(name)
+    return tables
+
+
+class WorkloadLog:
+    """
+    Log of executed queries in a local SQLite file.
+    Each run records the query's fingerprint, duration, rows returned and
+    tables touched, so the analyzer can find hot and slow queries.
+    record() only queues the run; a background thread writes queued runs in
+    one transaction every FLUSH_INTERVAL (or FLUSH_BATCH_SIZE runs) and deletes
+    runs older than retention_days.
+    """
+
+    def __init__(self, path, retention_days=None):
+        self.path = path
+        self.retention_days = config.WORKLOAD_LOG_RETENTION_DAYS if retention_days is None else retention_days
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._swept_at = None  # The first flush sweeps
+        threading.Thread(target=self._flush_loop, name="workload-log", daemon=True).start()
+        atexit.register(self.flush)
+
+    def record(self, database_name, query, duration_ms, row_count=None, error=None):
+        """
+        Queue one query execution (cheap: written by the background thread).
+
+        Args:
+            database_name (str): Database target name
+            query (str): Executed SQL
+            duration_ms (float): Execution and fetch time in milliseconds
+            row_count (int): Rows returned (None if the query failed)
+            error (str): Error message (optional)
+        """
+        with self._pending_lock:
+            self._pending.append((time.time(), database_name, query, duration_ms, row_count, error))
+            if len(self._pending) >= FLUSH_BATCH_SIZE:
+                self._flush_requested.set()
+
+    def flush(self):
+        """Write the queued runs now (and delete expired ones if a sweep is due)"""
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        with self._lock:
+            if pending:
+                self._conn.executemany(
+                    """
+                    INSERT INTO query_log
+                        (recorded_at, database_name, fingerprint, query, duration_ms, row_count, tables, error)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    [
+                        (recorded_at, database_name, query_fingerprint(query), query, duration_ms, row_count,
+                         ",".join(find_tables(query)), error)
+                        for recorded_at, database_name, query, duration_ms, row_count, error in pending
+                    ]
+                )
+                self._conn.commit()
+            if self._swept_at is None or time.monotonic() - self._swept_at > RETENTION_SWEEP_INTERVAL:
+                self._sweep()
+
+    def _sweep(self):
+        """Delete runs older than retention_days (caller holds the lock)"""
+        self._swept_at = time.monotonic()
+        if self.retention_days:
+            self._conn.execute(
+                "DELETE FROM query_log WHERE recorded_at < ?", (time.time() - self.retention_days * 86400,)
+            )
+            self._conn.commit()
+
+    def _flush_loop(self):
+        while True:
+            self._flush_requested.wait(FLUSH_INTERVAL)
+            self._flush_requested.clear()
+            try:
+                self.flush()
+            except sqlite3.Error:
+                pass  # Logging problems never fail queries (that batch is dropped)
+
+    def top_queries(self, database_name, order_by="total", limit=20, since=None):
+        """
+        Aggregate the log per fingerprint.
+
+        Args:
+            database_name (str): Database target name
+            order_by (str): "total" (total time), "count" (frequency) or "avg" (average time)
+            limit (int): Number of fingerprints
+            since (float): Only runs after this UNIX time (optional)
+
+        Returns:
+            list: Dicts with fingerprint, query (latest sample), runs, errors, total_ms,
+                  avg_ms, max_ms, avg_rows and tables
+        """
+        order_column = {"total": "total_ms", "count": "runs", "avg": "avg_ms"}[order_by]
+        self.flush()  # Include runs still queued
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT fingerprint,
+                       (SELECT l2.query FROM query_log l2
+                        WHERE l2.database_name = l.database_name AND l2.fingerprint = l.fingerprint
+                        ORDER BY l2.log_id DESC LIMIT 1),
+                       COUNT(*) AS runs,
+                       SUM(CASE WHEN error IS NOT NULL THEN 1 ELSE 0 END),
+                       SUM(duration_ms) AS total_ms,
+                       AVG(duration_ms) AS avg_ms,
+                       MAX(duration_ms),
+                       AVG(row_count),
+                       MAX(tables)
+                FROM query_log l
+                WHERE database_name = ? AND recorded_at >= ?
+                GROUP BY database_name, fingerprint
+                ORDER BY {order_column} DESC
+                LIMIT ?
+                """,
+                (database_name, since or 0, limit)
+            ).fetchall()
+        return [
+            {
+                "fingerprint": row[0],
+                "query": row[1],
+                "runs": row[2],
+                "errors": row[3],
+                "total_ms": round(row[4], 1),
+                "avg_ms": round(row[5], 1),
+                "max_ms": round(row[6], 1),
+                "avg_rows": round(row[7], 1) if row[7] is not None else None,
+                "tables": row[8],
+            }
+            for row in rows
+        ]
+
+
+def get_workload_log():
+    """Get the process-wide workload log (None if the log file can't be opened)"""
+    global _log
+    with _log_lock:
+        if _log is None:
+            try:
+                _log = WorkloadLog(config.WORKLOAD_LOG_PATH)
+            except sqlite3.Error:
+                return None
+        return _log